@@ -0,0 +1,641 @@
+"""Headless HTTP API for document Q&A, code documentation and DOCX/PDF/HTML export.
+
+It uses the same extraction, retrieval, conversation, prompt and export code as streamlit_app.py,
+with async handlers and process-wide registries of Gemini clients, documents and conversations.
+
+    uvicorn api_server:app --workers 4
+
+Endpoints (the Gemini key is sent in the `X-Gemini-Api-Key` header, or set GEMINI_API_KEY; conversations and usage
+are kept per key and `X-Session-Id`, and a request without that header gets a new session id back in it):
+
+    POST /documents?filename=report.pdf      raw file body -> {"document_id", ...}
+    GET  /documents/{document_id}
+    GET  /documents/{document_id}/digest     section summaries and overview (202 while being built)
+    POST /documents/{document_id}/questions  {"question", "stream": false, "fast_path": true} -> answer (or a text stream)
+    POST /code-documentation                 {"code", "format": "json" | "docx" | "pdf" | "html"}
+    POST /exports/{format}                   {"text"} -> .docx, .pdf or .html file
+    GET  /health
+
+Set DOCQA_MOCK_GEMINI=1 to serve answers from the local mock backend (load tests, offline use).
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from context_cache import ContextCacheManager, is_missing_cache_error
+from conversation import Conversation
+from docx_export import DOCX_MIME, StreamingDocxRenderer
+from engine import get_document_index, get_document_text, prepare_question
+from exports import EXPORT_FORMATS, export_answer, remember_export
+from extraction import NamedUpload
+from extractive_qa import EXTRACTIVE_QA_ENABLED, FastPathStats, answer_extractively, format_extractive_answer
+from job_queue import FAILED, JobQueue
+from prompts import PROMPTS, DOCUMENT_QA_SYSTEM_INSTRUCTION, build_code_documentation_prompt, prompt_contents
+from model_selection import MODEL_TIERS, create_model_selector
+from providers import ProviderMetrics, ProviderRouter, create_hedge_policy, create_providers
+from render_tree import remember_render_tree
+from shared_cache import SharedCache
+from summarization import DIGEST_ENABLED, get_digest, ingest_document_digest, is_overview_question
+from usage_tracking import TokenBudgetExceeded, UsageTracker, api_key_fingerprint, estimate_contents_tokens
+
+MAX_DOCUMENTS = int(os.environ.get("DOCQA_API_MAX_DOCUMENTS", "100"))
+MAX_CONVERSATIONS = int(os.environ.get("DOCQA_API_MAX_CONVERSATIONS", "1000"))
+# Document ids are the SHA-256 of the upload (also its blob name)
+_DOCUMENT_ID = re.compile(r"[0-9a-f]{64}")
+MAX_UPLOAD_BYTES = int(os.environ.get("DOCQA_API_MAX_UPLOAD_BYTES", str(300 * 1024 * 1024)))
+
+
+class APIError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+# Function to create a Gemini client (or the local mock when DOCQA_MOCK_GEMINI is set)
+def default_client_factory(api_key):
+    if os.environ.get("DOCQA_MOCK_GEMINI"):
+        from mock_gemini import MockClient
+        return MockClient(api_key=api_key)
+    from google import genai
+    return genai.Client(api_key=api_key)
+
+
+# An uploaded document: its bytes (for re-extraction into a context cache) and its index. The bytes are a
+# blob in the shared store, named by the same SHA-256 as the document id, so a file uploaded many times
+# (in any session or worker) is stored once; the record holds a reference until it is evicted.
+class DocumentRecord:
+    def __init__(self, document_id, name, type, stream, index, blobs=None):
+        self.document_id = document_id
+        self.name = name
+        self.type = type
+        self.stream = stream
+        self.index = index
+        self.blobs = blobs
+        self.created_at = time.time()
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.stream.close()
+        if self.blobs is not None:
+            self.blobs.release(self.document_id)
+
+    def upload(self):
+        return NamedUpload(self.stream, self.name, self.type)
+
+    def extract_text(self, cache=None):
+        with self.lock:
+            return get_document_text(self.upload(), self.document_id, cache)
+
+    def as_dict(self):
+        return {
+            "document_id": self.document_id,
+            "name": self.name,
+            "type": self.type,
+            "chunks": len(self.index),
+            "tokens": self.index.total_tokens,
+        }
+
+
+# Process-wide registry shared by all requests: one Gemini client per API key, uploaded documents (LRU),
+# conversations per (API key, session, document) (LRU), usage tracking and context-cache bookkeeping. Document text,
+# indexes, answers and context-cache handles go through the on-disk cache shared with other workers.
+class EngineRegistry:
+    def __init__(self, client_factory=default_client_factory, max_documents=MAX_DOCUMENTS, cache=None,
+                 max_conversations=MAX_CONVERSATIONS):
+        self.client_factory = client_factory
+        self.max_documents = max_documents
+        self.max_conversations = max_conversations
+        self.clients = {}
+        self.documents = OrderedDict()
+        self.conversations = OrderedDict()
+        self.conversation_locks = {}
+        self.tracker = UsageTracker()
+        self.cache = cache if cache is not None else SharedCache()
+        self.context_cache = ContextCacheManager(store=self.cache)
+        self.provider_metrics = ProviderMetrics()
+        self.fast_path_stats = FastPathStats()
+        self.routers = {}
+        self._jobs = None
+        self._lock = threading.Lock()
+
+    def client(self, api_key):
+        fingerprint = api_key_fingerprint(api_key)
+        with self._lock:
+            if fingerprint not in self.clients:
+                self.clients[fingerprint] = self.client_factory(api_key)
+            return self.clients[fingerprint]
+
+    # Function to get the provider router for an API key (Gemini plus the other DOCQA_PROVIDERS)
+    def router(self, api_key):
+        client = self.client(api_key)
+        fingerprint = api_key_fingerprint(api_key)
+        with self._lock:
+            if fingerprint not in self.routers:
+                self.routers[fingerprint] = ProviderRouter(
+                    create_providers(client, gemini_models=MODEL_TIERS), metrics=self.provider_metrics,
+                    cache=self.cache, hedge=create_hedge_policy(client), selector=create_model_selector(),
+                    prompts=PROMPTS,
+                )
+            return self.routers[fingerprint]
+
+    def jobs(self):
+        with self._lock:
+            if self._jobs is None:
+                self._jobs = JobQueue()
+            return self._jobs
+
+    # Function to build a document's digest in the background right after upload (once per document),
+    # billed to the uploader's key and session (`session_id` as scoped by _session_key)
+    def submit_digest(self, api_key, session_id, record):
+        router = self.router(api_key)
+
+        def generate(prompt):
+            return self.tracker.generate_routed(router, session_id, api_key, prompt_contents(prompt)).text or ""
+
+        return self.jobs().submit(
+            "digest", ingest_document_digest, args=(generate, record.index.chunks, self.cache, record.document_id),
+            key=record.document_id, label=f"Digest: {record.name}",
+            result_available=lambda job: get_digest(self.cache, record.document_id) is not None,
+        )
+
+    # Function to register an uploaded document; returns the record in use (an earlier upload of the same
+    # content is kept, and the new record closed)
+    def add_document(self, record):
+        with self._lock:
+            existing = self.documents.get(record.document_id)
+            if existing is not None:
+                self.documents.move_to_end(record.document_id)
+                record.close()
+                return existing
+            self.documents[record.document_id] = record
+            while len(self.documents) > self.max_documents:
+                _, evicted = self.documents.popitem(last=False)
+                evicted.close()
+                for key in [key for key in self.conversations if key[1] == evicted.document_id]:
+                    self.conversations.pop(key, None)
+                    self.conversation_locks.pop(key, None)
+            return record
+
+    # Function to get an uploaded document. Documents uploaded to another worker (or evicted here) are
+    # rebuilt from the shared cache: the upload's blob and its cached index. Blocking; call off the event loop.
+    def document(self, document_id):
+        with self._lock:
+            record = self.documents.get(document_id)
+            if record is not None:
+                self.documents.move_to_end(document_id)
+                return record
+        record = self._restore_document(document_id)
+        if record is None:
+            raise APIError(404, f"Unknown document: {document_id}")
+        return self.add_document(record)
+
+    def _restore_document(self, document_id):
+        if not _DOCUMENT_ID.fullmatch(document_id):
+            return None
+        meta = self.cache.get_json("document", document_id)
+        # A reference taken on a stored blob keeps it from being collected while the record uses it
+        if meta is None or not self.cache.blobs.acquire(document_id):
+            return None
+        stream = self.cache.blobs.open(document_id)
+        try:
+            upload = NamedUpload(stream, meta["name"], meta["type"])
+            index = get_document_index(upload, document_id, self.cache)
+        except Exception:
+            stream.close()
+            self.cache.blobs.release(document_id)
+            raise
+        return DocumentRecord(document_id, meta["name"], meta["type"], stream, index, self.cache.blobs)
+
+    # Function to get the conversation (and its lock) of one session on one document. `session_id` is
+    # already scoped to the API key (see _session_key), so callers with different keys never share one.
+    def conversation(self, session_id, record):
+        key = (session_id, record.document_id)
+        with self._lock:
+            if key not in self.conversations:
+                self.conversations[key] = Conversation(record.document_id, record.index)
+                self.conversation_locks[key] = asyncio.Lock()
+                while len(self.conversations) > self.max_conversations:
+                    evicted, _ = self.conversations.popitem(last=False)
+                    self.conversation_locks.pop(evicted, None)
+            self.conversations.move_to_end(key)
+            return self.conversations[key], self.conversation_locks[key]
+
+
+def _api_key(request):
+    api_key = request.headers.get("x-gemini-api-key") or os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        raise APIError(401, "Missing Gemini API key (X-Gemini-Api-Key header).")
+    return api_key
+
+
+# Function to read the caller's session id; a caller without one gets a new session (returned in the
+# X-Session-Id response header, to be sent back for follow-up questions)
+def _session_id(request):
+    return request.headers.get("x-session-id") or uuid.uuid4().hex
+
+
+# Function to scope a session to the API key it is used with: conversations, usage totals and session
+# budgets are keyed by this, so two keys sending the same X-Session-Id never see each other's history
+def _session_key(api_key, session_id):
+    return f"{api_key_fingerprint(api_key)}:{session_id}"
+
+
+async def _document(registry, document_id):
+    return await asyncio.to_thread(registry.document, document_id)
+
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise APIError(400, "Request body must be JSON.")
+    if not isinstance(body, dict):
+        raise APIError(400, "Request body must be a JSON object.")
+    return body
+
+
+async def health(request):
+    registry = request.app.state.registry
+    return JSONResponse({
+        "status": "ok",
+        "documents": len(registry.documents),
+        "providers": registry.provider_metrics.snapshot(),
+        "extractive_qa": registry.fast_path_stats.snapshot() if EXTRACTIVE_QA_ENABLED else None,
+        "prompt_prefixes": PROMPTS.snapshot(),
+        "blobs": registry.cache.blobs.snapshot(),
+    })
+
+
+# Upload: the body is written to the blob store as it arrives (hashed on the way, so identical uploads are
+# stored once), then indexed off the event loop
+async def upload_document(request):
+    registry = request.app.state.registry
+    blobs = registry.cache.blobs
+    name = request.query_params.get("filename") or "document"
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip() or None
+    writer = blobs.writer()
+    try:
+        async for chunk in request.stream():
+            if writer.size + len(chunk) > MAX_UPLOAD_BYTES:
+                raise APIError(413, f"Upload larger than {MAX_UPLOAD_BYTES} bytes.")
+            writer.write(chunk)
+        if not writer.size:
+            raise APIError(400, "Empty upload.")
+    except BaseException:
+        writer.abort()
+        raise
+    if content_type in ("application/octet-stream", "application/x-www-form-urlencoded"):
+        content_type = None
+    # The blob digest is the SHA-256 of the content, i.e. the document fingerprint
+    document_id = await asyncio.to_thread(writer.commit)
+    stream = blobs.open(document_id)
+
+    def index_upload():
+        return get_document_index(NamedUpload(stream, name, content_type), document_id, registry.cache)
+
+    try:
+        index = await asyncio.to_thread(index_upload)
+    except Exception as e:
+        stream.close()
+        blobs.release(document_id)
+        raise APIError(422, f"Could not extract text from the document: {e}")
+    record = registry.add_document(DocumentRecord(document_id, name, content_type, stream, index, blobs))
+    # Lets the other workers rebuild the record when a question for this document reaches them
+    await asyncio.to_thread(registry.cache.put_json, "document", document_id, {"name": name, "type": content_type})
+    response = record.as_dict()
+    # The digest is billed to the uploader's key and session, so it is only built when a key is sent
+    api_key = request.headers.get("x-gemini-api-key") or os.environ.get("GEMINI_API_KEY")
+    if DIGEST_ENABLED and api_key:
+        public_session_id = _session_id(request)
+        response["digest_job"] = registry.submit_digest(api_key, _session_key(api_key, public_session_id), record)
+        return JSONResponse(response, status_code=201, headers={"X-Session-Id": public_session_id})
+    return JSONResponse(response, status_code=201)
+
+
+async def get_document(request):
+    record = await _document(request.app.state.registry, request.path_params["document_id"])
+    return JSONResponse(record.as_dict())
+
+
+async def get_document_digest(request):
+    registry = request.app.state.registry
+    record = await _document(registry, request.path_params["document_id"])
+    digest = await asyncio.to_thread(get_digest, registry.cache, record.document_id)
+    if digest is None:
+        job = registry.jobs().get(JobQueue.job_id_for("digest", record.document_id))
+        if job is None:
+            raise APIError(404, "No digest for this document (set DOCQA_DIGEST=1 and upload with an API key).")
+        if job["status"] == FAILED:
+            raise APIError(502, f"Building the digest failed: {job.get('error')}")
+        return JSONResponse({"status": job["status"], "progress": job.get("progress")}, status_code=202)
+    return JSONResponse(dict(digest, status="done", document_id=record.document_id))
+
+
+# Function to get the context-cache name for a large document (None if caching does not apply)
+async def _cache_name(registry, client, api_key, record):
+    context_cache = registry.context_cache
+    if not context_cache.is_eligible(record.index.total_tokens):
+        return None
+    return await asyncio.to_thread(
+        context_cache.get_or_create, client, f"{api_key_fingerprint(api_key)}:{record.document_id}",
+        lambda: record.extract_text(registry.cache), DOCUMENT_QA_SYSTEM_INSTRUCTION,
+    )
+
+
+# Function to generate answer text through the API key's provider router (answer cache, retries, routing)
+async def _generate_answer(registry, api_key, session_id, contents, config=None, document_id=None):
+    generation = await registry.tracker.agenerate_routed(
+        registry.router(api_key), session_id, api_key, contents, config, document_id=document_id
+    )
+    return generation.text
+
+
+async def _compact_if_needed(registry, api_key, session_id, conversation):
+    if not conversation.needs_compaction():
+        return
+    router = registry.router(api_key)
+
+    def summarize(prompt):
+        return registry.tracker.generate_routed(
+            router, session_id, api_key, prompt_contents(prompt)
+        ).text
+
+    await asyncio.to_thread(conversation.compact, summarize)
+
+
+# Q&A on an uploaded document; answers as JSON, or as a plain-text stream with "stream": true
+async def ask_question(request):
+    registry = request.app.state.registry
+    record = await _document(registry, request.path_params["document_id"])
+    body = await _json_body(request)
+    question = (body.get("question") or "").strip()
+    if not question:
+        raise APIError(400, "Missing 'question'.")
+    api_key = _api_key(request)
+    public_session_id = _session_id(request)
+    session_id = _session_key(api_key, public_session_id)
+    headers = {"X-Session-Id": public_session_id}
+    client = registry.client(api_key)
+    conversation, lock = registry.conversation(session_id, record)
+
+    fast_path = EXTRACTIVE_QA_ENABLED and body.get("fast_path", True)
+    if DIGEST_ENABLED and conversation.digest is None:
+        conversation.digest = await asyncio.to_thread(get_digest, registry.cache, record.document_id)
+
+    if body.get("stream"):
+        # Run the answer up to its first piece before the response starts, so a budget error (429) or a
+        # failed request still gets its own status instead of a broken 200 stream
+        answer = _stream_answer(registry, client, api_key, session_id, record, conversation, lock, question, fast_path)
+        try:
+            first = await answer.__anext__()
+        except StopAsyncIteration:
+            first, answer = "", None
+        return StreamingResponse(_resume_stream(first, answer), media_type="text/plain; charset=utf-8", headers=headers)
+
+    async with lock:
+        digest_answer = _digest_answer(conversation, question)
+        if digest_answer is not None:
+            return JSONResponse({
+                "answer": digest_answer,
+                "document_id": record.document_id,
+                "fast_path": True,
+                "source": "digest",
+                "usage": registry.tracker.session_totals(session_id),
+            }, headers=headers)
+        fast_answer = await _fast_answer(registry, conversation, question) if fast_path else None
+        if fast_answer is not None:
+            return JSONResponse({
+                "answer": fast_answer["answer"],
+                "document_id": record.document_id,
+                "fast_path": True,
+                "source": "extractive",
+                "score": fast_answer["score"],
+                "highlighted": fast_answer["highlighted"],
+                "section": fast_answer["section"],
+                "usage": registry.tracker.session_totals(session_id),
+            }, headers=headers)
+        started = time.perf_counter()
+
+        def generate(contents, options):
+            return _generate_answer(registry, api_key, session_id, contents, options["config"], record.document_id)
+
+        cache_name, turn, answer = await _ask_model(registry, client, api_key, record, conversation, question, generate)
+        if answer is None:
+            raise APIError(502, "No response from the model.")
+        registry.fast_path_stats.record_llm(time.perf_counter() - started)
+        conversation.record_turn(turn, answer)
+        await _compact_if_needed(registry, api_key, session_id, conversation)
+    return JSONResponse({
+        "answer": answer,
+        "document_id": record.document_id,
+        "fast_path": False,
+        "source": "model",
+        "used_context_cache": bool(cache_name),
+        "usage": registry.tracker.session_totals(session_id),
+    }, headers=headers)
+
+
+# Function to answer an overview question from the document's digest, if it is ready (records the turn)
+def _digest_answer(conversation, question):
+    if not (conversation.digest and conversation.digest["summary"] and is_overview_question(question)):
+        return None
+    conversation.record_local_turn(question, conversation.digest["summary"])
+    return conversation.digest["summary"]
+
+
+# Function to try the local extractive QA model (off the event loop); records the turn on a hit
+async def _fast_answer(registry, conversation, question):
+    result = await asyncio.to_thread(answer_extractively, conversation.index, question, stats=registry.fast_path_stats)
+    if result is not None:
+        conversation.record_local_turn(question, result["answer"], format_extractive_answer(result))
+    return result
+
+
+# Function to ask the model about a document with the conversation's context cache (if any): `call(contents,
+# options)` sends the prepared question. A cache that expired on the provider's side is dropped and the
+# question prepared again without it, once. Returns (cache name, pending turn, result of `call`).
+async def _ask_model(registry, client, api_key, record, conversation, question, call):
+    for attempt in range(2):
+        cache_name = await _cache_name(registry, client, api_key, record)
+        contents, turn, options = prepare_question(
+            conversation, question, cache_name=cache_name, cache_model=registry.context_cache.model
+        )
+        try:
+            return cache_name, turn, await call(contents, options)
+        except Exception as e:
+            if attempt or not cache_name or not is_missing_cache_error(e):
+                raise
+            registry.context_cache.invalidate(f"{api_key_fingerprint(api_key)}:{record.document_id}")
+
+
+# Function to reserve the budget for a streamed request and open the stream up to its first piece (where
+# a missing context cache or any other request error shows up). Returns (stream, iterator, first piece,
+# reservation); the reservation is released if opening fails.
+async def _open_answer_stream(registry, api_key, session_id, contents, config=None, document_id=None):
+    reservation = registry.tracker.check_budget(session_id, api_key, estimate_contents_tokens(contents))
+    try:
+        stream = registry.router(api_key).astream(contents, config, document_id=document_id)
+        iterator = stream.__aiter__()
+        try:
+            first = await iterator.__anext__()
+        except StopAsyncIteration:
+            first = None
+    except BaseException:
+        registry.tracker.release(reservation)
+        raise
+    return stream, iterator, first, reservation
+
+
+# Function to stream the rest of an answer whose first piece was already produced
+async def _resume_stream(first, rest):
+    if first:
+        yield first
+    if rest is not None:
+        async for piece in rest:
+            yield piece
+
+
+async def _stream_answer(registry, client, api_key, session_id, record, conversation, lock, question, fast_path=False):
+    async with lock:
+        digest_answer = _digest_answer(conversation, question)
+        if digest_answer is not None:
+            yield digest_answer
+            return
+        fast_answer = await _fast_answer(registry, conversation, question) if fast_path else None
+        if fast_answer is not None:
+            yield format_extractive_answer(fast_answer)
+            return
+        started = time.perf_counter()
+
+        def open_stream(contents, options):
+            return _open_answer_stream(registry, api_key, session_id, contents, options["config"], record.document_id)
+
+        _, turn, (stream, iterator, first, reservation) = await _ask_model(
+            registry, client, api_key, record, conversation, question, open_stream
+        )
+        try:
+            if first is not None:
+                yield first
+            async for piece in iterator:
+                yield piece
+            registry.tracker.record_generation(session_id, api_key, stream.generation, reservation)
+        finally:
+            registry.tracker.release(reservation)
+        registry.fast_path_stats.record_llm(time.perf_counter() - started)
+        conversation.record_turn(turn, stream.generation.text)
+        await _compact_if_needed(registry, api_key, session_id, conversation)
+
+
+async def code_documentation(request):
+    registry = request.app.state.registry
+    body = await _json_body(request)
+    code = body.get("code")
+    if not code:
+        raise APIError(400, "Missing 'code'.")
+    api_key = _api_key(request)
+    public_session_id = _session_id(request)
+    session_id = _session_key(api_key, public_session_id)
+    headers = {"X-Session-Id": public_session_id}
+    export_format = body.get("format") or "json"
+    if export_format != "json" and export_format not in EXPORT_FORMATS:
+        raise APIError(400, f"Unknown format: {export_format}")
+    contents = prompt_contents(build_code_documentation_prompt(code))
+    if export_format == "docx":
+        response = await _stream_docx(registry, api_key, session_id, contents, "code_documentation.docx")
+        response.headers.update(headers)
+        return response
+    doc_answer = await _generate_answer(registry, api_key, session_id, contents)
+    if doc_answer is None:
+        raise APIError(502, "No response from the model.")
+    if export_format != "json":
+        response = await _export_response(registry, doc_answer, export_format, "code_documentation")
+        response.headers.update(headers)
+        return response
+    return JSONResponse({"documentation": doc_answer}, headers=headers)
+
+
+# Function to stream an answer into a Word document: blocks are rendered as they complete, so the file is
+# ready right after the last piece arrives
+async def _stream_docx(registry, api_key, session_id, contents, filename):
+    reservation = registry.tracker.check_budget(session_id, api_key, estimate_contents_tokens(contents))
+    renderer = StreamingDocxRenderer()
+    try:
+        stream = registry.router(api_key).astream(contents)
+        async for piece in stream:
+            if piece:
+                renderer.feed(piece)
+        registry.tracker.record_generation(session_id, api_key, stream.generation, reservation)
+    finally:
+        registry.tracker.release(reservation)
+    if not stream.generation.text:
+        raise APIError(502, "No response from the model.")
+    doc_io = await asyncio.to_thread(renderer.finish)
+    # Keep the tree and the file, so exporting the same answer again (in any format) skips parsing
+    remember_render_tree(stream.generation.text, renderer.tree, registry.cache)
+    await asyncio.to_thread(remember_export, stream.generation.text, "docx", doc_io.getvalue(), registry.cache)
+    return _file_response(doc_io.getvalue(), DOCX_MIME, filename)
+
+
+# Function to export an answer from its cached render tree (parsed at most once across formats and workers)
+async def _export_response(registry, text, export_format, name):
+    data, mime, extension = await asyncio.to_thread(export_answer, text, export_format, registry.cache)
+    return _file_response(data, mime, f"{name}.{extension}")
+
+
+def _file_response(data, mime, filename):
+    return Response(data, media_type=mime, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+async def export_answer_file(request):
+    export_format = request.path_params["format"]
+    if export_format not in EXPORT_FORMATS:
+        raise APIError(404, f"Unknown export format: {export_format}")
+    body = await _json_body(request)
+    text = body.get("text")
+    if not text:
+        raise APIError(400, "Missing 'text'.")
+    name = (body.get("filename") or "code_documentation").rsplit(".", 1)[0]
+    return await _export_response(request.app.state.registry, text, export_format, name)
+
+
+async def api_error(request, exc):
+    return JSONResponse({"error": exc.message}, status_code=exc.status_code)
+
+
+async def budget_error(request, exc):
+    return JSONResponse({"error": str(exc)}, status_code=429)
+
+
+# Function to build the ASGI application (a custom registry can be passed in, e.g. with a mock client)
+def create_app(registry=None):
+    app = Starlette(
+        routes=[
+            Route("/health", health, methods=["GET"]),
+            Route("/documents", upload_document, methods=["POST"]),
+            Route("/documents/{document_id}", get_document, methods=["GET"]),
+            Route("/documents/{document_id}/digest", get_document_digest, methods=["GET"]),
+            Route("/documents/{document_id}/questions", ask_question, methods=["POST"]),
+            Route("/code-documentation", code_documentation, methods=["POST"]),
+            Route("/exports/{format}", export_answer_file, methods=["POST"]),
+        ],
+        exception_handlers={APIError: api_error, TokenBudgetExceeded: budget_error},
+    )
+    app.state.registry = registry or EngineRegistry()
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("api_server:app", host=os.environ.get("HOST", "127.0.0.1"), port=int(os.environ.get("PORT", "8000")))
@@ -0,0 +1,70 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# Largest batch handed to the model at once, and how long the first request waits for others to join it
+BATCH_MAX_SIZE = int(os.environ.get("DOCQA_BATCH_MAX_SIZE", "8"))
+BATCH_WAIT_MS = int(os.environ.get("DOCQA_BATCH_WAIT_MS", "50"))
+
+
+# Collects requests arriving from several threads for a short window and runs them as one batch.
+# `run_batch(items)` must return one result per item, in order; each caller gets its own result back
+# (or the exception if the batch failed).
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_s=BATCH_WAIT_MS / 1000, name="batcher"):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_s = max_wait_s
+        self.name = name
+        self.stats = {"batches": 0, "items": 0, "largest_batch": 0}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name=f"docqa-{self.name}", daemon=True)
+                self._thread.start()
+
+    # Function to queue one item and block until its result is ready; returns (result, batch size)
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        self._ensure_worker()
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.run_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: expected {len(items)} results, got {len(results)}")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["items"] += len(items)
+                self.stats["largest_batch"] = max(self.stats["largest_batch"], len(items))
+            for (_, future), result in zip(batch, results):
+                future.set_result((result, len(items)))
@@ -0,0 +1,574 @@
+"""Offline benchmarks for the Q&A, code-documentation and DOCX/PDF/HTML export paths.
+
+Gemini is replaced by the local mock client from `mock_gemini.py`, so no API key or
+network is needed. Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench.json --output bench_new.json
+"""
+import argparse
+import asyncio
+import difflib
+import glob
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from benchmarks.synthetic_docs import make_docx, make_pdf, make_text, synthetic_markdown, synthetic_text
+from docx_export import StreamingDocxRenderer, render_docx
+from context_cache import ContextCacheManager
+from conversation import Conversation
+from exports import EXPORT_FORMATS
+from extraction import extract_document_text, iter_docx_blocks, iter_docx_blocks_python_docx, iter_document_blocks
+from memory_profiling import current_rss
+from pdf_engines import PDF_ENGINES, is_empty_page, iter_pdf_page_texts
+from mock_gemini import mock_client_factory, patched_genai_client
+from providers import HEDGE_MIN_SAMPLES, GeminiProvider, HedgePolicy, ProviderMetrics, ProviderRouter
+from prompts import (
+    DOCUMENT_QA_SYSTEM_INSTRUCTION, build_code_documentation_prompt, build_few_shot_document_prompt, prompt_contents,
+)
+from render_tree import parse_markdown
+from retrieval import build_section_index
+from usage_tracking import UsageTracker, estimate_contents_tokens
+
+MODEL = "gemini-2.0-flash"
+QUESTION = "Can you give me a short summary?"
+FOLLOW_UP_QUESTIONS = [
+    "What does the document say about memory?",
+    "Which results are reported for latency?",
+    "How is the benchmark method described?",
+    "Summarize the section about throughput.",
+]
+CODE_SNIPPET = "def add(a, b):\n    return a + b\n" * 20
+
+
+# Collects per-stage wall time and (optionally) per-stage peak traced memory for one run
+class StageRecorder:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.durations = {}
+        self.peaks = {}
+        self.extra = {}
+
+    @contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+            if self.trace_memory:
+                self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+
+
+# Function to create the Gemini client the same way the app does, with `genai.Client` swapped for the mock
+def make_client(mock_settings):
+    try:
+        with patched_genai_client(**mock_settings):
+            from google import genai
+            return genai.Client(api_key="offline-benchmark")
+    except ImportError:
+        return mock_client_factory(**mock_settings)(api_key="offline-benchmark")
+
+
+# Q&A path: extract text -> build prompt -> generate answer -> read answer text
+def run_qa(recorder, upload, client, tracker, stream=False):
+    upload.seek(0)
+    with recorder.stage("extract"):
+        document = extract_document_text(upload)
+    with recorder.stage("prompt"):
+        contents = prompt_contents(build_few_shot_document_prompt(document, QUESTION))
+    del document
+    if stream:
+        with recorder.stage("generate"):
+            start = time.perf_counter()
+            chunks = []
+            for chunk in client.models.generate_content_stream(model=MODEL, contents=contents):
+                if not chunks:
+                    recorder.extra["time_to_first_token_s"] = time.perf_counter() - start
+                chunks.append(chunk.text)
+            answer = "".join(chunks)
+    else:
+        with recorder.stage("generate"):
+            response = tracker.generate_content(client, "benchmark", "offline-benchmark", MODEL, contents)
+        with recorder.stage("answer"):
+            answer = response.candidates[0].content.parts[0].text
+    return answer
+
+
+# Conversational Q&A path: index once, then a first question and follow-ups that only send new excerpts.
+# With `context_cache`, the document goes into a (mock) server-side cache instead and follow-ups only
+# send the question and history. Prompt tokens per turn are recorded to compare with the stateless path.
+def run_qa_conversation(recorder, upload, client, tracker, context_cache=None):
+    upload.seek(0)
+    with recorder.stage("index"):
+        conversation = Conversation("benchmark", build_section_index(iter_document_blocks(upload)))
+    cache_key = f"benchmark:{id(recorder)}"
+
+    def text_factory():
+        upload.seek(0)
+        return extract_document_text(upload)
+
+    follow_up_tokens = []
+    for number, question in enumerate([QUESTION] + FOLLOW_UP_QUESTIONS):
+        stage = "first_turn" if number == 0 else "follow_up_turn"
+        with recorder.stage(stage):
+            response = None
+            if context_cache is not None:
+                contents, turn = conversation.prepare_turn(question, document_cached=True)
+                response = context_cache.generate_with_cache(
+                    client, cache_key, text_factory, DOCUMENT_QA_SYSTEM_INSTRUCTION,
+                    lambda cache_name: tracker.generate_content(
+                        client, "benchmark", "offline-benchmark", context_cache.model, contents,
+                        config={"cached_content": cache_name},
+                    ),
+                )
+            if response is None:
+                contents, turn = conversation.prepare_turn(question)
+                response = tracker.generate_content(
+                    client, "benchmark", "offline-benchmark", MODEL, contents,
+                    config={"system_instruction": DOCUMENT_QA_SYSTEM_INSTRUCTION},
+                )
+            prompt_tokens = estimate_contents_tokens(contents)
+            conversation.record_turn(turn, response.candidates[0].content.parts[0].text)
+            if conversation.needs_compaction():
+                conversation.compact(lambda prompt: tracker.generate_content(
+                    client, "benchmark", "offline-benchmark", MODEL, prompt_contents(prompt)
+                ).candidates[0].content.parts[0].text)
+        if number == 0:
+            recorder.extra["first_turn_prompt_tokens"] = prompt_tokens
+        else:
+            follow_up_tokens.append(prompt_tokens)
+    recorder.extra["follow_up_prompt_tokens"] = statistics.fmean(follow_up_tokens)
+    return conversation
+
+
+# Code-documentation path: build prompt -> generate -> render DOCX. With `stream`, the DOCX is rendered
+# block by block while the answer streams; `download_after_last_token_s` is what is left after the last piece.
+def run_code_doc(recorder, client, tracker, stream=False):
+    with recorder.stage("prompt"):
+        contents = prompt_contents(build_code_documentation_prompt(CODE_SNIPPET))
+    if stream:
+        renderer = StreamingDocxRenderer()
+        with recorder.stage("generate"):
+            for chunk in client.models.generate_content_stream(model=MODEL, contents=contents):
+                renderer.feed(chunk.text)
+        last_token = time.perf_counter()
+        with recorder.stage("docx"):
+            doc_io = renderer.finish()
+        recorder.extra["download_after_last_token_s"] = time.perf_counter() - last_token
+        return doc_io
+    with recorder.stage("generate"):
+        response = tracker.generate_content(client, "benchmark", "offline-benchmark", MODEL, contents)
+        doc_answer = response.candidates[0].content.parts[0].text
+    with recorder.stage("docx"):
+        doc_io = render_docx(parse_markdown(doc_answer))
+    return doc_io
+
+
+# Hedged generation path: one short request through a provider router over a mock with a slow tail.
+# Run with and without a HedgePolicy to compare the tail latencies.
+def run_routed(recorder, router, contents):
+    with recorder.stage("generate"):
+        return asyncio.run(router.agenerate(contents))
+
+
+DOCX_EXTRACTORS = {"stream": iter_docx_blocks, "python-docx": iter_docx_blocks_python_docx}
+
+
+# DOCX extraction on its own: read every block of the file with one extractor
+def run_docx_extract(recorder, data, extractor):
+    with recorder.stage("extract"):
+        blocks = 0
+        for _ in DOCX_EXTRACTORS[extractor](io.BytesIO(data)):
+            blocks += 1
+    recorder.extra["blocks"] = blocks
+    return blocks
+
+
+# Runs in a fresh process: extracts the DOCX while a thread samples the RSS, and sends back the peak growth
+# (ru_maxrss cannot be used: Linux carries it over from the parent through exec)
+def _extract_in_child(data, extractor, connection):
+    before = current_rss()
+    peak = [before]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.005):
+            peak[0] = max(peak[0], current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    run_docx_extract(StageRecorder(), data, extractor)
+    peak[0] = max(peak[0], current_rss())
+    done.set()
+    sampler.join()
+    connection.send(peak[0] - before)
+
+
+# Function to measure how much the RSS of a fresh process grows at most while it extracts a DOCX. lxml
+# allocates outside Python, so tracemalloc does not see the document tree.
+def docx_extract_rss_growth(data, extractor):
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_extract_in_child, args=(data, extractor, sender))
+    process.start()
+    growth = receiver.recv()
+    process.join()
+    return growth
+
+
+# PDF extraction with one engine and no fallback: pages per second and empty pages
+def run_pdf_engine(recorder, data, engine):
+    with recorder.stage("extract"):
+        pages = list(iter_pdf_page_texts(io.BytesIO(data), engine, fallbacks=[]))
+    recorder.extra["pages"] = len(pages)
+    recorder.extra["empty_pages"] = sum(is_empty_page(page) for page in pages)
+    return pages
+
+
+# Function to score extracted text: share of alphabetic words, and (given the reference text) word
+# recall and reading-order similarity over the first 2000 words
+def text_quality(text, reference=None):
+    words = text.lower().split()
+    quality = {"alpha_word_fraction": sum(word.isalpha() for word in words) / len(words) if words else 0.0}
+    if reference:
+        expected = reference.lower().split()
+        found = Counter(words)
+        quality["word_recall"] = sum(min(count, found[word]) for word, count in Counter(expected).items()) / len(expected)
+        quality["order_similarity"] = difflib.SequenceMatcher(None, words[:2000], expected[:2000], autojunk=False).ratio()
+    return quality
+
+
+# Function to collect the PDFs to compare engines on: synthetic ones (their text is known) and, with
+# --pdf-corpus, every *.pdf in a directory (a sibling .txt file with the same name is used as reference)
+def pdf_engine_inputs(args):
+    inputs = []
+    for pages in args.pdf_pages:
+        reference = " ".join(synthetic_text(2000, seed=page) for page in range(pages))
+        inputs.append((f"pdf-{pages}p", make_pdf(pages).getvalue(), reference))
+    for path in sorted(glob.glob(os.path.join(args.pdf_corpus, "*.pdf"))) if args.pdf_corpus else []:
+        with open(path, "rb") as f:
+            data = f.read()
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8", errors="replace") as f:
+                reference = f.read()
+        inputs.append((os.path.basename(path), data, reference))
+    return inputs
+
+
+# DOCX export path on its own, for an answer of a given size (parsing included, the render tree cache bypassed)
+def run_docx_export(recorder, answer_text):
+    with recorder.stage("docx"):
+        return render_docx(parse_markdown(answer_text))
+
+
+# Exports path: parsing the answer into its render tree, which happens once per answer
+def run_export_parse(recorder, answer_text):
+    with recorder.stage("parse"):
+        return parse_markdown(answer_text)
+
+
+# Exports path: one backend rendering an already parsed tree (what switching formats costs)
+def run_export(recorder, nodes, export_format):
+    render = EXPORT_FORMATS[export_format][2]
+    with recorder.stage(export_format):
+        output = render(nodes)
+    recorder.extra["output_bytes"] = len(output)
+    return output
+
+
+# Function to summarize samples; `unit` suffixes the keys ("_s" for durations). Extra metrics carry
+# their unit in their own name (time_to_first_token_s, follow_up_prompt_tokens, pages), so theirs are bare.
+def summarize(values, unit="_s"):
+    values = sorted(values)
+    return {
+        "mean" + unit: statistics.fmean(values),
+        "p50" + unit: values[len(values) // 2],
+        "p95" + unit: values[min(len(values) - 1, int(len(values) * 0.95))],
+        "p99" + unit: values[min(len(values) - 1, int(len(values) * 0.99))],
+        "min" + unit: values[0],
+        "max" + unit: values[-1],
+    }
+
+
+# Function to run one scenario `iterations` times for timing, then once under tracemalloc for memory
+def measure(name, input_label, input_bytes, run, iterations, warmup):
+    for _ in range(warmup):
+        run(StageRecorder())
+
+    stage_samples = {}
+    totals = []
+    extras = {}
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        recorder = StageRecorder()
+        start = time.perf_counter()
+        run(recorder)
+        totals.append(time.perf_counter() - start)
+        for stage, duration in recorder.durations.items():
+            stage_samples.setdefault(stage, []).append(duration)
+        for key, value in recorder.extra.items():
+            extras.setdefault(key, []).append(value)
+    wall = time.perf_counter() - wall_start
+
+    tracemalloc.start()
+    try:
+        recorder = StageRecorder(trace_memory=True)
+        run(recorder)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "path": name,
+        "input": input_label,
+        "input_bytes": input_bytes,
+        "iterations": iterations,
+        "end_to_end": summarize(totals),
+        "stages": {stage: summarize(samples) for stage, samples in stage_samples.items()},
+        "extra": {key: summarize(values, unit="") for key, values in extras.items()},
+        "throughput": {
+            "requests_per_s": iterations / wall if wall else None,
+            "input_mb_per_s": (input_bytes * iterations / 1e6) / wall if wall and input_bytes else None,
+        },
+        "peak_memory_bytes": peak_memory,
+        "stage_peak_memory_bytes": recorder.peaks,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to build the list of (label, upload) inputs for the Q&A path
+def qa_inputs(args):
+    inputs = []
+    for pages in args.pdf_pages:
+        inputs.append((f"pdf-{pages}p", make_pdf(pages)))
+    for paragraphs in args.docx_paragraphs:
+        inputs.append((f"docx-{paragraphs}para", make_docx(paragraphs)))
+    for kilobytes in args.text_kb:
+        inputs.append((f"txt-{kilobytes}kb", make_text(kilobytes * 1024)))
+    return inputs
+
+
+def run_all(args):
+    mock_settings = {
+        "latency_s": args.latency,
+        "tokens_per_s": args.tokens_per_s,
+        "prompt_tokens_per_s": args.prompt_tokens_per_s,
+        "output_tokens": args.output_tokens,
+        "min_cache_tokens": args.cache_min_tokens,
+    }
+    client = make_client(mock_settings)
+    tracker = UsageTracker(session_budget=0, api_key_budget=0)
+    results = []
+
+    if {"qa", "qa-conversation", "qa-cached"} & set(args.paths):
+        for label, upload in qa_inputs(args):
+            if "qa" in args.paths:
+                results.append(measure(
+                    "qa", label, upload.size,
+                    lambda recorder, upload=upload: run_qa(recorder, upload, client, tracker),
+                    args.iterations, args.warmup,
+                ))
+            if "qa-conversation" in args.paths:
+                results.append(measure(
+                    "qa-conversation", label, upload.size,
+                    lambda recorder, upload=upload: run_qa_conversation(recorder, upload, client, tracker),
+                    args.iterations, args.warmup,
+                ))
+            if "qa-cached" in args.paths:
+                results.append(measure(
+                    "qa-cached", label, upload.size,
+                    lambda recorder, upload=upload: run_qa_conversation(
+                        recorder, upload, client, tracker,
+                        context_cache=ContextCacheManager(min_tokens=args.cache_min_tokens),
+                    ),
+                    args.iterations, args.warmup,
+                ))
+            if args.stream:
+                results.append(measure(
+                    "qa-stream", label, upload.size,
+                    lambda recorder, upload=upload: run_qa(recorder, upload, client, tracker, stream=True),
+                    args.iterations, args.warmup,
+                ))
+
+    if "code-doc" in args.paths:
+        results.append(measure(
+            "code-doc", "snippet", len(CODE_SNIPPET),
+            lambda recorder: run_code_doc(recorder, client, tracker),
+            args.iterations, args.warmup,
+        ))
+        if args.stream:
+            results.append(measure(
+                "code-doc-stream", "snippet", len(CODE_SNIPPET),
+                lambda recorder: run_code_doc(recorder, client, tracker, stream=True),
+                args.iterations, args.warmup,
+            ))
+
+    if "docx-extract" in args.paths:
+        for paragraphs in args.docx_extract_paragraphs:
+            data = make_docx(paragraphs, table_every=20).getvalue()
+            for extractor in DOCX_EXTRACTORS:
+                result = measure(
+                    "docx-extract", f"{extractor}-{paragraphs}para", len(data),
+                    lambda recorder, data=data, extractor=extractor: run_docx_extract(recorder, data, extractor),
+                    args.iterations, args.warmup,
+                )
+                result["peak_rss_growth_bytes"] = docx_extract_rss_growth(data, extractor)
+                results.append(result)
+
+    if "pdf-engines" in args.paths:
+        engines = [name for name, engine in PDF_ENGINES.items() if engine.available()]
+        for label, data, reference in pdf_engine_inputs(args):
+            for engine in engines:
+                result = measure(
+                    "pdf-engines", f"{engine}-{label}", len(data),
+                    lambda recorder, data=data, engine=engine: run_pdf_engine(recorder, data, engine),
+                    args.iterations, args.warmup,
+                )
+                extract = result["stages"]["extract"]["mean_s"]
+                result["pages_per_s"] = result["extra"]["pages"]["mean"] / extract if extract else None
+                result["quality"] = text_quality("\n".join(run_pdf_engine(StageRecorder(), data, engine)), reference)
+                results.append(result)
+
+    if "docx-export" in args.paths:
+        for kilobytes in args.answer_kb:
+            answer = synthetic_text(kilobytes * 1024)
+            results.append(measure(
+                "docx-export", f"answer-{kilobytes}kb", len(answer),
+                lambda recorder, answer=answer: run_docx_export(recorder, answer),
+                args.iterations, args.warmup,
+            ))
+
+    if "exports" in args.paths:
+        for kilobytes in args.answer_kb:
+            answer = synthetic_markdown(kilobytes * 1024)
+            label = f"markdown-{kilobytes}kb"
+            results.append(measure(
+                "export-parse", label, len(answer),
+                lambda recorder, answer=answer: run_export_parse(recorder, answer), args.iterations, args.warmup,
+            ))
+            nodes = parse_markdown(answer)
+            for export_format in EXPORT_FORMATS:
+                results.append(measure(
+                    f"export-{export_format}", label, len(answer),
+                    lambda recorder, nodes=nodes, export_format=export_format: run_export(recorder, nodes, export_format),
+                    args.iterations, args.warmup,
+                ))
+
+    if "hedging" in args.paths:
+        # A separate client so the slow tail does not affect the other paths
+        slow_client = make_client(dict(mock_settings, slow_fraction=args.slow_fraction,
+                                       slow_latency_s=args.slow_latency, seed=0))
+        contents = [{"parts": [{"text": QUESTION}]}]
+        for label, hedge in (("unhedged", None), (f"hedged-p{args.hedge_percentile:g}", HedgePolicy(
+                percentile=args.hedge_percentile, max_extra_fraction=args.hedge_max_extra))):
+            router = ProviderRouter([GeminiProvider(slow_client, MODEL)], metrics=ProviderMetrics(), hedge=hedge)
+            result = measure(
+                "hedging", label, len(QUESTION),
+                lambda recorder, router=router: run_routed(recorder, router, contents),
+                args.hedge_requests, max(args.warmup, HEDGE_MIN_SAMPLES),
+            )
+            if hedge is not None:
+                result["hedge"] = {"requests": hedge.requests, "hedges": hedge.hedges,
+                                   "wins": router.metrics.snapshot()[repr(router.providers[0])]["hedge_wins"]}
+            results.append(result)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "mock": mock_settings,
+            "mock_client": type(client).__name__,
+        },
+        "results": results,
+    }
+
+
+# Function to print end-to-end mean ratios (new / old) for scenarios present in both runs
+def compare(old, new):
+    previous = {(r["path"], r["input"]): r for r in old["results"]}
+    for result in new["results"]:
+        key = (result["path"], result["input"])
+        if key not in previous:
+            continue
+        old_mean = previous[key]["end_to_end"]["mean_s"]
+        new_mean = result["end_to_end"]["mean_s"]
+        ratio = new_mean / old_mean if old_mean else float("inf")
+        old_p99 = previous[key]["end_to_end"].get("p99_s")
+        p99_ratio = result["end_to_end"]["p99_s"] / old_p99 if old_p99 else float("nan")
+        old_peak = previous[key]["peak_memory_bytes"] or 1
+        print(f"{key[0]:>12} {key[1]:>18}  time x{ratio:5.2f}  p99 x{p99_ratio:5.2f}  "
+              f"peak memory x{result['peak_memory_bytes'] / old_peak:5.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paths", nargs="+", default=["qa", "qa-conversation", "qa-cached", "code-doc", "docx-export"],
+                        choices=["qa", "qa-conversation", "qa-cached", "code-doc", "docx-export", "exports", "hedging", "docx-extract",
+                                 "pdf-engines"])
+    parser.add_argument("--pdf-pages", nargs="*", type=int, default=[10, 100])
+    parser.add_argument("--docx-paragraphs", nargs="*", type=int, default=[100, 1000])
+    parser.add_argument("--pdf-corpus", help="directory of PDFs to compare the engines on (pdf-engines path)")
+    parser.add_argument("--text-kb", nargs="*", type=int, default=[256])
+    parser.add_argument("--docx-extract-paragraphs", nargs="*", type=int, default=[2000, 20000],
+                        help="DOCX sizes for the docx-extract path (a 10-row table every 20 paragraphs)")
+    parser.add_argument("--answer-kb", nargs="*", type=int, default=[4, 64])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--stream", action="store_true", help="also benchmark the streaming Q&A variant")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock time to first byte in seconds")
+    parser.add_argument("--tokens-per-s", type=float, default=2000.0, help="mock output token rate")
+    parser.add_argument("--prompt-tokens-per-s", type=float, default=500000.0, help="mock prompt processing rate")
+    parser.add_argument("--output-tokens", type=int, default=256, help="mock answer length in tokens")
+    parser.add_argument("--cache-min-tokens", type=int, default=4096,
+                        help="smallest document put in the context cache (qa-cached path)")
+    parser.add_argument("--hedge-requests", type=int, default=200, help="requests per variant (hedging path)")
+    parser.add_argument("--slow-fraction", type=float, default=0.03,
+                        help="fraction of mock calls that are slow (hedging path)")
+    parser.add_argument("--slow-latency", type=float, default=0.5, help="extra latency of a slow mock call in seconds")
+    parser.add_argument("--hedge-percentile", type=float, default=95.0, help="latency percentile used as hedge deadline")
+    parser.add_argument("--hedge-max-extra", type=float, default=0.1, help="largest fraction of hedged requests")
+    parser.add_argument("--output", help="write the JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_all(args)
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload)
+    else:
+        print(payload)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import random
+from io import BytesIO
+
+from extraction import PDF_MIME, DOCX_MIME
+
+
+WORDS = (
+    "document question answering gemini model context token latency throughput memory "
+    "python streamlit extraction paragraph section table summary report analysis data "
+    "system performance benchmark result page chapter figure reference method value"
+).split()
+
+
+# In-memory stand-in for Streamlit's UploadedFile (exposes `.name`, `.type`, `.size` and file methods)
+class SyntheticUpload(BytesIO):
+    def __init__(self, data, name, type):
+        super().__init__(data)
+        self.name = name
+        self.type = type
+        self.size = len(data)
+
+
+# Function to generate deterministic filler text of roughly `n_chars` characters
+def synthetic_text(n_chars, seed=0):
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < n_chars:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+        words.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(words)[:n_chars]
+
+
+# Function to generate a deterministic markdown answer of roughly `n_chars` characters: headed sections
+# with paragraphs (some inline markup), bullet and numbered lists and fenced code blocks
+def synthetic_markdown(n_chars, seed=0):
+    rng = random.Random(seed)
+    blocks = ["# Code documentation"]
+    length = 0
+    section = 0
+    while length < n_chars:
+        roll = rng.random()
+        if roll < 0.15:
+            section += 1
+            block = f"## Section {section}: {rng.choice(WORDS)} {rng.choice(WORDS)}"
+        elif roll < 0.55:
+            words = synthetic_text(rng.randint(200, 600), seed=rng.random()).split()
+            for position in rng.sample(range(len(words)), min(3, len(words))):
+                words[position] = rng.choice(("**{}**", "*{}*", "`{}`")).format(words[position])
+            block = " ".join(words)
+        elif roll < 0.8:
+            marker = rng.choice(("-", "1."))
+            block = "\n".join(f"{marker} {synthetic_text(rng.randint(40, 120), seed=rng.random())}"
+                              for _ in range(rng.randint(2, 6)))
+        else:
+            lines = [f"def {rng.choice(WORDS)}_{index}(value):\n    return value + {index}"
+                     for index in range(rng.randint(1, 4))]
+            block = "```python\n" + "\n".join(lines) + "\n```"
+        blocks.append(block)
+        length += len(block) + 2
+    return "\n\n".join(blocks)
+
+
+# Function to generate a PDF with `pages` pages of roughly `chars_per_page` characters each
+def make_pdf(pages, chars_per_page=2000, seed=0):
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.set_font("Helvetica", size=9)
+    for page in range(pages):
+        pdf.add_page()
+        pdf.multi_cell(0, 4, synthetic_text(chars_per_page, seed=seed + page))
+    data = pdf.output(dest="S")
+    if isinstance(data, str):
+        data = data.encode("latin-1")
+    return SyntheticUpload(bytes(data), f"synthetic_{pages}p.pdf", PDF_MIME)
+
+
+# Function to generate a DOCX with `paragraphs` paragraphs (a heading every `section_every` paragraphs,
+# a `table_rows`-row table every `table_every` paragraphs if set, and a page header and footer)
+def make_docx(paragraphs, chars_per_paragraph=600, section_every=10, seed=0, table_every=0, table_rows=10):
+    from docx import Document
+    doc = Document()
+    section = doc.sections[0]
+    section.header.paragraphs[0].text = "Synthetic document header"
+    section.footer.paragraphs[0].text = "Synthetic document footer"
+    for index in range(paragraphs):
+        if index % section_every == 0:
+            doc.add_heading(f"Section {index // section_every + 1}", level=1)
+        doc.add_paragraph(synthetic_text(chars_per_paragraph, seed=seed + index))
+        if table_every and index % table_every == table_every - 1:
+            table = doc.add_table(rows=table_rows, cols=3)
+            for row_number, row in enumerate(table.rows):
+                for column, cell in enumerate(row.cells):
+                    cell.text = synthetic_text(40, seed=seed + index + row_number * 3 + column)
+    doc_io = BytesIO()
+    doc.save(doc_io)
+    suffix = f"_tables{table_every}" if table_every else ""
+    return SyntheticUpload(doc_io.getvalue(), f"synthetic_{paragraphs}para{suffix}.docx", DOCX_MIME)
+
+
+# Function to generate a plain-text upload of roughly `n_chars` characters
+def make_text(n_chars, seed=0, encoding="utf-8"):
+    return SyntheticUpload(synthetic_text(n_chars, seed=seed).encode(encoding), f"synthetic_{n_chars}.txt", "text/plain")
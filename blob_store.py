@@ -0,0 +1,228 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+# Unreferenced blobs are kept for reuse until the store grows past this size, then removed least
+# recently used first (blobs still referenced are never removed)
+BLOB_STORE_MAX_BYTES = int(os.environ.get("DOCQA_BLOB_STORE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Files without a row (left by a crashed writer) are removed by `collect(sweep_orphans=True)` once this old
+ORPHAN_GRACE_SECONDS = 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+
+
+# Runs the statements of a `with` block in one immediate transaction
+class ImmediateTransaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+# Content written to a temporary file in the store and hashed, not yet referenced
+class StagedBlob:
+    def __init__(self, digest, size, tmp_path):
+        self.digest = digest
+        self.size = size
+        self.tmp_path = tmp_path
+
+
+# Content-addressed file store shared between processes: each blob is a file named by its SHA-256 under a
+# two-character shard directory, with its size, reference count and last access in SQLite. `add` takes a
+# reference (the file is only written if that content is new), `release` drops one, and `collect` removes
+# unreferenced blobs LRU-first once the store is over `max_bytes`. Callers keeping their own rows in the
+# same database (SharedCache) can change references inside their transactions with `reference`/`dereference`.
+class BlobStore:
+    def __init__(self, directory, db_path=None, max_bytes=BLOB_STORE_MAX_BYTES):
+        self.directory = directory
+        self.db_path = db_path or os.path.join(directory, "blobs.sqlite3")
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.stats = {"added": 0, "deduplicated": 0, "bytes_saved": 0, "collected": 0}
+        self._local = threading.local()
+        with self._transaction() as db:
+            db.execute(_SCHEMA)
+
+    # One connection per thread; WAL lets readers and a writer from other processes work concurrently
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _transaction(self):
+        return ImmediateTransaction(self._connection())
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _temp_path(self):
+        return os.path.join(self.directory, f"{os.getpid()}.{threading.get_ident()}.{time.monotonic_ns()}.tmp")
+
+    # Function to write bytes to a temporary file in the store, ready to be referenced
+    def stage(self, data):
+        tmp_path = self._temp_path()
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return StagedBlob(hashlib.sha256(data).hexdigest(), len(data), tmp_path)
+
+    # Function to write a blob in pieces (e.g. an upload as it arrives) without holding it in memory
+    def writer(self):
+        return BlobWriter(self)
+
+    # Function to take a reference to a staged blob inside the caller's transaction; `place` must follow
+    # once it has committed. Returns whether the content is new to the store.
+    def reference(self, db, staged):
+        now = time.time()
+        if db.execute("UPDATE blobs SET refcount = refcount + 1, accessed_at = ? WHERE digest = ?",
+                      (now, staged.digest)).rowcount:
+            return False
+        db.execute("INSERT INTO blobs (digest, size, refcount, created_at, accessed_at) VALUES (?, ?, 1, ?, ?)",
+                   (staged.digest, staged.size, now, now))
+        return True
+
+    def dereference(self, db, digest):
+        db.execute("UPDATE blobs SET refcount = MAX(refcount - 1, 0) WHERE digest = ?", (digest,))
+
+    # Function to move a staged blob in place after its reference has committed (or drop the staged copy if
+    # the content is already stored). `collect` removes files inside its transaction, so a blob referenced
+    # by a committed transaction cannot be removed before this runs.
+    def place(self, staged):
+        path = self.path(staged.digest)
+        if os.path.exists(path):
+            os.remove(staged.tmp_path)
+            self.stats["deduplicated"] += 1
+            self.stats["bytes_saved"] += staged.size
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(staged.tmp_path, path)
+        self.stats["added"] += 1
+        self.collect()
+
+    def add_staged(self, staged):
+        with self._transaction() as db:
+            self.reference(db, staged)
+        self.place(staged)
+        return staged.digest
+
+    # Function to store bytes (or reuse the identical blob) and take a reference to it; returns the digest
+    def add(self, data):
+        return self.add_staged(self.stage(data))
+
+    # Function to take another reference to a stored blob (False if the store does not have it)
+    def acquire(self, digest):
+        with self._transaction() as db:
+            return bool(db.execute("UPDATE blobs SET refcount = refcount + 1, accessed_at = ? WHERE digest = ?",
+                                   (time.time(), digest)).rowcount)
+
+    # Function to drop a reference; the blob stays available for reuse until `collect` needs the space
+    def release(self, digest):
+        with self._transaction() as db:
+            self.dereference(db, digest)
+
+    # Function to open a blob for reading (FileNotFoundError if it is not stored)
+    def open(self, digest):
+        f = open(self.path(digest), "rb")
+        now = time.time()
+        row = self._connection().execute("SELECT accessed_at FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        # Minute precision is enough for the LRU order and keeps most reads write-free
+        if row is not None and now - row[0] > 60:
+            with self._transaction() as db:
+                db.execute("UPDATE blobs SET accessed_at = ? WHERE digest = ?", (now, digest))
+        return f
+
+    def read(self, digest):
+        with self.open(digest) as f:
+            return f.read()
+
+    # Function to remove unreferenced blobs, least recently used first, until the store fits in `max_bytes`
+    # (all of them with max_bytes=0). With `sweep_orphans`, old files without a row are removed too.
+    def collect(self, max_bytes=None, sweep_orphans=False):
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = 0
+        with self._transaction() as db:
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total > max_bytes:
+                candidates = db.execute("SELECT digest, size FROM blobs WHERE refcount = 0 ORDER BY accessed_at")
+                for digest, size in candidates.fetchall():
+                    if total <= max_bytes:
+                        break
+                    db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                    try:
+                        os.remove(self.path(digest))
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    removed += 1
+            if sweep_orphans:
+                removed += self._sweep_orphans(db)
+        self.stats["collected"] += removed
+        return removed
+
+    def _sweep_orphans(self, db):
+        known = {row[0] for row in db.execute("SELECT digest FROM blobs")}
+        cutoff = time.time() - ORPHAN_GRACE_SECONDS
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                files = [item for item in os.scandir(entry.path) if item.name not in known]
+            else:
+                files = [entry] if entry.name.endswith(".tmp") else []
+            for item in files:
+                if item.stat().st_mtime < cutoff:
+                    os.remove(item.path)
+                    removed += 1
+        return removed
+
+    def snapshot(self):
+        blobs, total, referenced = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refcount > 0), 0) FROM blobs"
+        ).fetchone()
+        return {"blobs": blobs, "bytes": total, "referenced": referenced, **self.stats}
+
+
+# Writes one blob in pieces: `write` hashes and spools to a temporary file in the store, `commit` adds it
+# (taking a reference) and returns the digest, `abort` throws it away
+class BlobWriter:
+    def __init__(self, store):
+        self.store = store
+        self.tmp_path = store._temp_path()
+        self.file = open(self.tmp_path, "wb")
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.file.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        self.file.close()
+        return self.store.add_staged(StagedBlob(self.hash.hexdigest(), self.size, self.tmp_path))
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,107 @@
+# Target chunk size (characters) and overlap between consecutive chunks
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 200
+
+
+# Function to lazily cut a stream of text pieces (pages, paragraphs) into overlapping chunks.
+# Chunks are yielded as soon as enough text has arrived, so indexing can start before the
+# last page has been parsed. Each chunk records the piece (page/paragraph) it starts in.
+def iter_chunks(pieces, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+    buffer = ""
+    buffer_start_piece = 0
+    index = 0
+    for piece_number, piece in enumerate(pieces):
+        if not piece:
+            continue
+        if not buffer:
+            buffer_start_piece = piece_number
+        buffer += piece if not buffer else "\n" + piece
+        while len(buffer) >= chunk_size:
+            cut = _split_point(buffer, chunk_size)
+            yield {"index": index, "text": buffer[:cut], "piece": buffer_start_piece}
+            index += 1
+            buffer = buffer[max(cut - overlap, 0):]
+            buffer_start_piece = piece_number
+    if buffer.strip():
+        yield {"index": index, "text": buffer, "piece": buffer_start_piece}
+
+
+# Function to find a cut point near `limit`, preferring paragraph, sentence, then word boundaries
+def _split_point(text, limit):
+    window_start = int(limit * 0.6)
+    for separator in ("\n\n", "\n", ". ", " "):
+        cut = text.rfind(separator, window_start, limit)
+        if cut != -1:
+            return cut + len(separator)
+    return limit
+
+
+# Longest section path repeated at the top of a chunk
+SECTION_PREFIX_MAX = 200
+
+
+# Function to cut a stream of layout blocks (see extraction.iter_document_blocks) into chunks along their
+# boundaries: a heading closes the current chunk once it is at least `min_fill` full, blocks are never
+# split unless a single block is larger than a chunk, and each chunk records its section path (the
+# headings above it) and page. Chunks that start inside a section begin with the path in brackets,
+# so the section names are searchable and the model sees where an excerpt comes from.
+def iter_section_chunks(blocks, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, min_fill=0.5):
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+    headings = []
+    parts = []
+    size = 0
+    start = None
+    index = 0
+    # Whether the last part of the current chunk is a table, which following rows are added to
+    in_table = False
+
+    def make_chunk(text):
+        block_number, section, page = start
+        return {"index": index, "text": text, "piece": block_number, "section": section, "page": page}
+
+    for block_number, block in enumerate(blocks):
+        text = block["text"].strip()
+        if not text:
+            continue
+        is_heading = block["kind"] == "heading"
+        if is_heading:
+            if parts and size >= chunk_size * min_fill:
+                yield make_chunk("\n\n".join(parts))
+                index += 1
+                parts, size = [], 0
+            level = block.get("level", 1)
+            headings = [heading for heading in headings if heading[0] < level] + [(level, text)]
+        elif parts and size + len(text) > chunk_size and size >= chunk_size * min_fill:
+            yield make_chunk("\n\n".join(parts))
+            index += 1
+            parts, size, in_table = [], 0, False
+        section = " > ".join(heading[1] for heading in headings)
+        if not parts:
+            start = (block_number, section, block.get("page"))
+            context = " > ".join(heading[1] for heading in (headings[:-1] if is_heading else headings))
+            if context:
+                parts.append(f"[{context[:SECTION_PREFIX_MAX]}]")
+                size += len(parts[0]) + 2
+        if block["kind"] == "table_row" and in_table:
+            # Rows of one table stay together, one per line
+            parts[-1] += "\n" + text
+        else:
+            parts.append(text)
+        size += len(text) + 2
+        in_table = block["kind"] == "table_row"
+        # Only a block larger than a chunk gets here: split it like plain text, with overlap
+        while size > chunk_size:
+            joined = "\n\n".join(parts)
+            cut = _split_point(joined, chunk_size)
+            yield make_chunk(joined[:cut])
+            index += 1
+            start = (block_number, section, block.get("page"))
+            rest = joined[max(cut - overlap, 0):]
+            parts = [f"[{section[:SECTION_PREFIX_MAX]}]", rest] if section else [rest]
+            size = sum(len(part) + 2 for part in parts)
+            in_table = False
+    if parts and any(part.strip() for part in parts):
+        yield make_chunk("\n\n".join(parts))
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+
+# Explicit caching needs a versioned model name
+CACHE_MODEL = os.environ.get("DOCQA_CACHE_MODEL", "gemini-2.0-flash-001")
+# Documents smaller than this are sent inline instead (the API rejects smaller caches)
+CACHE_MIN_TOKENS = int(os.environ.get("DOCQA_CACHE_MIN_TOKENS", "32768"))
+CACHE_TTL_SECONDS = int(os.environ.get("DOCQA_CACHE_TTL_SECONDS", "3600"))
+# Handles this close to expiry are recreated rather than risk expiring mid-request
+EXPIRY_MARGIN_SECONDS = 60
+# After a failed creation the document is sent inline for this long before caching is tried again
+FAILURE_BACKOFF_SECONDS = 300
+
+
+# Function to tell whether an API error means the cached content is gone (expired or deleted)
+def is_missing_cache_error(error):
+    code = getattr(error, "code", None)
+    if code in (403, 404):
+        return True
+    message = str(error).lower()
+    return "cachedcontent" in message.replace(" ", "") or "cached content" in message
+
+
+# Function to convert the `expire_time` returned by the API into a Unix timestamp
+def _expire_timestamp(cached_content, fallback):
+    expire_time = getattr(cached_content, "expire_time", None)
+    if isinstance(expire_time, datetime):
+        if expire_time.tzinfo is None:
+            expire_time = expire_time.replace(tzinfo=timezone.utc)
+        return expire_time.timestamp()
+    if isinstance(expire_time, (int, float)):
+        return float(expire_time)
+    return fallback
+
+
+# Local bookkeeping of server-side cached-content handles, keyed by "<API key fingerprint>:<document id>".
+# With a shared `store` (shared_cache.SharedCache) the handles are shared by all worker processes, so a
+# document is cached on the server once rather than once per worker.
+class ContextCacheManager:
+    def __init__(self, model=CACHE_MODEL, ttl_seconds=CACHE_TTL_SECONDS, min_tokens=CACHE_MIN_TOKENS, clock=time.time,
+                 store=None):
+        self.model = model
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.clock = clock
+        self.handles = {}
+        self.stats = {"created": 0, "reused": 0, "recreated": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def is_eligible(self, document_tokens):
+        return self.min_tokens > 0 and document_tokens >= self.min_tokens
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _is_valid(self, handle):
+        return bool(handle) and handle["expires_at"] - EXPIRY_MARGIN_SECONDS > self.clock()
+
+    def _valid_handle(self, key):
+        handle = self.handles.get(key)
+        if self._is_valid(handle):
+            return handle
+        if self.store is not None:
+            handle = self.store.get_json("context-cache", key)
+            if self._is_valid(handle) and handle["name"]:
+                with self._lock:
+                    self.handles[key] = handle
+                return handle
+        return None
+
+    def _reuse(self, handle):
+        if handle["name"]:
+            self.stats["reused"] += 1
+        return handle["name"]
+
+    def invalidate(self, key):
+        with self._lock:
+            self.handles.pop(key, None)
+        if self.store is not None:
+            self.store.delete("context-cache", key)
+
+    # Function to create the server-side cache holding the document and the system instruction
+    def _create(self, client, key, document_text, system_instruction):
+        now = self.clock()
+        cached_content = client.caches.create(
+            model=self.model,
+            config={
+                "contents": [{"role": "user", "parts": [{"text": f"Document:\n{document_text}"}]}],
+                "system_instruction": system_instruction,
+                "display_name": f"docqa-{key[-40:]}",
+                "ttl": f"{self.ttl_seconds}s",
+            },
+        )
+        handle = {
+            "name": cached_content.name,
+            "created_at": now,
+            "expires_at": _expire_timestamp(cached_content, now + self.ttl_seconds),
+        }
+        with self._lock:
+            self.handles[key] = handle
+        if self.store is not None:
+            self.store.put_json("context-cache", key, handle, ttl_seconds=max(1, handle["expires_at"] - now))
+        return handle
+
+    # Function to return the cache name for a document, creating (or recreating after expiry) as needed.
+    # `text_factory` is only called when a cache has to be created. Returns None if creation fails.
+    def get_or_create(self, client, key, text_factory, system_instruction):
+        handle = self._valid_handle(key)
+        if handle:
+            return self._reuse(handle)
+        shared_lock = self.store.lock("context-cache", key) if self.store is not None else nullcontext()
+        with self._key_lock(key), shared_lock:
+            handle = self._valid_handle(key)
+            if handle:
+                return self._reuse(handle)
+            existed = bool(self.handles.get(key, {}).get("name"))
+            try:
+                handle = self._create(client, key, text_factory(), system_instruction)
+            except Exception:
+                self.stats["failed"] += 1
+                # Remember the failure so every question does not pay for another attempt
+                with self._lock:
+                    self.handles[key] = {"name": None, "created_at": self.clock(),
+                                         "expires_at": self.clock() + FAILURE_BACKOFF_SECONDS + EXPIRY_MARGIN_SECONDS}
+                return None
+            self.stats["recreated" if existed else "created"] += 1
+            return handle["name"]
+
+    # Function to run `generate(cache_name)` against the document cache, recreating the cache once if the
+    # server reports it missing (expired early or deleted). Returns the response, or None if no cache
+    # could be created so the caller can fall back to sending the document inline.
+    def generate_with_cache(self, client, key, text_factory, system_instruction, generate):
+        for attempt in range(2):
+            cache_name = self.get_or_create(client, key, text_factory, system_instruction)
+            if cache_name is None:
+                return None
+            try:
+                return generate(cache_name)
+            except Exception as e:
+                if attempt or not is_missing_cache_error(e):
+                    raise
+                # Expire the handle so the next attempt recreates it
+                with self._lock:
+                    if key in self.handles:
+                        self.handles[key]["expires_at"] = 0
+                if self.store is not None:
+                    self.store.delete("context-cache", key)
+        return None
+
+    def delete(self, client, key):
+        handle = self.handles.get(key)
+        self.invalidate(key)
+        if handle and handle["name"]:
+            try:
+                client.caches.delete(name=handle["name"])
+            except Exception:
+                pass
@@ -0,0 +1,140 @@
+import os
+
+from prompts import build_conversation_preamble, build_conversation_turn, build_summary_prompt
+from summarization import format_section_summaries, is_summary_question
+from usage_tracking import estimate_tokens
+
+
+# Token budget for document excerpts selected per question (the whole document is sent once if it fits)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("DOCQA_CONTEXT_TOKEN_BUDGET", "30000"))
+# Token budget for the verbatim question/answer history before older turns are summarized
+HISTORY_TOKEN_BUDGET = int(os.environ.get("DOCQA_HISTORY_TOKEN_BUDGET", "4000"))
+# Number of most recent turns always kept verbatim
+KEEP_RECENT_TURNS = 2
+
+
+def _message(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def _parts_message(role, parts):
+    return {"role": role, "parts": parts}
+
+
+# Conversation about one document in one session. Every document excerpt is sent once: later
+# questions only carry the excerpts not already in the history, plus the question itself.
+# When the question/answer history exceeds its budget, older turns are folded into a rolling summary.
+class Conversation:
+    def __init__(self, document_id, index, context_token_budget=CONTEXT_TOKEN_BUDGET,
+                 history_token_budget=HISTORY_TOKEN_BUDGET, keep_recent_turns=KEEP_RECENT_TURNS):
+        self.document_id = document_id
+        self.index = index
+        self.context_token_budget = context_token_budget
+        self.history_token_budget = history_token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.turns = []
+        # Every question and answer, for display only (never sent back to the model)
+        self.transcript = []
+        self.summary = ""
+        # Excerpts carried over from summarized turns, in the order they were first sent
+        self.carried_chunk_ids = []
+        # Ingest-time digest of the document (see summarization.build_digest), once it has been built
+        self.digest = None
+
+    @property
+    def sent_chunk_ids(self):
+        sent = set(self.carried_chunk_ids)
+        for turn in self.turns:
+            sent.update(turn["chunk_ids"])
+        return sent
+
+    def history_tokens(self):
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(turn["question"]) + estimate_tokens(turn["answer"] or "") for turn in self.turns
+        )
+
+    # Function to build the leading messages: excerpts from summarized turns and the rolling summary
+    def _preamble(self):
+        overview = self.digest["summary"] if self.digest else ""
+        excerpts = [self.index.chunks[chunk_id]["text"] for chunk_id in self.carried_chunk_ids]
+        parts = build_conversation_preamble(overview, excerpts, self.summary)
+        if not parts:
+            return []
+        return [_parts_message("user", parts), _message("model", "Understood.")]
+
+    def history_contents(self):
+        contents = self._preamble()
+        for turn in self.turns:
+            contents.append(_parts_message("user", turn["user_parts"]))
+            contents.append(_message("model", turn["answer"]))
+        return contents
+
+    # Function to prepare the request for a new question: returns the `contents` to send and the pending turn.
+    # With `document_cached` the whole document is already in a server-side cache, so no excerpts are added.
+    # Questions about the whole of a document too large to send get the digest's section summaries instead.
+    def prepare_turn(self, question, document_cached=False):
+        sent = self.sent_chunk_ids
+        if (not document_cached and self.digest and self.digest["sections"]
+                and self.index.total_tokens > self.context_token_budget and is_summary_question(question)):
+            new_chunks = []
+            excerpts = [f"Section summaries:\n{format_section_summaries(self.digest['sections'])}"]
+        else:
+            context = [] if document_cached else self.index.select_context(question, self.context_token_budget)
+            new_chunks = [chunk for chunk in context if chunk["id"] not in sent]
+            excerpts = [chunk["text"] for chunk in new_chunks]
+        # The excerpts go in as separate parts, so chunk texts are never copied into one prompt string
+        turn = {
+            "question": question,
+            "user_parts": build_conversation_turn(excerpts, question),
+            "chunk_ids": [chunk["id"] for chunk in new_chunks],
+            "answer": None,
+        }
+        return self.history_contents() + [_parts_message("user", turn["user_parts"])], turn
+
+    def record_turn(self, turn, answer):
+        turn["answer"] = answer
+        self.turns.append(turn)
+        self.transcript.append((turn["question"], answer))
+
+    # Function to record a question answered without the model (e.g. by the extractive fast path). The
+    # history keeps the short answer for later questions; no excerpts count as sent.
+    def record_local_turn(self, question, answer, display_answer=None):
+        turn = {"question": question, "user_parts": build_conversation_turn([], question), "chunk_ids": [], "answer": answer}
+        self.turns.append(turn)
+        self.transcript.append((question, display_answer or answer))
+
+    def excerpt_tokens(self):
+        return sum(self.index.chunks[chunk_id]["tokens"] for chunk_id in self.sent_chunk_ids)
+
+    def needs_compaction(self):
+        if len(self.turns) <= self.keep_recent_turns:
+            return False
+        return self.history_tokens() > self.history_token_budget or self.excerpt_tokens() > self.context_token_budget
+
+    # Function to fold all but the most recent turns into the rolling summary.
+    # `summarize` takes a prompt and returns the summary text (one model call).
+    def compact(self, summarize):
+        old_turns = self.turns[:-self.keep_recent_turns]
+        if not old_turns:
+            return
+        transcript = "\n".join(f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in old_turns)
+        summary = summarize(build_summary_prompt(self.summary, transcript))
+        if not summary:
+            return
+        self.summary = summary
+        for turn in old_turns:
+            self.carried_chunk_ids.extend(turn["chunk_ids"])
+        # Keep the carried excerpts within the context budget; dropped ones are re-sent if needed again
+        while self.carried_chunk_ids and sum(
+            self.index.chunks[chunk_id]["tokens"] for chunk_id in self.carried_chunk_ids
+        ) > self.context_token_budget:
+            self.carried_chunk_ids.pop(0)
+        self.turns = self.turns[-self.keep_recent_turns:]
+
+
+# Function to get the conversation for a document from a session-scoped mapping, creating it on first use
+def get_conversation(store, document_id, build_index):
+    conversations = store.setdefault("conversations", {})
+    if document_id not in conversations:
+        conversations[document_id] = Conversation(document_id, build_index())
+    return conversations[document_id]
@@ -0,0 +1,108 @@
+from io import BytesIO
+from docx import Document
+
+from render_tree import RenderTreeBuilder
+
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+# Function to add styled text in the Word document
+def add_styled_text(doc, text, style=None, is_bold=False, is_italic=False, is_code=False):
+    para = doc.add_paragraph()
+    
+    if is_code:
+        run = para.add_run(text)
+        run.font.name = 'Courier New'  # Use monospace font for code
+        para.style = 'Normal'
+    else:
+        if style:
+            para.style = style
+        run = para.add_run(text)
+        
+        # Apply bold or italic formatting if needed
+        if is_bold:
+            run.bold = True
+        if is_italic:
+            run.italic = True
+
+# Function to add render-tree runs (see render_tree.parse_runs) to a paragraph
+def add_runs(para, runs):
+    for text, style in runs:
+        run = para.add_run(text)
+        if style == "bold":
+            run.bold = True
+        elif style == "italic":
+            run.italic = True
+        elif style == "code":
+            run.font.name = 'Courier New'
+
+
+# Function to add one render-tree node to a Word document
+def add_render_node(doc, node):
+    kind = node["kind"]
+    if kind == "code":
+        add_styled_text(doc, node["text"], is_code=True)
+    elif kind == "heading":
+        add_runs(doc.add_paragraph(style=f"Heading {min(node['level'], 4)}"), node["runs"])
+    elif kind == "list_item":
+        add_runs(doc.add_paragraph(style="List Number" if node["ordered"] else "List Bullet"), node["runs"])
+    else:
+        add_runs(doc.add_paragraph(), node["runs"])
+
+
+# Function to start the Word document for generated code documentation (title and introduction)
+def new_code_documentation_document():
+    doc = Document()
+    doc.add_heading('Code Documentation', 0)
+
+    # Add introductory sections
+    add_styled_text(doc, "Overview", style="Heading 1", is_bold=True)
+    add_styled_text(doc, "This document provides a detailed explanation of the code snippet provided by the user.", is_italic=True)
+    doc.add_paragraph("\n")
+    return doc
+
+
+# Builds the code documentation DOCX while the answer streams in: each markdown block is parsed and added
+# to the document as soon as it is complete, so when generation ends only the last block and saving are
+# left. The render tree it builds (`tree`) can be cached for the other export formats.
+class StreamingDocxRenderer:
+    def __init__(self):
+        self.doc = new_code_documentation_document()
+        self.builder = RenderTreeBuilder()
+
+    @property
+    def tree(self):
+        return self.builder.nodes
+
+    def feed(self, text):
+        for node in self.builder.feed(text):
+            add_render_node(self.doc, node)
+
+    # Function to pass streamed pieces through unchanged while rendering them (e.g. for st.write_stream)
+    def tee(self, pieces):
+        for piece in pieces:
+            if piece:
+                self.feed(piece)
+            yield piece
+
+    # Function to add the last blocks and save the document, returned as an in-memory file
+    def finish(self):
+        for node in self.builder.finish():
+            add_render_node(self.doc, node)
+        return _save(self.doc)
+
+
+def _save(doc):
+    doc_io = BytesIO()
+    doc.save(doc_io)
+    doc_io.seek(0)
+    return doc_io
+
+
+# Function to render a render tree as the code documentation Word document (an in-memory file)
+def render_docx(nodes):
+    doc = new_code_documentation_document()
+    for node in nodes:
+        add_render_node(doc, node)
+    return _save(doc)
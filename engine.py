@@ -0,0 +1,71 @@
+from chunking import CHUNK_OVERLAP, CHUNK_SIZE
+from context_cache import CACHE_MODEL
+from extraction import extract_document_text, iter_document_blocks
+from prompts import DOCUMENT_QA_SYSTEM_INSTRUCTION
+from retrieval import build_section_index
+from shared_cache import cache_key
+
+
+# Shared pieces of the Q&A flow used by both the Streamlit app and the HTTP API
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+# Bump when the index layout changes so stale pickled indexes in the shared cache are not reused
+INDEX_VERSION = 2
+
+
+# Function to read the answer text of a Gemini response (None if there is no candidate)
+def response_text(response):
+    if not getattr(response, "candidates", None):
+        return None
+    return response.candidates[0].content.parts[0].text
+
+
+# Function to prepare a conversation question: returns the contents, the pending turn, and the
+# model/config for the request. With `cache_name` the document is referenced from the context cache.
+def prepare_question(conversation, question, cache_name=None, cache_model=CACHE_MODEL, model=DEFAULT_MODEL):
+    if cache_name:
+        contents, turn = conversation.prepare_turn(question, document_cached=True)
+        return contents, turn, {"model": cache_model, "config": {"cached_content": cache_name}}
+    contents, turn = conversation.prepare_turn(question)
+    return contents, turn, {"model": model, "config": {"system_instruction": DOCUMENT_QA_SYSTEM_INSTRUCTION}}
+
+
+# Function to index a document; a document without any text (e.g. a scan when no OCR engine is
+# installed) is an error rather than an empty prompt
+def build_document_index(uploaded_file):
+    index = build_section_index(iter_document_blocks(uploaded_file))
+    if not index.total_tokens:
+        raise ValueError("No text could be extracted from the document (scanned PDFs need pytesseract and "
+                         "PyMuPDF or pdf2image for OCR)")
+    return index
+
+
+# Function to get the search index of a document, built once per document across all worker processes
+def get_document_index(uploaded_file, document_id, cache=None):
+    if cache is None:
+        return build_document_index(uploaded_file)
+    key = cache_key(document_id, CHUNK_SIZE, CHUNK_OVERLAP, INDEX_VERSION)
+    return cache.get_or_build("index", key, lambda: build_document_index(uploaded_file))
+
+
+# Function to get the full text of a document, extracted once per document across all worker processes
+def get_document_text(uploaded_file, document_id, cache=None):
+    if cache is None:
+        return extract_document_text(uploaded_file)
+    text = cache.get_text("text", document_id)
+    if text is None:
+        with cache.lock("text", document_id):
+            text = cache.get_text("text", document_id)
+            if text is None:
+                text = extract_document_text(uploaded_file)
+                cache.put_text("text", document_id, text)
+    return text
+
+
+# Function to key a cached answer by everything sent to the model. A context-cache name differs per
+# API key and worker, so it is replaced by the document it holds.
+def answer_cache_key(model, contents, config=None, document_id=None):
+    config = dict(config or {})
+    if config.pop("cached_content", None):
+        config["cached_document"] = document_id
+    return cache_key(model, contents, config)
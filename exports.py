@@ -0,0 +1,156 @@
+import html
+
+from docx_export import DOCX_MIME, render_docx
+from render_tree import get_render_tree, render_tree_key
+from shared_cache import EXPORT_CACHE_TTL_SECONDS, cache_key
+
+
+PDF_MIME = "application/pdf"
+HTML_MIME = "text/html"
+
+DOCUMENT_TITLE = "Code Documentation"
+DOCUMENT_INTRO = "This document provides a detailed explanation of the code snippet provided by the user."
+
+# PDF font sizes (points) by heading level, and the line height used for body text (millimetres)
+_PDF_HEADING_SIZES = {1: 18, 2: 15, 3: 13}
+_PDF_LINE_HEIGHT = 6
+_PDF_FONT_STYLES = {None: "", "bold": "B", "italic": "I"}
+# The core PDF fonts only cover latin-1: common typographic characters are mapped, others replaced
+_LATIN1_REPLACEMENTS = str.maketrans({
+    "‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "-",
+    "…": "...", "•": "-", " ": " ",
+})
+
+
+def _latin1(text):
+    return text.translate(_LATIN1_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1")
+
+
+def _pdf_runs(pdf, runs, size=11, bold=False):
+    for text, style in runs:
+        if style == "code":
+            pdf.set_font("Courier", "B" if bold else "", size)
+        else:
+            pdf.set_font("Helvetica", "B" if bold else _PDF_FONT_STYLES[style], size)
+        pdf.write(_PDF_LINE_HEIGHT, _latin1(text))
+    pdf.ln(_PDF_LINE_HEIGHT + 2)
+
+
+# Function to render a render tree as a PDF (bytes) with fpdf's core fonts
+def render_pdf(nodes):
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 22)
+    pdf.cell(0, 12, DOCUMENT_TITLE, ln=1)
+    pdf.set_font("Helvetica", "I", 11)
+    pdf.multi_cell(0, _PDF_LINE_HEIGHT, DOCUMENT_INTRO)
+    pdf.ln(4)
+    numbers = 0
+    for node in nodes:
+        kind = node["kind"]
+        numbers = numbers + 1 if kind == "list_item" and node["ordered"] else 0
+        if kind == "heading":
+            pdf.ln(2)
+            _pdf_runs(pdf, node["runs"], size=_PDF_HEADING_SIZES.get(node["level"], 12), bold=True)
+        elif kind == "code":
+            pdf.set_font("Courier", "", 9)
+            pdf.set_fill_color(242, 242, 242)
+            pdf.multi_cell(0, 4.5, _latin1(node["text"].expandtabs(4)), fill=True)
+            pdf.ln(3)
+        elif kind == "list_item":
+            pdf.set_font("Helvetica", "", 11)
+            pdf.write(_PDF_LINE_HEIGHT, f"  {numbers}. " if node["ordered"] else "  \x95 ")
+            _pdf_runs(pdf, node["runs"])
+        else:
+            _pdf_runs(pdf, node["runs"])
+    return pdf.output(dest="S").encode("latin-1")
+
+
+def _html_runs(runs):
+    parts = []
+    for text, style in runs:
+        text = html.escape(text)
+        if style == "bold":
+            text = f"<strong>{text}</strong>"
+        elif style == "italic":
+            text = f"<em>{text}</em>"
+        elif style == "code":
+            text = f"<code>{text}</code>"
+        parts.append(text)
+    return "".join(parts)
+
+
+# Function to render a render tree as a standalone HTML page (bytes, UTF-8)
+def render_html(nodes):
+    parts = [
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8">',
+        f"<title>{DOCUMENT_TITLE}</title></head><body>",
+        f"<h1>{DOCUMENT_TITLE}</h1>",
+        f"<p><em>{DOCUMENT_INTRO}</em></p>",
+    ]
+    open_list = None
+    for node in nodes:
+        list_tag = ("ol" if node["ordered"] else "ul") if node["kind"] == "list_item" else None
+        if open_list != list_tag:
+            if open_list:
+                parts.append(f"</{open_list}>")
+            if list_tag:
+                parts.append(f"<{list_tag}>")
+            open_list = list_tag
+        if list_tag:
+            parts.append(f"<li>{_html_runs(node['runs'])}</li>")
+        elif node["kind"] == "heading":
+            # The page title is the only <h1>
+            level = min(node["level"] + 1, 6)
+            parts.append(f"<h{level}>{_html_runs(node['runs'])}</h{level}>")
+        elif node["kind"] == "code":
+            parts.append(f"<pre><code>{html.escape(node['text'])}</code></pre>")
+        else:
+            parts.append(f"<p>{_html_runs(node['runs'])}</p>")
+    if open_list:
+        parts.append(f"</{open_list}>")
+    parts.append("</body></html>\n")
+    return "\n".join(parts).encode("utf-8")
+
+
+def _docx_bytes(nodes):
+    return render_docx(nodes).getvalue()
+
+
+# Export formats: media type, file extension and the backend rendering a render tree to bytes
+EXPORT_FORMATS = {
+    "docx": (DOCX_MIME, "docx", _docx_bytes),
+    "pdf": (PDF_MIME, "pdf", render_pdf),
+    "html": (HTML_MIME, "html", render_html),
+}
+
+
+def export_key(text, export_format):
+    return cache_key(render_tree_key(text), export_format)
+
+
+# Function to keep an export already rendered (e.g. the DOCX built while the answer streamed) in `store`
+# for EXPORT_CACHE_TTL_SECONDS
+def remember_export(text, export_format, data, store):
+    if EXPORT_CACHE_TTL_SECONDS:
+        store.put_bytes("export", export_key(text, export_format), data, EXPORT_CACHE_TTL_SECONDS)
+
+
+# Function to export a markdown answer in one of EXPORT_FORMATS, returned as (bytes, mime type, extension).
+# The answer is parsed once into a render tree that is cached (per process, and in `store` if given), so
+# switching formats only runs the backend. With a store, rendered files are kept too (large ones in its
+# content-addressed blob store), so an answer exported again in any session or worker is not re-rendered.
+def export_answer(text, export_format="docx", store=None):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format} (expected one of {', '.join(EXPORT_FORMATS)})")
+    mime, extension, render = EXPORT_FORMATS[export_format]
+    use_store = store is not None and EXPORT_CACHE_TTL_SECONDS
+    data = store.get_bytes("export", export_key(text, export_format)) if use_store else None
+    if data is None:
+        data = render(get_render_tree(text, store))
+        if store is not None:
+            remember_export(text, export_format, data, store)
+    return data, mime, extension
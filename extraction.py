@@ -0,0 +1,554 @@
+import codecs
+import hashlib
+import mmap
+import os
+import re
+import shutil
+import tempfile
+
+from memory_profiling import checkpoint
+from pdf_engines import iter_pdf_page_texts
+
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT_MIMES = ("text/plain", "text/markdown", "text/x-markdown")
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown", ".log")
+
+# Streams without random access are spooled to a temporary file; above this size it lives on disk
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+# Text uploads: bytes sampled for encoding detection, and bytes decoded per step
+ENCODING_SAMPLE_SIZE = 64 * 1024
+DECODE_CHUNK_SIZE = 1024 * 1024
+
+
+# Upload-like wrapper (`.name`, `.type`, file methods) around any binary file object, for documents
+# that do not come from Streamlit's file uploader (HTTP API bodies, files on disk)
+class NamedUpload:
+    def __init__(self, fileobj, name, type=None):
+        self.fileobj = fileobj
+        self.name = name
+        self.type = type
+
+    def __getattr__(self, attribute):
+        return getattr(self.fileobj, attribute)
+
+
+# Function to get a seekable, file-like view of an upload without reading it into a new bytes object.
+# Streamlit's UploadedFile is already seekable and is used as is; other streams are spooled to a
+# temporary file, which is memory-mapped once it has rolled over to disk.
+def open_seekable(source, spool_max_memory=SPOOL_MAX_MEMORY):
+    seekable = getattr(source, "seekable", None)
+    if seekable is not None and seekable():
+        source.seek(0)
+        return source
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=spool_max_memory)
+    shutil.copyfileobj(source, spooled, COPY_CHUNK_SIZE)
+    if spooled.tell() > spool_max_memory:
+        # The spool has rolled over to a real file; map it instead of reading it back
+        return mmap.mmap(spooled.fileno(), 0, access=mmap.ACCESS_READ)
+    spooled.seek(0)
+    return spooled
+
+
+# Function to compute a content hash of an upload (read in chunks, file position restored)
+def document_fingerprint(uploaded_file):
+    digest = hashlib.sha256()
+    position = uploaded_file.tell()
+    uploaded_file.seek(0)
+    for chunk in iter(lambda: uploaded_file.read(COPY_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    uploaded_file.seek(position)
+    return digest.hexdigest()
+
+
+# Function to lazily yield the text of each PDF page (engine chosen by DOCQA_PDF_ENGINE, see pdf_engines.py;
+# pages without a text layer are OCR'd where an OCR engine is installed, see ocr.py)
+def iter_pdf_pages(stream, engine=None):
+    from ocr import ocr_empty_pages
+    yield from ocr_empty_pages(stream, iter_pdf_page_texts(stream, engine))
+
+
+# Function to read a heading level from a DOCX paragraph style ("Title" is 0, "Heading 2" is 2; None otherwise).
+# Built-in style names are lowercase in the XML ("heading 2") and capitalized by python-docx.
+def _docx_heading_level(style_name):
+    if (style_name or "").lower() == "title":
+        return 0
+    match = re.match(r"heading (\d+)$", style_name or "", re.IGNORECASE)
+    return int(match.group(1)) if match else None
+
+
+# Function to classify a DOCX paragraph from its style name and whether it is numbered
+def _docx_paragraph_block(text, style_name, numbered):
+    level = _docx_heading_level(style_name)
+    if level is not None:
+        return {"kind": "heading", "level": level, "text": text}
+    if numbered or style_name.lower().startswith("list"):
+        return {"kind": "list_item", "text": text}
+    return {"kind": "paragraph", "text": text}
+
+
+# Function to render a DOCX table as text: one row per line, cells separated by " | "
+# (a merged cell is repeated by python-docx for every grid column it spans; it is kept once)
+def _docx_table_text(table):
+    rows = []
+    for row in table.rows:
+        cells = []
+        previous = None
+        for cell in row.cells:
+            if cell._tc is not previous:
+                cells.append(" ".join(cell.text.split()))
+            previous = cell._tc
+        if any(cells):
+            rows.append(" | ".join(cells))
+    return "\n".join(rows)
+
+
+# Function to yield the blocks of a DOCX body through python-docx's object model (the whole document tree
+# is built in memory first). Used for documents the streaming reader cannot open.
+def iter_docx_blocks_python_docx(stream):
+    from docx import Document
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    doc = Document(stream)
+    # `paragraph.style` searches the styles part on every call; read the names once
+    style_names = {style.style_id: style.name for style in doc.styles}
+    for element in doc.element.body.iterchildren():
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            text = Paragraph(element, doc).text.strip()
+            if not text:
+                continue
+            numbered = element.pPr is not None and element.pPr.numPr is not None
+            yield _docx_paragraph_block(text, style_names.get(element.style, ""), numbered)
+        elif tag == "tbl":
+            for row in _docx_table_text(Table(element, doc)).split("\n"):
+                if row:
+                    yield {"kind": "table_row", "text": row}
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P, _W_TBL, _W_TR, _W_TC = _W + "p", _W + "tbl", _W + "tr", _W + "tc"
+_W_TEXT = {_W + "t": None, _W + "tab": "\t", _W + "br": "\n", _W + "cr": "\n"}
+
+
+# Function to read the style names of a DOCX package by style id (styles.xml is small; parsed whole)
+def _docx_style_names(archive):
+    from lxml import etree
+
+    if "word/styles.xml" not in archive.namelist():
+        return {}
+    with archive.open("word/styles.xml") as part:
+        root = etree.parse(part).getroot()
+    names = {}
+    for style in root.iter(_W + "style"):
+        name = style.find(_W + "name")
+        names[style.get(_W + "styleId")] = name.get(_W + "val") if name is not None else ""
+    return names
+
+
+# Function to read the text of a w:p element (runs, tabs and line breaks; deleted revisions are skipped)
+def _wordml_paragraph_text(paragraph):
+    pieces = []
+    for node in paragraph.iter(*_W_TEXT):
+        replacement = _W_TEXT[node.tag]
+        pieces.append(node.text or "" if replacement is None else replacement)
+    return "".join(pieces).strip()
+
+
+# Function to free an element once read, along with the already processed siblings before it
+def _release(element):
+    element.clear(keep_tail=True)
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+# Function to stream the blocks of one WordprocessingML part (the body, a header or a footer) with
+# lxml.iterparse: paragraphs are yielded as soon as they end and table rows as soon as each row ends,
+# and every element is released after it is read, so memory stays flat however long the document is.
+# `part_kind` ("header", "footer") replaces the kind of every paragraph of a header or footer part.
+def _iter_wordml_blocks(part, style_names, part_kind=None):
+    from lxml import etree
+
+    table_depth = 0
+    row = None
+    cell = None
+    for event, element in etree.iterparse(part, events=("start", "end"), tag=(_W_P, _W_TBL, _W_TR, _W_TC)):
+        tag = element.tag
+        if event == "start":
+            if tag == _W_TBL:
+                table_depth += 1
+            elif tag == _W_TR and table_depth == 1:
+                row = []
+            elif tag == _W_TC and table_depth == 1:
+                cell = []
+            continue
+        if tag == _W_P:
+            text = _wordml_paragraph_text(element)
+            if table_depth:
+                # Paragraphs of nested tables end up in the cell of the outer table
+                if text and cell is not None:
+                    cell.append(text)
+            elif text and part_kind:
+                yield {"kind": part_kind, "text": text}
+            elif text:
+                properties = element.find(_W + "pPr")
+                style = properties.find(_W + "pStyle") if properties is not None else None
+                style_name = style_names.get(style.get(_W + "val"), "") if style is not None else ""
+                numbered = properties is not None and properties.find(_W + "numPr") is not None
+                yield _docx_paragraph_block(text, style_name, numbered)
+        elif tag == _W_TC and table_depth == 1:
+            row.append(" ".join(" ".join(cell).split()))
+            cell = None
+        elif tag == _W_TR and table_depth == 1:
+            if any(row):
+                yield {"kind": part_kind or "table_row", "text": " | ".join(row)}
+            row = None
+        elif tag == _W_TBL:
+            table_depth -= 1
+        if not table_depth or tag in (_W_TR, _W_TBL):
+            _release(element)
+
+
+# Function to lazily yield the blocks of a DOCX file in document order: headings (with their level),
+# paragraphs, list items and table rows, plus the text of its headers (first) and footers (last).
+# The XML parts are streamed straight from the zip, so memory does not grow with the document.
+def iter_docx_blocks(stream):
+    import zipfile
+
+    with zipfile.ZipFile(stream) as archive:
+        names = archive.namelist()
+        if "word/document.xml" not in names:
+            stream.seek(0)
+            yield from iter_docx_blocks_python_docx(stream)
+            return
+        style_names = _docx_style_names(archive)
+        headers = sorted(name for name in names if re.fullmatch(r"word/header\d*\.xml", name))
+        footers = sorted(name for name in names if re.fullmatch(r"word/footer\d*\.xml", name))
+        for name, part_kind in [(name, "header") for name in headers] + [("word/document.xml", None)] + \
+                [(name, "footer") for name in footers]:
+            with archive.open(name) as part:
+                yield from _iter_wordml_blocks(part, style_names, part_kind)
+
+
+_NUMBERED_HEADING = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+\S")
+_BULLET = re.compile(r"^(?:[-*+\u2022\u25aa\u2013]|\(?[0-9a-z]{1,3}[.)])\s+")
+_MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*$")
+_SENTENCE_END = (".", "!", "?", ":", ";", ",")
+
+
+# Function to guess whether a line of PDF text is a heading; returns its level or None. Numbered
+# headings ("2.1 Results") get one level per number; short all-caps or title-case lines get level 1.
+def _pdf_heading_level(line):
+    if len(line) > 80 or line.endswith(_SENTENCE_END):
+        return None
+    match = _NUMBERED_HEADING.match(line)
+    if match:
+        return match.group(1).count(".") + 1
+    words = line.split()
+    if not words or len(words) > 8 or not line[0].isupper():
+        return None
+    if line.isupper() and sum(ch.isalpha() for ch in line) >= 3:
+        return 1
+    capitalized = sum(word[0].isupper() for word in words if len(word) > 3)
+    return 1 if capitalized >= max(1, sum(len(word) > 3 for word in words)) else None
+
+
+# Function to group lines of text into blocks: paragraphs (ended by a blank line or a short line closing a
+# sentence), headings, list items and (markdown) tables. `markdown` reads "#" headings instead of guessing.
+def iter_line_blocks(lines, page=None, markdown=False):
+    lines = [line.rstrip() for line in lines]
+    full_width = max((len(line) for line in lines), default=0)
+    paragraph = []
+    table = []
+
+    def block(kind, text, **extra):
+        result = {"kind": kind, "text": text, **extra}
+        if page is not None:
+            result["page"] = page
+        return result
+
+    for line in lines + [""]:
+        stripped = line.strip()
+        if table and not stripped.startswith("|"):
+            yield block("table", "\n".join(table))
+            table = []
+        if not stripped:
+            if paragraph:
+                yield block("paragraph", "\n".join(paragraph))
+                paragraph = []
+            continue
+        if markdown:
+            match = _MARKDOWN_HEADING.match(stripped)
+            level = len(match.group(1)) if match else None
+            heading_text = match.group(2) if match else None
+        else:
+            level = _pdf_heading_level(stripped) if not paragraph else None
+            heading_text = stripped
+        if level is not None or _BULLET.match(stripped) or (markdown and stripped.startswith("|")):
+            if paragraph:
+                yield block("paragraph", "\n".join(paragraph))
+                paragraph = []
+            if level is not None:
+                yield block("heading", heading_text, level=level)
+            elif stripped.startswith("|"):
+                table.append(stripped)
+            else:
+                yield block("list_item", stripped)
+            continue
+        paragraph.append(stripped)
+        # A short line that ends a sentence is the last line of its paragraph
+        if stripped.endswith((".", "!", "?")) and len(line) < 0.7 * full_width:
+            yield block("paragraph", "\n".join(paragraph))
+            paragraph = []
+
+
+# Function to lazily yield the blocks of each PDF page (paragraphs, headings and list items from its lines)
+def iter_pdf_blocks(stream):
+    for page_number, text in enumerate(iter_pdf_pages(stream), start=1):
+        yield from iter_line_blocks(text.splitlines(), page=page_number)
+
+
+# Function to lazily split decoded text pieces into lines (a line may span several pieces)
+def _iter_lines(pieces):
+    pending = ""
+    for piece in pieces:
+        lines = (pending + piece).split("\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+# Function to lazily yield the blocks of a text or markdown upload, one blank-line separated group at a time
+def iter_text_blocks(stream):
+    group = []
+    for line in _iter_lines(iter_text_file(stream)):
+        if line.strip():
+            group.append(line)
+            continue
+        if group:
+            yield from iter_line_blocks(group, markdown=True)
+            group = []
+    if group:
+        yield from iter_line_blocks(group, markdown=True)
+
+
+# Function to classify an upload as "pdf", "docx" or "text" from its MIME type, falling back to the extension
+def document_kind(uploaded_file):
+    mime = getattr(uploaded_file, "type", None)
+    if mime == PDF_MIME:
+        return "pdf"
+    if mime == DOCX_MIME:
+        return "docx"
+    if mime in TEXT_MIMES:
+        return "text"
+    extension = os.path.splitext(getattr(uploaded_file, "name", "") or "")[1].lower()
+    if extension == ".pdf":
+        return "pdf"
+    if extension == ".docx":
+        return "docx"
+    return "text"
+
+
+_WESTERN_ENCODINGS = ("cp1252", "latin_1", "iso8859_15")
+# charset_normalizer candidates whose chaos is within this of the best one's count as a tie
+_ENCODING_TIE = 0.1
+
+
+# Function to detect the encoding of a text upload from a bounded sample of its bytes
+def detect_encoding(sample):
+    for bom, encoding in ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")):
+        if sample.startswith(bom):
+            return encoding
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the end of the sample is still valid UTF-8
+        if e.start >= len(sample) - 3 and e.reason == "unexpected end of data":
+            return "utf-8"
+    try:
+        from charset_normalizer import from_bytes
+        results = from_bytes(sample)
+        best = results.best()
+        if best is not None:
+            # Short Western-European samples score about the same under many single-byte code pages, and
+            # charset_normalizer then tends to pick a Baltic or Central European one (mangling é, è, à, ï):
+            # on a tie, cp1252 (a superset of latin-1's printable characters) wins
+            if any(encoding in _WESTERN_ENCODINGS for encoding in best.could_be_from_charset) or any(
+                match.encoding in _WESTERN_ENCODINGS and match.chaos <= best.chaos + _ENCODING_TIE
+                for match in results
+            ):
+                return "cp1252"
+            return best.encoding
+    except ImportError:
+        pass
+    try:
+        import chardet
+        result = chardet.detect(sample)
+        if result.get("encoding"):
+            return result["encoding"]
+    except ImportError:
+        pass
+    return "utf-8"
+
+
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_INNER_SPACES = re.compile(r"(?<=\S)(?:[ \t]{2,}|\t)")
+# The same, skipping inline code spans (group 1), whose spacing is kept
+_INNER_SPACES_OR_CODE = re.compile(r"(`[^`\n]*`)|(?<=\S)(?:[ \t]{2,}|\t)")
+_LEADING_SPACES = re.compile(r"^[ \t]+")
+_TRAILING_SPACES = re.compile(r"[ \t]+(?=\n|$)")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_CODE_FENCE = re.compile(r"[ \t]*(?:```|~~~)")
+
+
+def _collapse_inner_spaces(text):
+    if "`" not in text:
+        return _INNER_SPACES.sub(" ", text)
+    return _INNER_SPACES_OR_CODE.sub(lambda match: match.group(1) or " ", text)
+
+
+# Normalizes whitespace of decoded text as it streams in: unified line endings, no trailing spaces,
+# single spaces between words (leading indentation, fenced code blocks and inline code spans are kept
+# for markdown), at most one blank line in a row. Only complete lines are normalized; the unfinished last
+# line is held until more text arrives, unless it grows past `max_pending` (then it is flushed up to its
+# trailing whitespace, which stays pending, and the rest of the line continues where it left off).
+class WhitespaceNormalizer:
+    def __init__(self, max_pending=DECODE_CHUNK_SIZE):
+        self.max_pending = max_pending
+        self.pending = ""
+        self.trailing_newlines = 0
+        # Whether the text emitted last ended inside a line (after a forced flush), and inside a code fence
+        self.mid_line = False
+        self.in_code = False
+
+    def feed(self, text, final=False):
+        text = self.pending + text
+        self.pending = ""
+        if not final:
+            if text.endswith("\r"):
+                # The matching "\n" may start the next chunk
+                self.pending, text = "\r", text[:-1]
+            cut = text.rfind("\n") + 1
+            if cut == 0 and len(text) < self.max_pending:
+                self.pending = text + self.pending
+                return ""
+            if cut:
+                self.pending = text[cut:] + self.pending
+                text = text[:cut]
+            else:
+                # Forced flush inside a long line: whitespace at the boundary may separate two words, so it
+                # is carried over rather than stripped as trailing spaces (a run of it after a word is one space)
+                body = text.rstrip(" \t")
+                self.pending = (text[len(body):] if body or not self.mid_line else " ") + self.pending
+                text = body
+                if not text:
+                    return ""
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        text = _CONTROL_CHARS.sub("", text)
+        if self.mid_line and not self.in_code:
+            # Spaces continuing a line after a forced flush are between words, not indentation
+            text = _LEADING_SPACES.sub(" ", text, count=1)
+        text = _TRAILING_SPACES.sub("", text)
+        text = self._collapse(text)
+        text = _BLANK_LINES.sub("\n\n", text)
+
+        # Blank lines may also span the boundary with what was already emitted
+        leading = len(text) - len(text.lstrip("\n"))
+        allowed = max(0, 2 - self.trailing_newlines)
+        if leading > allowed:
+            text = text[leading - allowed:]
+        stripped = text.rstrip("\n")
+        if stripped:
+            self.trailing_newlines = len(text) - len(stripped)
+        else:
+            self.trailing_newlines += len(text)
+        if text:
+            self.mid_line = not text.endswith("\n")
+        return text
+
+    # Function to collapse runs of spaces between words, except inside fenced code blocks
+    def _collapse(self, text):
+        if not self.in_code and "```" not in text and "~~~" not in text:
+            return _collapse_inner_spaces(text)
+        lines = text.split("\n")
+        for i, line in enumerate(lines):
+            if _CODE_FENCE.match(line) and (i or not self.mid_line):
+                self.in_code = not self.in_code
+            elif not self.in_code:
+                lines[i] = _collapse_inner_spaces(line)
+        return "\n".join(lines)
+
+
+# Function to decode a text upload incrementally: detect the encoding from a sample, then decode and
+# normalize one chunk at a time so the whole file is never held as both bytes and text
+def iter_text_file(stream, encoding=None, chunk_size=DECODE_CHUNK_SIZE, normalize=True):
+    sample = stream.read(ENCODING_SAMPLE_SIZE)
+    if isinstance(sample, str):
+        encoding = None
+    else:
+        encoding = encoding or detect_encoding(sample)
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    normalizer = WhitespaceNormalizer() if normalize else None
+
+    def emit(chunk, final=False):
+        text = decoder.decode(chunk, final=final) if encoding else chunk
+        return normalizer.feed(text, final=final) if normalizer else text
+
+    text = emit(sample)
+    if text:
+        yield text
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        text = emit(chunk)
+        if text:
+            yield text
+    text = emit(b"" if encoding else "", final=True)
+    if text:
+        yield text
+
+
+# Function to lazily yield the text of an upload: per page (PDF), per paragraph or table (DOCX) or per
+# decoded chunk (text)
+def iter_document_text(uploaded_file):
+    stream = open_seekable(uploaded_file)
+    kind = document_kind(uploaded_file)
+    if kind == "pdf":
+        yield from iter_pdf_pages(stream)
+    elif kind == "docx":
+        for block in iter_docx_blocks(stream):
+            yield block["text"]
+    else:
+        yield from iter_text_file(stream)
+
+
+# Function to lazily yield the layout blocks of an upload: dicts with a "kind" ("heading", "paragraph",
+# "list_item" or "table"), the "text", a heading "level" and, for PDFs, the "page"
+def iter_document_blocks(uploaded_file):
+    stream = open_seekable(uploaded_file)
+    kind = document_kind(uploaded_file)
+    if kind == "pdf":
+        yield from iter_pdf_blocks(stream)
+    elif kind == "docx":
+        yield from iter_docx_blocks(stream)
+    else:
+        yield from iter_text_blocks(stream)
+
+
+# Function to extract the text of an uploaded document (PDF, DOCX, or text/markdown in any common encoding).
+# The parser reads straight from the upload, so no extra bytes copy of the file is made. Pages and
+# paragraphs are kept on separate lines.
+def extract_document_text(uploaded_file, profiler=None):
+    separator = "" if document_kind(uploaded_file) == "text" else "\n"
+    text = separator.join(iter_document_text(uploaded_file))
+    checkpoint(profiler, "extract text")
+    return text
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+from model_selection import question_complexity
+
+
+# Optional local fast path: lookup questions (dates, names, definitions) are first tried with a small
+# extractive QA model over the best matching chunks, and only go to the LLM when it is not confident
+EXTRACTIVE_QA_ENABLED = os.environ.get("DOCQA_EXTRACTIVE_QA", "").lower() in ("1", "true", "yes")
+EXTRACTIVE_QA_MODEL = os.environ.get("DOCQA_EXTRACTIVE_QA_MODEL", "distilbert-base-cased-distilled-squad")
+# Smallest span score accepted as an answer
+EXTRACTIVE_QA_THRESHOLD = float(os.environ.get("DOCQA_EXTRACTIVE_QA_THRESHOLD", "0.5"))
+# Retrieved chunks the model reads, and the longest answer span (tokens)
+EXTRACTIVE_QA_TOP_CHUNKS = 3
+EXTRACTIVE_QA_MAX_ANSWER_TOKENS = 30
+# Characters of context shown on each side of the highlighted span
+HIGHLIGHT_CONTEXT_CHARS = 160
+
+_PIPELINES = {}
+_LOAD_LOCK = threading.Lock()
+
+
+# Function to get (and cache per process) the question-answering pipeline on CPU
+def get_qa_pipeline(model_name=EXTRACTIVE_QA_MODEL):
+    with _LOAD_LOCK:
+        if model_name not in _PIPELINES:
+            from transformers import pipeline
+            from local_generation import configure_threads
+            configure_threads()
+            _PIPELINES[model_name] = pipeline("question-answering", model=model_name, tokenizer=model_name, device=-1)
+        return _PIPELINES[model_name]
+
+
+# Function to show an answer span inside its surrounding text, in bold
+def highlight_span(context, start, end, margin=HIGHLIGHT_CONTEXT_CHARS):
+    before_start = max(0, start - margin)
+    after_end = min(len(context), end + margin)
+    before = ("…" if before_start else "") + context[before_start:start].lstrip()
+    after = context[end:after_end].rstrip() + ("…" if after_end < len(context) else "")
+    return " ".join(f"{before}**{context[start:end].strip()}**{after}".split())
+
+
+# Hit rate and latency of the fast path. The latency saved by a hit is estimated from the moving
+# average of the questions that went to the LLM; time spent on misses is counted against it.
+class FastPathStats:
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.attempts = 0
+        self.hits = 0
+        self.fast_seconds = 0.0
+        self.miss_seconds = 0.0
+        self.saved_seconds = 0.0
+        self.llm_latency_s = None
+        self._lock = threading.Lock()
+
+    def record_attempt(self, seconds, hit):
+        with self._lock:
+            self.attempts += 1
+            if hit:
+                self.hits += 1
+                self.fast_seconds += seconds
+                if self.llm_latency_s is not None:
+                    self.saved_seconds += max(0.0, self.llm_latency_s - seconds)
+            else:
+                self.miss_seconds += seconds
+
+    def record_llm(self, seconds):
+        with self._lock:
+            previous = self.llm_latency_s
+            self.llm_latency_s = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "attempts": self.attempts,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.attempts, 3) if self.attempts else None,
+                "mean_fast_latency_s": round(self.fast_seconds / self.hits, 4) if self.hits else None,
+                "llm_latency_s": None if self.llm_latency_s is None else round(self.llm_latency_s, 4),
+                "saved_seconds": round(self.saved_seconds, 3),
+                "net_saved_seconds": round(self.saved_seconds - self.miss_seconds, 3),
+            }
+
+
+# Function to tell whether a question is worth trying on the fast path (factual lookups only)
+def is_extractive_question(question):
+    kind, _ = question_complexity(question)
+    return kind == "lookup"
+
+
+# Function to try to answer a question from the top retrieved chunks of a document index. Returns
+# None when the question is not a lookup or the model is not confident enough; otherwise the answer
+# span, its score, the highlighted passage, the chunk it comes from and the time taken.
+def answer_extractively(index, question, threshold=EXTRACTIVE_QA_THRESHOLD, top_chunks=EXTRACTIVE_QA_TOP_CHUNKS,
+                        stats=None, model_name=EXTRACTIVE_QA_MODEL):
+    if not is_extractive_question(question):
+        return None
+    start = time.perf_counter()
+    chunks = [chunk for _, chunk in index.search(question, k=top_chunks)]
+    best = None
+    if chunks:
+        results = get_qa_pipeline(model_name)(
+            [{"question": question, "context": chunk["text"]} for chunk in chunks],
+            top_k=1, max_answer_len=EXTRACTIVE_QA_MAX_ANSWER_TOKENS,
+        )
+        if isinstance(results, dict):
+            results = [results]
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, list):
+                result = result[0]
+            if result["answer"].strip() and (best is None or result["score"] > best[1]["score"]):
+                best = (chunk, result)
+    seconds = time.perf_counter() - start
+    hit = best is not None and best[1]["score"] >= threshold
+    if stats is not None:
+        stats.record_attempt(seconds, hit)
+    if not hit:
+        return None
+    chunk, result = best
+    return {
+        "answer": result["answer"].strip(),
+        "score": round(float(result["score"]), 4),
+        "highlighted": highlight_span(chunk["text"], result["start"], result["end"]),
+        "chunk_id": chunk["id"],
+        "section": chunk.get("section"),
+        "page": chunk.get("page"),
+        "seconds": round(seconds, 4),
+    }
+
+
+# Function to render a fast-path answer for the chat: the span, then the passage it was found in
+def format_extractive_answer(result):
+    where = f" (section: {result['section']})" if result.get("section") else ""
+    return f"{result['answer']}\n\n> {result['highlighted']}\n\n_Found in the document{where}._"
@@ -0,0 +1,309 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from filelock import FileLock
+
+
+# Root directory for everything the app keeps on disk (jobs, caches, blobs)
+DATA_DIR = os.environ.get("DOCQA_DATA_DIR", ".docqa")
+JOB_DIR = os.path.join(DATA_DIR, "jobs")
+# Thread workers serve I/O-bound jobs (API calls); process workers serve local model inference
+THREAD_WORKERS = int(os.environ.get("DOCQA_JOB_THREADS", "8"))
+PROCESS_WORKERS = int(os.environ.get("DOCQA_JOB_PROCESSES", "1"))
+# Jobs run concurrently inside each worker process, so jobs using the same local model share it and
+# can be micro-batched together (1 runs them one at a time)
+PROCESS_JOB_CONCURRENCY = int(os.environ.get("DOCQA_JOB_PROCESS_CONCURRENCY", "8"))
+# How long `submit` waits for another process deciding about the same job
+SUBMIT_LOCK_TIMEOUT_SECONDS = 60
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+INTERRUPTED_ERROR = "Interrupted: the worker stopped before the job finished."
+
+
+# Function to write a JSON file atomically so readers never see a half-written record
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+# Function to resolve a "module:function" path into the function (process workers need importable jobs)
+def resolve_function(path):
+    module_name, _, function_name = path.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+# Runs one job in a worker (thread or process) and keeps its on-disk record up to date
+def _execute_job(record_path, function, args, kwargs):
+    record = _read_json(record_path) or {}
+    record.update(status=RUNNING, started_at=time.time(), worker_pid=os.getpid())
+    write_json_atomic(record_path, record)
+
+    def progress(fraction, message=None):
+        record["progress"] = max(0.0, min(1.0, float(fraction)))
+        if message is not None:
+            record["message"] = message
+        write_json_atomic(record_path, record)
+
+    try:
+        if isinstance(function, str):
+            function = resolve_function(function)
+        if "progress" in inspect.signature(function).parameters:
+            kwargs = dict(kwargs, progress=progress)
+        result = function(*args, **kwargs)
+        record.update(status=DONE, progress=1.0, result=result, finished_at=time.time())
+    except Exception as e:
+        record.update(status=FAILED, error=f"{type(e).__name__}: {e}",
+                      traceback=traceback.format_exc(), finished_at=time.time())
+    write_json_atomic(record_path, record)
+    return record["status"]
+
+
+# Per-process thread pool used by `_start_job_in_worker`
+_WORKER_THREADS = None
+
+
+# Runs in a worker process: hands the job to a thread of that process and returns at once, so the
+# process can pick up further jobs while this one runs (the on-disk record tracks its progress). The
+# record names the worker from here on, so a job lost with its process (e.g. killed when out of memory)
+# is seen as interrupted.
+def _start_job_in_worker(record_path, function, args, kwargs, concurrency):
+    global _WORKER_THREADS
+    if concurrency <= 1:
+        return _execute_job(record_path, function, args, kwargs)
+    record = _read_json(record_path) or {}
+    record["worker_pid"] = os.getpid()
+    write_json_atomic(record_path, record)
+    if _WORKER_THREADS is None:
+        _WORKER_THREADS = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="docqa-worker-job")
+    _WORKER_THREADS.submit(_execute_job, record_path, function, args, kwargs)
+    return QUEUED
+
+
+# Local job queue: callers submit jobs and poll/fetch them by id. Records (status, progress, result) are
+# persisted as JSON files, so a browser refresh or a new session can pick up a job by its id, and
+# submitting the same job again while it is queued, running or done returns the existing job, in this
+# process or any other using the same directory.
+class JobQueue:
+    def __init__(self, directory=JOB_DIR, thread_workers=THREAD_WORKERS, process_workers=PROCESS_WORKERS,
+                 process_job_concurrency=PROCESS_JOB_CONCURRENCY):
+        self.directory = directory
+        self.process_job_concurrency = process_job_concurrency
+        os.makedirs(directory, exist_ok=True)
+        self.threads = ThreadPoolExecutor(max_workers=thread_workers, thread_name_prefix="docqa-job")
+        self.process_workers = process_workers
+        self._processes = None
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._recover_interrupted()
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    # Cross-process lock held while deciding whether a job id needs a new run
+    def _submit_lock(self, job_id):
+        return FileLock(os.path.join(self.directory, f"{job_id}.lock"), timeout=SUBMIT_LOCK_TIMEOUT_SECONDS)
+
+    # Jobs left queued/running by a process that no longer exists will never finish
+    def _recover_interrupted(self):
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            record = _read_json(os.path.join(self.directory, name))
+            if _interrupted(record):
+                record.update(status=FAILED, error=INTERRUPTED_ERROR)
+                write_json_atomic(os.path.join(self.directory, name), record)
+
+    def _process_pool(self):
+        with self._lock:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+            return self._processes
+
+    # A worker process that died (e.g. out of memory) breaks its pool for good: the next job gets a new one
+    def _drop_process_pool(self, pool):
+        with self._lock:
+            if self._processes is not pool:
+                return
+            self._processes = None
+        pool.shutdown(wait=False)
+
+    def _submit_to_process(self, record_path, function, args, kwargs):
+        for attempt in range(2):
+            pool = self._process_pool()
+            try:
+                return pool.submit(_start_job_in_worker, record_path, function, args, kwargs,
+                                   self.process_job_concurrency)
+            except BrokenProcessPool:
+                self._drop_process_pool(pool)
+                if attempt:
+                    raise
+
+    # Function to mark a job failed if `should_fail(record)` still holds once the record is locked (it may
+    # have been resubmitted meanwhile)
+    def _fail(self, job_id, error, should_fail):
+        record_path = self._path(job_id)
+        with self._submit_lock(job_id):
+            record = _read_json(record_path)
+            if should_fail(record):
+                record.update(status=FAILED, error=error, finished_at=time.time())
+                write_json_atomic(record_path, record)
+
+    # Function to match the still unfinished run submitted at `submitted_at`
+    @staticmethod
+    def _unfinished_run(submitted_at):
+        return lambda record: (bool(record) and record.get("status") in (QUEUED, RUNNING)
+                               and record.get("submitted_at") == submitted_at)
+
+    # Called when a job's future completes: jobs record their own outcome, so an exception here means the
+    # worker itself failed (e.g. its process died, breaking the pool)
+    def _job_finished(self, job_id, submitted_at, future):
+        with self._lock:
+            if self._futures.get(job_id) is future:
+                del self._futures[job_id]
+        error = None if future.cancelled() else future.exception()
+        if error is None:
+            return
+        if isinstance(error, BrokenProcessPool):
+            with self._lock:
+                pool = self._processes
+            if pool is not None:
+                self._drop_process_pool(pool)
+        self._fail(job_id, f"{type(error).__name__}: {error}", self._unfinished_run(submitted_at))
+
+    # Function to derive a stable job id from the job kind and a key describing its inputs
+    @staticmethod
+    def job_id_for(kind, key):
+        return hashlib.sha256(f"{kind}\0{key}".encode("utf-8")).hexdigest()[:24]
+
+    # Function to submit a job. `function` is a callable (thread jobs) or a "module:function" path
+    # (required for process jobs). If it accepts a `progress` argument it receives a
+    # progress(fraction, message=None) callback. Only JSON-serializable results are persisted.
+    # Jobs whose real result is kept elsewhere (e.g. in the shared cache, which may evict it) pass
+    # `result_available(record)`: a finished job is run again when it returns False.
+    def submit(self, kind, function, args=(), kwargs=None, key=None, use_process=False, label=None,
+               result_available=None):
+        kwargs = kwargs or {}
+        job_id = self.job_id_for(kind, key) if key is not None else self.job_id_for(kind, f"{time.time_ns()}")
+        record_path = self._path(job_id)
+        if use_process and not isinstance(function, str):
+            raise ValueError("Process jobs must be given as a 'module:function' path")
+        submitted_at = time.time()
+        with self._submit_lock(job_id):
+            if not self._needs_run(_read_json(record_path), result_available):
+                return job_id
+            write_json_atomic(record_path, {
+                "id": job_id,
+                "kind": kind,
+                "label": label or kind,
+                "status": QUEUED,
+                "progress": 0.0,
+                "message": None,
+                "submitted_at": submitted_at,
+                "owner_pid": os.getpid(),
+            })
+        try:
+            if use_process:
+                future = self._submit_to_process(record_path, function, tuple(args), kwargs)
+            else:
+                future = self.threads.submit(_execute_job, record_path, function, tuple(args), kwargs)
+        except Exception as e:
+            self._fail(job_id, f"{type(e).__name__}: {e}", self._unfinished_run(submitted_at))
+            raise
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda done: self._job_finished(job_id, submitted_at, done))
+        return job_id
+
+    # Function to tell whether a job must be (re)started: it is new, failed, was left behind by a process
+    # that no longer exists (the submitter or its worker), or finished but its result is gone
+    @staticmethod
+    def _needs_run(record, result_available=None):
+        if not record:
+            return True
+        status = record.get("status")
+        if status in (QUEUED, RUNNING):
+            return _interrupted(record)
+        if status == DONE:
+            return result_available is not None and not result_available(record)
+        return True
+
+    # A job whose worker died is reported as failed, so pollers stop waiting for it
+    def get(self, job_id):
+        record = _read_json(self._path(job_id))
+        if _interrupted(record):
+            self._fail(job_id, INTERRUPTED_ERROR, _interrupted)
+            record = _read_json(self._path(job_id))
+        return record
+
+    def result(self, job_id):
+        record = self.get(job_id)
+        if record and record.get("status") == DONE:
+            return record.get("result")
+        return None
+
+    def jobs(self, kind=None):
+        records = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                record = _read_json(os.path.join(self.directory, name))
+                if record and (kind is None or record.get("kind") == kind):
+                    records.append(record)
+        return sorted(records, key=lambda record: record.get("submitted_at", 0), reverse=True)
+
+    # Function to block until a job finishes (used by scripts and benchmarks, not by the UI)
+    def wait(self, job_id, timeout=None, poll_interval=0.1):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            record = self.get(job_id)
+            if record and record.get("status") in (DONE, FAILED):
+                return record
+            if deadline is not None and time.time() > deadline:
+                return record
+            time.sleep(poll_interval)
+
+    def shutdown(self, wait=True):
+        self.threads.shutdown(wait=wait)
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait)
+
+
+# Function to tell whether a queued or running job can no longer finish: the process that submitted it, or
+# the worker process that took it, has exited
+def _interrupted(record):
+    if not record or record.get("status") not in (QUEUED, RUNNING):
+        return False
+    worker_pid = record.get("worker_pid")
+    return not _pid_alive(record.get("owner_pid")) or (worker_pid is not None and not _pid_alive(worker_pid))
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows; assume it is alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
@@ -0,0 +1,244 @@
+import os
+import threading
+import time
+
+from batching import MicroBatcher
+from job_queue import PROCESS_WORKERS
+from memory_profiling import current_rss, format_bytes
+from prompts import build_code_documentation_prompt, render_prompt
+
+
+# Precision of locally loaded models: "fp32" (default pipeline), "int8" (dynamic quantization of the
+# linear layers, ~4x smaller and faster on CPU) or "bf16" (used only where the CPU supports it natively)
+LOCAL_PRECISION = os.environ.get("DOCQA_LOCAL_PRECISION", "fp32").lower()
+
+
+# Function to pick the default thread count: physical cores shared between the job worker processes
+# (hyperthreads and oversubscription slow matrix multiplications down rather than up)
+def default_thread_count():
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+    except ImportError:
+        cores = None
+    if not cores:
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, cores // max(1, PROCESS_WORKERS))
+
+
+# Intra-op threads for local inference (0 leaves torch's own default)
+LOCAL_THREADS = int(os.environ.get("DOCQA_LOCAL_THREADS", str(default_thread_count())))
+
+REPORT_MODEL = "EleutherAI/gpt-neo-2.7B"
+CODE_DOC_MODEL = "facebook/incoder-1B"
+
+# Loaded Hugging Face pipelines and their micro-batchers, kept per process so concurrent and repeated
+# jobs share the model
+_PIPELINES = {}
+_BATCHERS = {}
+_LOAD_LOCK = threading.RLock()
+_THREADS_CONFIGURED = False
+
+
+# Function to set torch's thread pools once per process (inter-op threads can only be set before first use)
+def configure_threads(threads=LOCAL_THREADS):
+    global _THREADS_CONFIGURED
+    if _THREADS_CONFIGURED or not threads:
+        return
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    _THREADS_CONFIGURED = True
+
+
+# Function to tell whether the CPU has native bfloat16 instructions (otherwise bf16 is slower than fp32)
+def cpu_supports_bf16():
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+# Function to resolve the requested precision to one this machine can run
+def effective_precision(precision=LOCAL_PRECISION):
+    if precision == "bf16" and not cpu_supports_bf16():
+        return "fp32"
+    if precision not in ("fp32", "int8", "bf16"):
+        raise ValueError(f"Unknown local precision: {precision} (expected fp32, int8 or bf16)")
+    return precision
+
+
+# Function to load a causal language model on CPU in the given precision and wrap it in a pipeline
+def load_text_generator(model_name, precision):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+    configure_threads()
+    if precision == "fp32":
+        return pipeline("text-generation", model=model_name, tokenizer=model_name)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=torch.bfloat16 if precision == "bf16" else torch.float32,
+        low_cpu_mem_usage=True,
+    )
+    model.eval()
+    if precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return pipeline("text-generation", model=model, tokenizer=tokenizer, device=-1)
+
+
+# Function to get (and cache) a text generation pipeline for a model
+def get_text_generator(model_name, precision=LOCAL_PRECISION):
+    precision = effective_precision(precision)
+    with _LOAD_LOCK:
+        if (model_name, precision) not in _PIPELINES:
+            generator = load_text_generator(model_name, precision)
+            # Batched prompts are left-padded; GPT-style tokenizers have no pad token of their own
+            if generator.tokenizer.pad_token is None:
+                generator.tokenizer.pad_token = generator.tokenizer.eos_token
+            generator.tokenizer.padding_side = "left"
+            _PIPELINES[(model_name, precision)] = generator
+    return _PIPELINES[(model_name, precision)]
+
+
+# New-token limits are rounded up to one of these for the batcher key (above the largest, to a multiple of
+# it), so requests with nearby limits share a batch instead of each prompt length getting its own batcher
+NEW_TOKEN_BUCKETS = (64, 128, 256, 512)
+
+
+# Function to round a new-token limit up to its batching bucket
+def new_token_bucket(limit):
+    for bucket in NEW_TOKEN_BUCKETS:
+        if limit <= bucket:
+            return bucket
+    largest = NEW_TOKEN_BUCKETS[-1]
+    return -(-limit // largest) * largest
+
+
+# Function to cut a generated text (prompt followed by the continuation) to `limit` new tokens
+def truncate_new_tokens(tokenizer, prompt, text, limit):
+    if not text.startswith(prompt):
+        return text
+    ids = tokenizer(text[len(prompt):], add_special_tokens=False)["input_ids"]
+    return text if len(ids) <= limit else prompt + tokenizer.decode(ids[:limit])
+
+
+# Function to run several (prompt, new-token limit) requests through the pipeline as one padded batch.
+# The batch generates up to the largest limit, then each output is cut to its own request's limit.
+def run_generation_batch(generator, requests, **kwargs):
+    import torch
+
+    prompts = [prompt for prompt, _ in requests]
+    limits = [limit for _, limit in requests]
+    with torch.inference_mode():
+        outputs = generator(prompts, batch_size=len(prompts), max_new_tokens=max(limits), **kwargs)
+    return [
+        truncate_new_tokens(generator.tokenizer, prompt, output[0]['generated_text'], limit)
+        if limit < max(limits) else output[0]['generated_text']
+        for prompt, limit, output in zip(prompts, limits, outputs)
+    ]
+
+
+# Function to get the micro-batcher in front of one model; requests with different generation
+# settings (or new-token buckets) are batched separately
+def get_batcher(model_name, precision=LOCAL_PRECISION, bucket=None, **kwargs):
+    key = (model_name, effective_precision(precision), bucket, tuple(sorted(kwargs.items())))
+    with _LOAD_LOCK:
+        if key not in _BATCHERS:
+            _BATCHERS[key] = MicroBatcher(
+                lambda requests: run_generation_batch(get_text_generator(model_name, precision), requests, **kwargs),
+                name=model_name.rsplit("/", 1)[-1],
+            )
+        return _BATCHERS[key]
+
+
+# Function to run a generation through the model's micro-batcher and measure it: returns the text and
+# tokens/sec, latency (including the batching window), batch size and RSS. The output is limited by
+# `max_new_tokens`, or by `max_length` minus this prompt's own length.
+def generate_with_stats(model_name, prompt, precision=LOCAL_PRECISION, max_length=None, max_new_tokens=None,
+                        **kwargs):
+    start = time.perf_counter()
+    tokenizer = get_text_generator(model_name, precision).tokenizer
+    prompt_tokens = len(tokenizer(prompt)["input_ids"])
+    if max_new_tokens is None:
+        max_new_tokens = max(1, (max_length or 512) - prompt_tokens)
+    batcher = get_batcher(model_name, precision, new_token_bucket(max_new_tokens), **kwargs)
+    text, batch_size = batcher.submit((prompt, max_new_tokens))
+    elapsed = time.perf_counter() - start
+    new_tokens = max(0, len(tokenizer(text)["input_ids"]) - prompt_tokens)
+    return text, {
+        "new_tokens": new_tokens,
+        "seconds": round(elapsed, 3),
+        "tokens_per_s": round(new_tokens / elapsed, 2) if elapsed else None,
+        "batch_size": batch_size,
+        "rss_bytes": current_rss(),
+    }
+
+
+# Function to describe generation stats in one line (shown with the finished job)
+def format_generation_stats(stats, precision=LOCAL_PRECISION):
+    rss = format_bytes(stats["rss_bytes"]) if stats.get("rss_bytes") else "n/a"
+    return (f"{stats['new_tokens']} tokens in {stats['seconds']} s "
+            f"({stats['tokens_per_s']} tokens/s, batch of {stats.get('batch_size', 1)}), RSS {rss}, "
+            f"{effective_precision(precision)}")
+
+
+# Using third model from huggingface here
+def generate_project_report(subject, progress=None):
+    if progress:
+        progress(0.05, "Loading the model")
+    # Initialize a text generation pipeline
+    get_text_generator(REPORT_MODEL)
+
+    # Prepare the prompt for generating a report
+    prompt = f"Generate a detailed report on the subject: {subject}. Include relevant experiments, steps, and explanations."
+
+    if progress:
+        progress(0.2, "Generating the report")
+    # Generate the report
+    project_content, stats = generate_with_stats(REPORT_MODEL, prompt, max_length=512)
+    if progress:
+        progress(1.0, format_generation_stats(stats))
+
+    return project_content
+
+
+# Function to generate code documentation with a local code model (no API key needed)
+def generate_code_documentation(code_input, progress=None):
+    if progress:
+        progress(0.05, "Loading the model")
+    get_text_generator(CODE_DOC_MODEL)
+
+    if progress:
+        progress(0.2, "Generating the documentation")
+    doc_answer, stats = generate_with_stats(
+        CODE_DOC_MODEL, render_prompt(build_code_documentation_prompt(code_input)), max_length=512
+    )
+    if progress:
+        progress(1.0, format_generation_stats(stats))
+
+    return doc_answer
+
+
+# Compare precisions on this machine, e.g. `python local_generation.py "Chemistry" --precision int8`
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run one local generation and print tokens/sec and RSS.")
+    parser.add_argument("subject")
+    parser.add_argument("--model", default=REPORT_MODEL)
+    parser.add_argument("--precision", default=LOCAL_PRECISION, choices=("fp32", "int8", "bf16"))
+    parser.add_argument("--max-length", type=int, default=512)
+    args = parser.parse_args()
+
+    print(f"RSS before loading: {format_bytes(current_rss() or 0)}")
+    get_text_generator(args.model, args.precision)
+    print(f"RSS after loading: {format_bytes(current_rss() or 0)}")
+    _, stats = generate_with_stats(args.model, args.subject, args.precision, max_length=args.max_length)
+    print(format_generation_stats(stats, args.precision))
@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import tracemalloc
+
+
+# Profiling is off unless enabled in the environment (or toggled in the UI)
+PROFILE_MEMORY = os.environ.get("DOCQA_PROFILE_MEMORY", "").lower() in ("1", "true", "yes")
+
+
+# Function to format a byte count for display
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+# Function to read the resident set size of this process in bytes (None if the platform offers no way).
+# Unlike tracemalloc this includes native allocations such as model weights.
+def current_rss():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS; reported in bytes on macOS and in kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+# Takes tracemalloc snapshots at each stage boundary and reports peak and per-stage memory
+class MemoryProfiler:
+    def __init__(self, top_n=3, take_snapshots=True):
+        self.top_n = top_n
+        self.take_snapshots = take_snapshots
+        self.stages = []
+        self._started_tracing = False
+        self._last_current = 0
+        self._last_snapshot = None
+        self._last_time = None
+        self.overall_peak = 0
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self._last_current = tracemalloc.get_traced_memory()[0]
+        self._last_snapshot = tracemalloc.take_snapshot() if self.take_snapshots else None
+        self._last_time = time.perf_counter()
+        return self
+
+    # Record the stage that just finished: memory held now, the peak reached during it, and top allocators
+    def checkpoint(self, stage):
+        if self._last_time is None:
+            return
+        now = time.perf_counter()
+        current, peak = tracemalloc.get_traced_memory()
+        top = []
+        if self.take_snapshots:
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            if self._last_snapshot is not None:
+                for stat in snapshot.compare_to(self._last_snapshot, "lineno")[:self.top_n]:
+                    frame = stat.traceback[0]
+                    top.append(f"{frame.filename}:{frame.lineno} {format_bytes(stat.size_diff)}")
+            self._last_snapshot = snapshot
+        self.stages.append({
+            "stage": stage,
+            "current_bytes": current,
+            "delta_bytes": current - self._last_current,
+            "peak_bytes": peak,
+            "seconds": now - self._last_time,
+            "top_allocations": top,
+        })
+        self.overall_peak = max(self.overall_peak, peak)
+        self._last_current = current
+        # Snapshot time is profiler overhead, so the next stage's clock starts after it
+        self._last_time = time.perf_counter()
+        # Peak is reported per stage, so start counting again from here
+        tracemalloc.reset_peak()
+
+    def stop(self):
+        self._last_snapshot = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Function to return the report as display-friendly rows
+    def report(self):
+        return [
+            {
+                "stage": row["stage"],
+                "held after stage": format_bytes(row["current_bytes"]),
+                "change": format_bytes(row["delta_bytes"]),
+                "peak during stage": format_bytes(row["peak_bytes"]),
+                "seconds": round(row["seconds"], 3),
+                "top allocations": "; ".join(row["top_allocations"]),
+            }
+            for row in self.stages
+        ]
+
+
+# Function to mark a stage boundary on an optional profiler
+def checkpoint(profiler, stage):
+    if profiler is not None:
+        profiler.checkpoint(stage)
@@ -0,0 +1,315 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+# Local stand-in for `google.genai.Client` used by the benchmarks and offline runs.
+# It mimics the parts of the response objects the apps read: `candidates[0].content.parts[0].text`,
+# `usage_metadata` and, for streams, chunk `.text`.
+
+DEFAULT_RESPONSE = (
+    "# Overview\n\n"
+    "This is a **synthetic** answer produced by the local mock Gemini backend.\n\n"
+    "## Details\n\n"
+    "- The content is repeated to reach the configured output length.\n"
+    "- Latency and throughput are simulated with sleeps.\n\n"
+)
+
+
+# Error raised like the SDK's APIError (it carries `code` and `status`)
+class MockAPIError(Exception):
+    def __init__(self, code, status, message):
+        super().__init__(f"{code} {status}. {message}")
+        self.code = code
+        self.status = status
+        self.message = message
+
+
+class MockPart:
+    def __init__(self, text):
+        self.text = text
+
+
+class MockContent:
+    def __init__(self, text):
+        self.parts = [MockPart(text)]
+        self.role = "model"
+
+
+class MockCandidate:
+    def __init__(self, text):
+        self.content = MockContent(text)
+        self.finish_reason = "STOP"
+
+
+class MockUsageMetadata:
+    def __init__(self, prompt_token_count, candidates_token_count, cached_content_token_count=0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class MockResponse:
+    def __init__(self, text, prompt_tokens, output_tokens, cached_tokens=0):
+        self.candidates = [MockCandidate(text)] if text is not None else []
+        self.usage_metadata = MockUsageMetadata(prompt_tokens, output_tokens, cached_tokens)
+
+    @property
+    def text(self):
+        if not self.candidates:
+            return None
+        return self.candidates[0].content.parts[0].text
+
+
+# Function to count the characters of the text parts in a `contents` payload
+def contents_length(contents):
+    if isinstance(contents, str):
+        return len(contents)
+    total = 0
+    for item in contents or []:
+        if isinstance(item, str):
+            total += len(item)
+        elif isinstance(item, dict):
+            for part in item.get("parts", []):
+                total += len(part.get("text", "")) if isinstance(part, dict) else len(str(part))
+        else:
+            for part in getattr(item, "parts", None) or []:
+                total += len(getattr(part, "text", "") or "")
+    return total
+
+
+# Function to read a field from a request config given either as a dict or as an SDK config object
+def config_value(config, name, default=None):
+    if config is None:
+        return default
+    if isinstance(config, dict):
+        return config.get(name, default)
+    return getattr(config, name, default)
+
+
+class MockCachedContent:
+    def __init__(self, name, model, tokens, expire_time, display_name=None):
+        self.name = name
+        self.model = model
+        self.display_name = display_name
+        self.expire_time = expire_time
+        self.usage_metadata = type("CachedContentUsageMetadata", (), {"total_token_count": tokens})()
+        self.tokens = tokens
+
+
+# Simulated explicit context caching (`client.caches`), with TTLs measured on the client's clock
+class MockCaches:
+    def __init__(self, client):
+        self._client = client
+        self._store = {}
+        self._ids = itertools.count(1)
+
+    def _expire_time(self, ttl):
+        seconds = float(str(ttl).rstrip("s")) if ttl else 3600.0
+        return datetime.fromtimestamp(self._client.clock() + seconds, tz=timezone.utc)
+
+    def create(self, model, config=None):
+        client = self._client
+        tokens = max(1, (contents_length(config_value(config, "contents", []))
+                         + len(config_value(config, "system_instruction", "") or "")) // 4)
+        if tokens < client.min_cache_tokens:
+            raise MockAPIError(400, "INVALID_ARGUMENT", f"Cached content is too small. total_token_count={tokens}")
+        # Creating a cache processes the whole prompt once
+        time.sleep(client.latency_s + tokens / client.prompt_tokens_per_s)
+        name = f"cachedContents/mock-{next(self._ids)}"
+        cached = MockCachedContent(name, model, tokens, self._expire_time(config_value(config, "ttl")),
+                                   config_value(config, "display_name"))
+        self._store[name] = cached
+        return cached
+
+    def resolve(self, name):
+        cached = self._store.get(name)
+        if cached is None or cached.expire_time.timestamp() <= self._client.clock():
+            self._store.pop(name, None)
+            raise MockAPIError(403, "PERMISSION_DENIED", f"CachedContent not found (or permission denied): {name}")
+        return cached
+
+    def get(self, name):
+        return self.resolve(name)
+
+    def update(self, name, config=None):
+        cached = self.resolve(name)
+        cached.expire_time = self._expire_time(config_value(config, "ttl"))
+        return cached
+
+    def delete(self, name):
+        self._store.pop(name, None)
+
+    def list(self):
+        return list(self._store.values())
+
+
+# Simulated model endpoint with configurable latency, throughput and output size
+class MockModels:
+    def __init__(self, client):
+        self._client = client
+
+    def _build_text(self, output_tokens):
+        text = self._client.response_text or DEFAULT_RESPONSE
+        target_chars = output_tokens * 4
+        if len(text) >= target_chars:
+            return text[:target_chars]
+        repeats = target_chars // len(text) + 1
+        return (text * repeats)[:target_chars]
+
+    def _prompt_tokens(self, contents):
+        return max(1, contents_length(contents) // 4)
+
+    def _record(self, model):
+        with self._client._lock:
+            self._client.calls.append(model)
+
+    def _cached_tokens(self, config):
+        cache_name = config_value(config, "cached_content")
+        if not cache_name:
+            return 0
+        return self._client.caches.resolve(cache_name).tokens
+
+    def generate_content(self, model, contents, config=None, **kwargs):
+        self._record(model)
+        client = self._client
+        prompt_tokens = self._prompt_tokens(contents)
+        cached_tokens = self._cached_tokens(config)
+        output_tokens = client.output_tokens
+        # Time to first token grows with the uncached prompt size, then tokens arrive at `tokens_per_s`
+        delay = client.first_byte_latency() + prompt_tokens / client.prompt_tokens_per_s + output_tokens / client.tokens_per_s
+        if delay > 0:
+            time.sleep(delay)
+        return MockResponse(self._build_text(output_tokens), prompt_tokens + cached_tokens, output_tokens, cached_tokens)
+
+    def generate_content_stream(self, model, contents, config=None, **kwargs):
+        self._record(model)
+        first_delay, chunks = self._stream_plan(contents, config)
+        # Chunks arrive on a fixed schedule, like a network stream: time the caller spends on a chunk
+        # overlaps with the arrival of the next ones
+        arrival = time.perf_counter() + first_delay
+        for delay, response in chunks:
+            arrival += delay
+            time.sleep(max(0.0, arrival - time.perf_counter()))
+            yield response
+
+    def count_tokens(self, model, contents, **kwargs):
+        return type("CountTokensResponse", (), {"total_tokens": self._prompt_tokens(contents)})()
+
+    # Function to plan a streamed answer: delay before the first chunk, then (delay, response) per chunk
+    def _stream_plan(self, contents, config):
+        client = self._client
+        prompt_tokens = self._prompt_tokens(contents)
+        cached_tokens = self._cached_tokens(config)
+        text = self._build_text(client.output_tokens)
+        chunk_chars = client.chunk_tokens * 4
+        chunks = []
+        sent_tokens = 0
+        for start in range(0, len(text), chunk_chars):
+            chunk = text[start:start + chunk_chars]
+            chunk_tokens = max(1, len(chunk) // 4)
+            sent_tokens += chunk_tokens
+            chunks.append((chunk_tokens / client.tokens_per_s,
+                           MockResponse(chunk, prompt_tokens + cached_tokens, sent_tokens, cached_tokens)))
+        return client.first_byte_latency() + prompt_tokens / client.prompt_tokens_per_s, chunks
+
+
+# Async counterpart (`client.aio.models`) that waits with asyncio.sleep instead of blocking the thread
+class MockAsyncModels:
+    def __init__(self, models):
+        self._models = models
+
+    async def generate_content(self, model, contents, config=None, **kwargs):
+        models = self._models
+        models._record(model)
+        client = models._client
+        prompt_tokens = models._prompt_tokens(contents)
+        cached_tokens = models._cached_tokens(config)
+        output_tokens = client.output_tokens
+        await asyncio.sleep(client.first_byte_latency() + prompt_tokens / client.prompt_tokens_per_s + output_tokens / client.tokens_per_s)
+        return MockResponse(models._build_text(output_tokens), prompt_tokens + cached_tokens, output_tokens, cached_tokens)
+
+    async def generate_content_stream(self, model, contents, config=None, **kwargs):
+        self._models._record(model)
+        first_delay, chunks = self._models._stream_plan(contents, config)
+
+        async def stream():
+            arrival = time.perf_counter() + first_delay
+            for delay, response in chunks:
+                arrival += delay
+                await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+                yield response
+        return stream()
+
+
+class MockAsyncCaches:
+    def __init__(self, caches):
+        self._caches = caches
+
+    async def create(self, model, config=None):
+        return await asyncio.to_thread(self._caches.create, model=model, config=config)
+
+    async def get(self, name):
+        return self._caches.get(name)
+
+    async def update(self, name, config=None):
+        return self._caches.update(name, config=config)
+
+    async def delete(self, name):
+        self._caches.delete(name)
+
+
+class MockAio:
+    def __init__(self, client):
+        self.models = MockAsyncModels(client.models)
+        self.caches = MockAsyncCaches(client.caches)
+
+
+class MockClient:
+    def __init__(self, api_key=None, latency_s=0.05, tokens_per_s=200.0, prompt_tokens_per_s=50000.0,
+                 output_tokens=256, chunk_tokens=16, response_text=None, min_cache_tokens=4096,
+                 clock=time.time, slow_fraction=0.0, slow_latency_s=2.0, seed=None, **kwargs):
+        self.api_key = api_key
+        self.latency_s = latency_s
+        # A `slow_fraction` of the calls wait `slow_latency_s` longer (tail latency)
+        self.slow_fraction = slow_fraction
+        self.slow_latency_s = slow_latency_s
+        self._random = random.Random(seed)
+        self.tokens_per_s = tokens_per_s
+        self.prompt_tokens_per_s = prompt_tokens_per_s
+        self.output_tokens = output_tokens
+        self.chunk_tokens = chunk_tokens
+        self.response_text = response_text
+        self.min_cache_tokens = min_cache_tokens
+        self.clock = clock
+        self.calls = []
+        self._lock = threading.Lock()
+        self.models = MockModels(self)
+        self.caches = MockCaches(self)
+        self.aio = MockAio(self)
+
+    def first_byte_latency(self):
+        with self._lock:
+            slow = self.slow_fraction and self._random.random() < self.slow_fraction
+        return self.latency_s + (self.slow_latency_s if slow else 0.0)
+
+
+# Function to build a `genai.Client`-compatible factory with fixed mock settings
+def mock_client_factory(**settings):
+    def factory(api_key=None, **kwargs):
+        return MockClient(api_key=api_key, **settings)
+    return factory
+
+
+# Context manager that swaps `google.genai.Client` for the mock so unmodified app code runs offline
+@contextmanager
+def patched_genai_client(**settings):
+    from unittest import mock
+    from google import genai
+    with mock.patch.object(genai, "Client", mock_client_factory(**settings)):
+        yield
@@ -0,0 +1,212 @@
+import json
+import os
+import re
+import statistics
+import threading
+import time
+from collections import deque
+
+from job_queue import DATA_DIR
+from providers import contents_to_text
+from usage_tracking import estimate_contents_tokens
+
+
+# Gemini models requests may be routed between, smallest/fastest first, e.g.
+# "gemini-2.0-flash-lite,gemini-2.0-flash,gemini-1.5-pro" (empty: always the default model)
+MODEL_TIERS = [name.strip() for name in os.environ.get("DOCQA_MODELS", "").split(",") if name.strip()]
+# Prompts up to this many tokens may go to the smallest model; from LARGE_MODEL_MIN_TOKENS on they go to the largest
+SMALL_MODEL_MAX_TOKENS = int(os.environ.get("DOCQA_SMALL_MODEL_MAX_TOKENS", "4000"))
+LARGE_MODEL_MIN_TOKENS = int(os.environ.get("DOCQA_LARGE_MODEL_MIN_TOKENS", "100000"))
+# Questions scoring at least this complex go to the largest model
+COMPLEX_QUESTION_SCORE = float(os.environ.get("DOCQA_COMPLEX_QUESTION_SCORE", "0.6"))
+# One JSON line per routed request: the decision, then the measured latency, tokens and cost
+DECISION_LOG = os.environ.get("DOCQA_MODEL_DECISION_LOG", os.path.join(DATA_DIR, "model_decisions.jsonl"))
+# Past this many lines the log is moved to "<log>.1" (replacing the previous one) and restarted
+DECISION_LOG_MAX_ENTRIES = int(os.environ.get("DOCQA_MODEL_DECISION_LOG_MAX_ENTRIES", "100000"))
+
+# List prices in USD per million (input, output) tokens, used for the cost column of the decision log.
+# Cached input tokens are billed at a quarter of the input price.
+MODEL_PRICES_PER_MILLION = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+_SUMMARY_CUES = ("summar", "overview", "outline", "main points", "key points", "key findings", "tl;dr",
+                 "whole document", "entire document", "all sections", "each section")
+_REASONING_CUES = ("why", "how does", "how do", "compare", "comparison", "difference", "explain", "analy",
+                   "evaluate", "implication", "trade-off", "tradeoff", "pros and cons", "relationship", "impact")
+_LOOKUP_CUES = ("what is", "what's", "who", "when", "where", "which", "how many", "how much", "define", "name the")
+# Lookup cues only count as whole words ("whole" is not "who", "whenever" is not "when")
+_LOOKUP_PATTERNS = [re.compile(rf"\b{re.escape(cue)}\b") for cue in _LOOKUP_CUES]
+
+
+# Function to pull the user's question out of a routed request (prompts end with "Question: ...\nAnswer:")
+def extract_question(contents, config=None):
+    items = [contents] if isinstance(contents, str) else contents or []
+    last = contents_to_text(items[-1:]) if items else ""
+    match = None
+    for match in re.finditer(r"Question:\s*(.*?)\s*(?:\nAnswer:|$)", last, re.S):
+        pass
+    return match.group(1) if match else last[-1000:]
+
+
+# Function to estimate locally how demanding a question is: returns its kind ("lookup", "reasoning" or
+# "summary") and a score between 0 and 1
+def question_complexity(question):
+    text = " ".join(question.lower().split())
+    words = len(text.split())
+    summary = sum(cue in text for cue in _SUMMARY_CUES)
+    reasoning = sum(cue in text for cue in _REASONING_CUES)
+    lookup = sum(bool(pattern.search(text)) for pattern in _LOOKUP_PATTERNS)
+    parts = max(text.count("?"), 1) + len(re.findall(r"\b(?:and also|as well as|then)\b", text))
+    score = min(1.0, 0.25 * summary + 0.2 * reasoning + 0.1 * (parts - 1) + min(words, 60) / 150 - 0.1 * lookup)
+    kind = "summary" if summary else "reasoning" if reasoning else "lookup"
+    return kind, round(max(0.0, score), 3)
+
+
+# Function to price a generation from the list prices (None for unknown models)
+def estimate_cost(model, prompt_tokens, output_tokens, cached_tokens=0):
+    prices = MODEL_PRICES_PER_MILLION.get(model)
+    if prices is None:
+        return None
+    input_price, output_price = prices
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return round((uncached * input_price + cached_tokens * input_price / 4 + output_tokens * output_price) / 1e6, 8)
+
+
+# Picks one of the configured models per request from the prompt size and the question's complexity,
+# and logs every decision together with the latency and cost measured for it
+class ModelSelector:
+    def __init__(self, models, small_max_tokens=SMALL_MODEL_MAX_TOKENS, large_min_tokens=LARGE_MODEL_MIN_TOKENS,
+                 complex_score=COMPLEX_QUESTION_SCORE, log_path=DECISION_LOG, log_max_entries=DECISION_LOG_MAX_ENTRIES):
+        if not models:
+            raise ValueError("ModelSelector needs at least one model")
+        self.models = list(models)
+        self.small_max_tokens = small_max_tokens
+        self.large_min_tokens = large_min_tokens
+        self.complex_score = complex_score
+        self.log_path = log_path
+        self.log_max_entries = log_max_entries
+        self._log_lines = None
+        self._lock = threading.Lock()
+
+    # Function to choose the model for a request; returns the decision (model, reason and the inputs)
+    def choose(self, contents, config=None):
+        prompt_tokens = estimate_contents_tokens(contents)
+        kind, score = question_complexity(extract_question(contents, config))
+        smallest, largest = self.models[0], self.models[-1]
+        if (config or {}).get("cached_content"):
+            model, reason = None, "context cache (fixed model)"
+        elif prompt_tokens >= self.large_min_tokens:
+            model, reason = largest, "long context"
+        elif kind == "summary" and prompt_tokens > self.small_max_tokens:
+            model, reason = largest, "summary of a long input"
+        elif score >= self.complex_score:
+            model, reason = largest, "complex question"
+        elif kind == "lookup" and prompt_tokens <= self.small_max_tokens:
+            model, reason = smallest, "short lookup"
+        else:
+            model, reason = self.models[(len(self.models) - 1) // 2], "default tier"
+        return {"model": model, "reason": reason, "kind": kind, "complexity": score,
+                "estimated_prompt_tokens": prompt_tokens}
+
+    # Function to append a decision and its outcome (a providers.Generation, or the error) to the log
+    def record(self, decision, generation=None, error=None):
+        if not self.log_path or decision is None:
+            return
+        entry = dict(decision, time=round(time.time(), 3))
+        if generation is not None:
+            entry.update(
+                provider=generation.provider, used_model=generation.model, from_cache=generation.from_cache,
+                prompt_tokens=generation.prompt_tokens, output_tokens=generation.output_tokens,
+                cached_tokens=generation.cached_tokens, latency_s=round(generation.latency_s, 4),
+                first_token_s=None if generation.first_token_s is None else round(generation.first_token_s, 4),
+                cost_usd=0.0 if generation.from_cache else estimate_cost(
+                    generation.model, generation.prompt_tokens, generation.output_tokens, generation.cached_tokens
+                ),
+            )
+        if error is not None:
+            entry["error"] = type(error).__name__
+        line = json.dumps(entry) + "\n"
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        # One short append per line, so lines from several worker processes do not interleave
+        with self._lock:
+            self._rotate_log()
+            with open(self.log_path, "a") as f:
+                f.write(line)
+            self._log_lines += 1
+
+    # Function to move a full decision log aside. The line count kept here misses other processes' lines,
+    # so the file is counted again before it is moved (and a log another process just rotated is kept).
+    def _rotate_log(self):
+        if not self.log_max_entries:
+            self._log_lines = 0
+        elif self._log_lines is None or self._log_lines >= self.log_max_entries:
+            self._log_lines = _count_lines(self.log_path)
+            if self._log_lines >= self.log_max_entries:
+                try:
+                    os.replace(self.log_path, self.log_path + ".1")
+                except FileNotFoundError:
+                    pass
+                self._log_lines = 0
+
+
+# Function to count the lines of a file (0 when it does not exist)
+def _count_lines(path):
+    try:
+        with open(path, "rb") as f:
+            return sum(1 for _ in f)
+    except FileNotFoundError:
+        return 0
+
+
+# Function to create the selector configured by DOCQA_MODELS (None when no models are listed)
+def create_model_selector():
+    return ModelSelector(MODEL_TIERS) if MODEL_TIERS else None
+
+
+# Function to summarize the latest `max_entries` lines of a decision log (and its rotated part) per
+# (reason, model): requests, latency percentiles and cost
+def summarize_decisions(path=DECISION_LOG, max_entries=DECISION_LOG_MAX_ENTRIES):
+    lines = deque(maxlen=max_entries or None)
+    for part in (path + ".1", path):
+        if os.path.exists(part):
+            with open(part) as f:
+                lines.extend(f)
+    groups = {}
+    for line in lines:
+        entry = json.loads(line)
+        if "latency_s" not in entry or entry.get("from_cache"):
+            continue
+        groups.setdefault((entry["reason"], entry["used_model"]), []).append(entry)
+    summary = []
+    for (reason, model), entries in sorted(groups.items()):
+        latencies = sorted(entry["latency_s"] for entry in entries)
+        costs = [entry["cost_usd"] for entry in entries if entry.get("cost_usd") is not None]
+        summary.append({
+            "reason": reason,
+            "model": model,
+            "requests": len(entries),
+            "mean_prompt_tokens": round(statistics.fmean(entry["prompt_tokens"] for entry in entries)),
+            "p50_latency_s": latencies[len(latencies) // 2],
+            "p95_latency_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "mean_cost_usd": round(statistics.fmean(costs), 8) if costs else None,
+        })
+    return summary
+
+
+# Tune the thresholds from production data, e.g. `python model_selection.py .docqa/model_decisions.jsonl`
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize the model routing decision log.")
+    parser.add_argument("log", nargs="?", default=DECISION_LOG)
+    args = parser.parse_args()
+    for row in summarize_decisions(args.log):
+        print(f"{row['reason']:>28} {row['model']:>24}  {row['requests']:6d} requests  "
+              f"~{row['mean_prompt_tokens']} prompt tokens  p50 {row['p50_latency_s']:.3f} s  "
+              f"p95 {row['p95_latency_s']:.3f} s  mean cost ${row['mean_cost_usd']}")
@@ -0,0 +1,159 @@
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_engines import EmptyPages, open_pymupdf, pdf_source
+from shared_cache import SharedCache, cache_key
+
+
+# OCR of PDF pages without a text layer (scans). "auto" (default) runs it when pytesseract with its
+# tesseract binary and a rasterizer (PyMuPDF or pdf2image) are installed; "0" turns it off.
+OCR_MODE = os.environ.get("DOCQA_OCR", "auto").lower()
+OCR_LANGUAGE = os.environ.get("DOCQA_OCR_LANGUAGE", "eng")
+OCR_DPI = int(os.environ.get("DOCQA_OCR_DPI", "200"))
+OCR_WORKERS = int(os.environ.get("DOCQA_OCR_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Pages being rasterized/recognized at once per document (bounds the images held in memory)
+OCR_MAX_PENDING = 2 * OCR_WORKERS
+
+logger = logging.getLogger(__name__)
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+_CACHE = None
+_TESSERACT_FOUND = None
+
+
+# Function to tell whether OCR can run here: pytesseract and the tesseract binary it drives, plus one of
+# the rasterizers
+def ocr_available():
+    if OCR_MODE in ("0", "false", "no", "off"):
+        return False
+    has = lambda module: importlib.util.find_spec(module) is not None
+    return has("pytesseract") and (has("pymupdf") or has("pdf2image")) and _tesseract_found()
+
+
+# The pip package is only a wrapper: without the binary (e.g. no system package installed) every page fails
+def _tesseract_found():
+    global _TESSERACT_FOUND
+    if _TESSERACT_FOUND is None:
+        import pytesseract
+        try:
+            pytesseract.get_tesseract_version()
+            _TESSERACT_FOUND = True
+        except Exception as e:
+            logger.warning("OCR is disabled: the tesseract binary cannot be run (%s)", e)
+            _TESSERACT_FOUND = False
+    return _TESSERACT_FOUND
+
+
+def _get_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+        return _POOL
+
+
+def _get_cache():
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = SharedCache()
+    return _CACHE
+
+
+# Function to recognize the text of one PNG page image (runs in an OCR worker process)
+def recognize_png(png, language=OCR_LANGUAGE):
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(io.BytesIO(png)) as image:
+        return pytesseract.image_to_string(image, lang=language)
+
+
+# Renders single PDF pages to PNG with PyMuPDF if installed, otherwise with pdf2image (poppler). The PDF is
+# opened from its path or in-memory buffer (see pdf_engines.pdf_source), not copied.
+class PageRasterizer:
+    def __init__(self, stream, dpi=OCR_DPI):
+        self.dpi = dpi
+        self.document = None
+        if importlib.util.find_spec("pymupdf") is not None:
+            self.document = open_pymupdf(stream)
+        else:
+            self.source = pdf_source(stream)
+
+    def png(self, number):
+        if self.document is not None:
+            return self.document.load_page(number).get_pixmap(dpi=self.dpi, colorspace="gray").tobytes("png")
+        from pdf2image import convert_from_bytes, convert_from_path
+        convert = convert_from_path if isinstance(self.source, str) else convert_from_bytes
+        image = convert(self.source, dpi=self.dpi, first_page=number + 1, last_page=number + 1, grayscale=True)[0]
+        output = io.BytesIO()
+        image.save(output, format="PNG")
+        return output.getvalue()
+
+
+# Function to fill in empty pages of a PDF by OCR. Takes the page texts from the text engines and yields
+# them in order; pages with a text layer pass straight through, empty ones (see pdf_engines.EmptyPages:
+# blank pages, or nearly empty ones once most pages are) are rasterized and OCR'd in
+# the process pool (several at a time). Results are cached by a hash of the page image, so the same
+# scan is only recognized once across documents and worker processes.
+def ocr_empty_pages(stream, page_texts, cache=None, language=OCR_LANGUAGE, stats=None):
+    if not ocr_available():
+        yield from page_texts
+        return
+    cache = cache or _get_cache()
+    rasterizer = None
+    empty_pages = EmptyPages()
+    pending = deque()
+    for number, text in enumerate(page_texts):
+        if not empty_pages.needs_more(text):
+            pending.append(text)
+        else:
+            if rasterizer is None:
+                rasterizer = PageRasterizer(stream)
+            try:
+                png = rasterizer.png(number)
+            except Exception as e:
+                pending.append(_page_failed(number, e, stats))
+                continue
+            key = cache_key(hashlib.sha256(png).hexdigest(), language)
+            cached = cache.get_text("ocr", key)
+            if stats is not None:
+                stats["ocr_pages"] = stats.get("ocr_pages", 0) + 1
+                stats["ocr_cache_hits"] = stats.get("ocr_cache_hits", 0) + (cached is not None)
+            pending.append(cached if cached is not None else
+                           (number, key, _get_pool().submit(recognize_png, png, language)))
+        # Yield every page that is ready, and wait for the oldest one when too many are in flight
+        while pending and (_ready(pending[0]) or len(pending) > OCR_MAX_PENDING):
+            yield _resolve(pending.popleft(), cache, stats)
+    while pending:
+        yield _resolve(pending.popleft(), cache, stats)
+
+
+def _ready(item):
+    return isinstance(item, str) or item[2].done()
+
+
+# A page that cannot be OCR'd stays empty; the rest of the document is still indexed
+def _page_failed(number, error, stats):
+    logger.warning("OCR failed for page %d: %s: %s", number + 1, type(error).__name__, error)
+    if stats is not None:
+        stats["ocr_failures"] = stats.get("ocr_failures", 0) + 1
+    return ""
+
+
+def _resolve(item, cache, stats=None):
+    if isinstance(item, str):
+        return item
+    number, key, future = item
+    try:
+        text = future.result()
+    except Exception as e:
+        return _page_failed(number, e, stats)
+    cache.put_text("ocr", key, text)
+    return text
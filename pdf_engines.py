@@ -0,0 +1,216 @@
+import importlib.util
+import os
+
+
+# PDF text engine used first, and the engines tried (if installed) for pages it returns empty
+PDF_ENGINE = os.environ.get("DOCQA_PDF_ENGINE", "pypdf2").lower()
+PDF_FALLBACK_ENGINES = [
+    name.strip().lower()
+    for name in os.environ.get("DOCQA_PDF_FALLBACK_ENGINES", "pymupdf,pypdfium2,pdfminer,pypdf2").split(",")
+    if name.strip()
+]
+# Pages with fewer non-blank characters than this count as nearly empty (scans, images, broken text layers,
+# but also title pages, page numbers and section dividers)
+MIN_PAGE_CHARS = 16
+# Nearly empty pages only call for another engine once this many pages have been read, most of them nearly
+# empty (pages with no text at all always do)
+SPARSE_MIN_PAGES = 4
+
+
+# Function to tell whether a page's text is empty or nearly so
+def is_empty_page(text):
+    return len("".join((text or "").split())) < MIN_PAGE_CHARS
+
+
+# Decides, page by page, which pages need another engine (or OCR): pages with no text at all, and nearly
+# empty ones only once most of the pages read so far are nearly empty (a scan or a broken text layer). A title page or
+# divider in a PDF that has text is taken as it is, without loading another engine for it.
+class EmptyPages:
+    def __init__(self):
+        self.pages = 0
+        self.nearly_empty = 0
+
+    def needs_more(self, text):
+        self.pages += 1
+        if not is_empty_page(text):
+            return False
+        self.nearly_empty += 1
+        if not (text or "").strip():
+            return True
+        return self.pages >= SPARSE_MIN_PAGES and 2 * self.nearly_empty > self.pages
+
+
+# Function to read the whole PDF as bytes for engines that cannot read a file object (position restored)
+def read_pdf_bytes(stream):
+    if isinstance(stream, (bytes, bytearray, memoryview)):
+        return bytes(stream)
+    position = stream.tell()
+    stream.seek(0)
+    data = stream.read()
+    stream.seek(position)
+    return data
+
+
+# Function to hand a PDF to an engine that opens paths or bytes without copying it where possible: the
+# path of a file on disk (e.g. an upload in the blob store), or the buffer of an in-memory upload
+# (BytesIO.getvalue shares it); other streams are read into bytes
+def pdf_source(stream):
+    name = getattr(stream, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    if hasattr(stream, "getvalue"):
+        return stream.getvalue()
+    return read_pdf_bytes(stream)
+
+
+# Function to open a PDF with PyMuPDF. The module is imported as `pymupdf`: the `fitz` name can resolve to
+# an unrelated package of that name.
+def open_pymupdf(stream):
+    import pymupdf
+    source = pdf_source(stream)
+    return pymupdf.open(source) if isinstance(source, str) else pymupdf.open(stream=source, filetype="pdf")
+
+
+# A text extraction backend. `open(stream)` returns a document with `page_count` and `page_text(number)`;
+# pages are only parsed when asked for, so engines can be mixed page by page.
+class PdfEngine:
+    name = "engine"
+    module = None
+
+    def available(self):
+        return self.module is None or importlib.util.find_spec(self.module) is not None
+
+    def open(self, stream):
+        raise NotImplementedError
+
+
+class _PyPDF2Document:
+    def __init__(self, stream):
+        from PyPDF2 import PdfReader
+        self.reader = PdfReader(stream)
+        self.page_count = len(self.reader.pages)
+
+    def page_text(self, number):
+        return self.reader.pages[number].extract_text() or ""
+
+
+# Pure Python, always installed; slow, and reading order suffers on multi-column layouts
+class PyPDF2Engine(PdfEngine):
+    name = "pypdf2"
+    module = "PyPDF2"
+
+    def open(self, stream):
+        return _PyPDF2Document(stream)
+
+
+class _PyMuPDFDocument:
+    def __init__(self, stream):
+        self.document = open_pymupdf(stream)
+        self.page_count = self.document.page_count
+
+    def page_text(self, number):
+        # sort=True orders text blocks top-left to bottom-right instead of content-stream order
+        return self.document.load_page(number).get_text("text", sort=True) or ""
+
+
+# MuPDF (pip install pymupdf): much faster, with better reading order
+class PyMuPDFEngine(PdfEngine):
+    name = "pymupdf"
+    module = "pymupdf"
+
+    def open(self, stream):
+        return _PyMuPDFDocument(stream)
+
+
+class _PdfiumDocument:
+    def __init__(self, stream):
+        import pypdfium2
+        self.document = pypdfium2.PdfDocument(pdf_source(stream))
+        self.page_count = len(self.document)
+
+    def page_text(self, number):
+        page = self.document[number]
+        text_page = page.get_textpage()
+        try:
+            return text_page.get_text_range() or ""
+        finally:
+            text_page.close()
+            page.close()
+
+
+# PDFium (pip install pypdfium2): Chrome's PDF engine, fast
+class PdfiumEngine(PdfEngine):
+    name = "pypdfium2"
+    module = "pypdfium2"
+
+    def open(self, stream):
+        return _PdfiumDocument(stream)
+
+
+class _PdfMinerDocument:
+    def __init__(self, stream):
+        from pdfminer.pdfpage import PDFPage
+        self.stream = stream
+        self.stream.seek(0)
+        self.page_count = sum(1 for _ in PDFPage.get_pages(stream))
+
+    def page_text(self, number):
+        from pdfminer.high_level import extract_text
+        self.stream.seek(0)
+        return extract_text(self.stream, page_numbers=[number]) or ""
+
+
+# pdfminer.six (pip install pdfminer.six): slowest, but its layout analysis orders columns well
+class PdfMinerEngine(PdfEngine):
+    name = "pdfminer"
+    module = "pdfminer"
+
+    def open(self, stream):
+        return _PdfMinerDocument(stream)
+
+
+PDF_ENGINES = {engine.name: engine for engine in (PyPDF2Engine(), PyMuPDFEngine(), PdfiumEngine(), PdfMinerEngine())}
+
+
+# Function to look up an engine by name (ValueError if unknown, ImportError if not installed)
+def get_pdf_engine(name):
+    engine = PDF_ENGINES.get(name)
+    if engine is None:
+        raise ValueError(f"Unknown PDF engine: {name} (expected one of {', '.join(PDF_ENGINES)})")
+    if not engine.available():
+        raise ImportError(f"PDF engine {name} is not installed")
+    return engine
+
+
+# Function to lazily yield the text of each PDF page with `engine`. When a page comes back empty (see
+# EmptyPages), the installed fallback engines are tried on that page; the first one that finds text is
+# used for the rest of the document. `stats`, if given, receives the engine used per page and the fallbacks taken.
+def iter_pdf_page_texts(stream, engine=None, fallbacks=None, stats=None):
+    primary = get_pdf_engine(engine or PDF_ENGINE)
+    names = PDF_FALLBACK_ENGINES if fallbacks is None else fallbacks
+    candidates = [primary] + [PDF_ENGINES[name] for name in names
+                              if name in PDF_ENGINES and name != primary.name and PDF_ENGINES[name].available()]
+    opened = {primary.name: primary.open(stream)}
+    current = primary
+    empty_pages = EmptyPages()
+    if stats is not None:
+        stats.setdefault("pages", {})
+        stats.setdefault("fallbacks", [])
+    for number in range(opened[primary.name].page_count):
+        text = opened[current.name].page_text(number)
+        used = current
+        if empty_pages.needs_more(text):
+            for other in candidates:
+                if other is current:
+                    continue
+                if other.name not in opened:
+                    opened[other.name] = other.open(stream)
+                other_text = opened[other.name].page_text(number)
+                if not is_empty_page(other_text):
+                    if stats is not None:
+                        stats["fallbacks"].append((number, current.name, other.name))
+                    text, used, current = other_text, other, other
+                    break
+        if stats is not None:
+            stats["pages"][used.name] = stats["pages"].get(used.name, 0) + 1
+        yield text
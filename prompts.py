@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+
+
+DOCUMENT_QA_PERSONA = "You are a helpful assistant trained to provide detailed, well-structured answers based on the content of the document."
+
+DOCUMENT_QA_EXAMPLES = """
+    Example 1:
+    Document: "Python is a high-level programming language that is easy to learn and use."
+    Question: "What is Python?"
+    Answer: "Python is a high-level programming language known for its simplicity and readability."
+
+    Example 2:
+    Document: "Machine learning is a subset of artificial intelligence where computers learn from data."
+    Question: "What is machine learning?"
+    Answer: "Machine learning is a branch of artificial intelligence where algorithms use data to improve their performance over time."
+    """
+
+# Instructions sent once per conversation (as the system instruction) instead of with every question
+DOCUMENT_QA_SYSTEM_INSTRUCTION = (
+    f"{DOCUMENT_QA_PERSONA} Below are a few examples of how I answer questions based on document content:\n"
+    f"{DOCUMENT_QA_EXAMPLES}\n\n"
+    "Document excerpts are provided in the conversation as they become relevant. "
+    "Answer each question from those excerpts and the earlier conversation."
+)
+
+
+# Seconds a provider keeps a prefix it has been sent in its prompt cache (Gemini implicit caching and OpenAI
+# prompt caching keep them for a few minutes); a request repeating a prefix within this window is a prefix hit
+PREFIX_REUSE_WINDOW_S = float(os.environ.get("DOCQA_PREFIX_REUSE_WINDOW_S", "300"))
+
+
+# A prompt made of a static prefix (rendered once, when the template is created), the request's bodies
+# (document text, excerpts, code) passed as separate parts so they are never copied into a new string, and
+# a short dynamic tail. The static prefix always comes first, so a provider-side prefix cache can serve it.
+class PromptTemplate:
+    def __init__(self, name, prefix, tail="", separator="\n\n"):
+        self.name = name
+        self.prefix = prefix
+        self.tail = tail
+        self.separator = separator
+
+    # Function to build the parts of a request: the prefix, the non-empty bodies, then the tail
+    def parts(self, *bodies, **values):
+        parts = [{"text": self.prefix}] if self.prefix else []
+        first = True
+        for body in bodies:
+            if not body:
+                continue
+            if not first:
+                parts.append({"text": self.separator})
+            parts.append({"text": body})
+            first = False
+        if self.tail:
+            parts.append({"text": self.tail.format(**values)})
+        return parts
+
+    # Function to render the prompt as one string (for local models that take plain text)
+    def render(self, *bodies, **values):
+        return render_prompt(self.parts(*bodies, **values))
+
+
+# Function to join prompt parts into one string
+def render_prompt(parts):
+    return parts if isinstance(parts, str) else "".join(part["text"] for part in parts)
+
+
+# Function to wrap a prompt (a string or a list of parts) as the `contents` of a single-message request
+def prompt_contents(prompt):
+    return [{"parts": [{"text": prompt}] if isinstance(prompt, str) else prompt}]
+
+
+# The prompt templates and static prefixes (system instructions) of the app. Every routed request is
+# observed: the prefix it starts with, whether the same model was sent that prefix within
+# PREFIX_REUSE_WINDOW_S (a prefix hit: the part of the traffic a provider-side prefix cache can serve), and
+# the cached tokens the provider reports.
+class PromptRegistry:
+    def __init__(self, reuse_window_s=PREFIX_REUSE_WINDOW_S):
+        self.reuse_window_s = reuse_window_s
+        self.templates = {}
+        self._prefixes = {}
+        self._prefix_lengths = set()
+        self._last_sent = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, prefix, tail="", separator="\n\n"):
+        template = PromptTemplate(name, prefix, tail, separator)
+        self.templates[name] = template
+        self.register_prefix(name, prefix)
+        return template
+
+    def register_prefix(self, name, text):
+        self._prefixes[text] = name
+        self._prefix_lengths.add(len(text))
+        return text
+
+    def __getitem__(self, name):
+        return self.templates[name]
+
+    def _prefix_name(self, text):
+        # Comparing lengths first avoids hashing large unregistered parts such as document text
+        if isinstance(text, str) and len(text) in self._prefix_lengths:
+            return self._prefixes.get(text)
+        return None
+
+    # Function to name the static prefix a request starts with: the context cache it references, its
+    # system instruction, or the first part of its first message (None if it starts with dynamic text)
+    def prefix_of(self, contents, config=None):
+        config = config or {}
+        if config.get("cached_content"):
+            return "context_cache"
+        name = self._prefix_name(config.get("system_instruction"))
+        if name or not isinstance(contents, list) or not contents:
+            return name
+        first = contents[0]
+        parts = first.get("parts") if isinstance(first, dict) else None
+        if parts and isinstance(parts[0], dict):
+            return self._prefix_name(parts[0].get("text"))
+        return None
+
+    # Function to record a request sent to `model` and the generation it produced
+    def observe(self, model, contents, config=None, generation=None):
+        name = self.prefix_of(contents, config)
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats.setdefault(name or "(none)", {
+                "requests": 0, "prefix_hits": 0, "prompt_tokens": 0, "cached_tokens": 0,
+            })
+            stats["requests"] += 1
+            if name is not None:
+                last = self._last_sent.get((model, name))
+                if last is not None and now - last <= self.reuse_window_s:
+                    stats["prefix_hits"] += 1
+                self._last_sent[(model, name)] = now
+            if generation is not None and not generation.estimated:
+                stats["prompt_tokens"] += generation.prompt_tokens
+                stats["cached_tokens"] += generation.cached_tokens
+
+    def snapshot(self):
+        with self._lock:
+            by_prefix = {name: dict(stats) for name, stats in self._stats.items()}
+        for stats in by_prefix.values():
+            stats["prefix_hit_rate"] = round(stats["prefix_hits"] / stats["requests"], 3)
+            stats["cached_token_fraction"] = (
+                round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else None
+            )
+        requests = sum(stats["requests"] for stats in by_prefix.values())
+        hits = sum(stats["prefix_hits"] for stats in by_prefix.values())
+        return {
+            "requests": requests,
+            "prefix_hits": hits,
+            "prefix_hit_rate": round(hits / requests, 3) if requests else None,
+            "by_prefix": by_prefix,
+        }
+
+
+PROMPTS = PromptRegistry()
+PROMPTS.register_prefix("document_qa_system", DOCUMENT_QA_SYSTEM_INSTRUCTION)
+
+FEW_SHOT_DOCUMENT_QA = PROMPTS.register(
+    "document_qa_few_shot",
+    f"{DOCUMENT_QA_PERSONA} Below are a few examples of how I answer questions based on document content:\n"
+    f"{DOCUMENT_QA_EXAMPLES}\n\nDocument: ",
+    "\nQuestion: {question}\nAnswer:",
+)
+CONVERSATION_SUMMARY = PROMPTS.register(
+    "conversation_summary",
+    "Condense the following conversation about a document into a short summary that keeps every fact, "
+    "name, number and conclusion needed to answer follow-up questions.\n\n",
+    "\n\nSummary:",
+)
+SECTION_SUMMARY = PROMPTS.register(
+    "section_summary",
+    "Summarize the following part of a document in a few concise paragraphs. "
+    "Keep key facts, names, numbers and conclusions.\n\nDocument part:\n",
+    "\n\nSummary:",
+)
+DOCUMENT_SUMMARY = PROMPTS.register(
+    "document_summary",
+    "The following are summaries of consecutive parts of one document. "
+    "Write a single well-structured summary of the whole document.\n\n",
+    "\n\nSummary:",
+)
+DIGEST_SECTION = PROMPTS.register(
+    "digest_section",
+    "Summarize the following section of a document in at most 120 words. "
+    "Keep key facts, names, numbers and conclusions.\n\n",
+    "\n\nSummary:",
+)
+DIGEST_OVERVIEW = PROMPTS.register(
+    "digest_overview",
+    "The following are summaries of the sections of one document, in order. "
+    "Write an overview of the whole document in at most 250 words: what it is about, "
+    "its main points and its conclusions.\n\n",
+    "\n\nOverview:",
+)
+CODE_DOCUMENTATION = PROMPTS.register(
+    "code_documentation",
+    "Can you generate documentation for the following code snippet?\n\n---\n\n",
+)
+# Turns sit after the conversation history, so their (tiny) prefix is not a cacheable one
+CONVERSATION_TURN = PromptTemplate("conversation_turn", "Document:\n", "\n\nQuestion: {question}\nAnswer:")
+CONVERSATION_PREAMBLE = PromptTemplate("conversation_preamble", "")
+
+
+# Function to build the few-shot document Q&A prompt as parts (the document is not copied)
+def build_few_shot_document_prompt(document_text, question):
+    return FEW_SHOT_DOCUMENT_QA.parts(document_text, question=question)
+
+# Function to generate document answer with few-shot prompting (as one string)
+def generate_document_answer_with_few_shot(document_text, question):
+    return FEW_SHOT_DOCUMENT_QA.render(document_text, question=question)
+
+# Function to build the leading message of a conversation: the document overview, the excerpts carried
+# over from summarized turns and the rolling summary (an empty list if there is none of them)
+def build_conversation_preamble(overview, excerpts, summary):
+    return CONVERSATION_PREAMBLE.parts(
+        f"Document overview:\n{overview}" if overview else "",
+        "Document:" if excerpts else "",
+        *excerpts,
+        f"Summary of the conversation so far:\n{summary}" if summary else "",
+    )
+
+# Function to build one conversation turn: only the document excerpts not sent before, then the question
+def build_conversation_turn(excerpts, question):
+    if excerpts:
+        return CONVERSATION_TURN.parts(*excerpts, question=question)
+    return [{"text": f"Question: {question}\nAnswer:"}]
+
+# Function to build the prompt asking to fold earlier turns into the rolling conversation summary
+def build_summary_prompt(previous_summary, transcript):
+    summary_part = f"Summary so far:\n{previous_summary}" if previous_summary else ""
+    return CONVERSATION_SUMMARY.parts(summary_part, f"Conversation:\n{transcript}")
+
+# Function to build the prompt summarizing one part of a long document from its chunk texts
+def build_section_summary_prompt(texts):
+    return SECTION_SUMMARY.parts(*texts)
+
+# Function to build the prompt summarizing one section of a document for its ingest-time digest
+def build_digest_section_prompt(section, texts):
+    return DIGEST_SECTION.parts(f"Section: {section}", *texts)
+
+# Function to build the prompt turning the section summaries of a digest into a short document overview
+def build_digest_overview_prompt(section_summaries):
+    return DIGEST_OVERVIEW.parts(section_summaries)
+
+# Function to build the prompt combining partial summaries into one document summary
+def build_document_summary_prompt(partial_summaries):
+    return DOCUMENT_SUMMARY.parts(*partial_summaries)
+
+# Function to build the prompt asking for documentation of a code snippet
+def build_code_documentation_prompt(code_input):
+    return CODE_DOCUMENTATION.parts(code_input)
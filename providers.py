@@ -0,0 +1,917 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from dataclasses import dataclass, field
+
+from context_cache import CACHE_MODEL
+from engine import DEFAULT_MODEL, answer_cache_key, response_text
+from shared_cache import ANSWER_CACHE_TTL_SECONDS
+from usage_tracking import estimate_contents_tokens, estimate_tokens, read_usage_metadata
+
+
+# Providers the router may use, in order of preference ("gemini", "openai", "local", "echo")
+PROVIDERS = [name.strip() for name in os.environ.get("DOCQA_PROVIDERS", "gemini").split(",") if name.strip()]
+OPENAI_MODEL = os.environ.get("DOCQA_OPENAI_MODEL", "gpt-3.5-turbo")
+# Prompts up to this many tokens go to the fastest provider; longer ones to the largest context window
+SHORT_PROMPT_TOKENS = int(os.environ.get("DOCQA_SHORT_PROMPT_TOKENS", "2000"))
+# Tokens kept free in the context window for the answer when checking whether a prompt fits
+OUTPUT_TOKEN_RESERVE = 1024
+# Hedging (see HedgePolicy) is off unless enabled
+HEDGE_ENABLED = os.environ.get("DOCQA_HEDGE", "").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.environ.get("DOCQA_HEDGE_PERCENTILE", "95"))
+HEDGE_MAX_EXTRA_FRACTION = float(os.environ.get("DOCQA_HEDGE_MAX_EXTRA", "0.05"))
+# Optional faster Gemini model for the duplicate request (default: the same model)
+HEDGE_MODEL = os.environ.get("DOCQA_HEDGE_MODEL", "")
+# Latency samples needed before a provider's percentile is trusted
+HEDGE_MIN_SAMPLES = 20
+# Context windows of the Gemini models we know about (others get 1M tokens)
+GEMINI_CONTEXT_WINDOWS = {
+    "gemini-1.5-pro": 2_097_152,
+    "gemini-2.5-pro": 1_048_576,
+    "gemini-2.0-flash": 1_048_576,
+    "gemini-2.0-flash-lite": 1_048_576,
+    "gemini-1.5-flash": 1_048_576,
+}
+# HTTP status codes worth retrying (on another provider if there is one)
+TRANSIENT_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+# The result of one generation, whichever provider produced it
+@dataclass
+class Generation:
+    text: str
+    provider: str
+    model: str
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    latency_s: float = 0.0
+    first_token_s: float = None
+    estimated: bool = False
+    from_cache: bool = False
+    # Usage of the hedged duplicates that lost the race (billed too; see ProviderRouter._call)
+    hedge_losers: list = field(default_factory=list)
+
+
+# Function to flatten Gemini-style `contents` (plus the system instruction) into one prompt string
+def contents_to_text(contents, config=None):
+    lines = []
+    system_instruction = (config or {}).get("system_instruction")
+    if system_instruction:
+        lines.append(system_instruction)
+    if isinstance(contents, str):
+        contents = [contents]
+    for item in contents or []:
+        if isinstance(item, str):
+            lines.append(item)
+            continue
+        # The parts of one message are consecutive pieces of the same text (see prompts.PromptTemplate)
+        lines.append("".join(part.get("text", "") if isinstance(part, dict) else str(part)
+                             for part in item.get("parts", [])))
+    return "\n\n".join(line for line in lines if line)
+
+
+# Function to convert Gemini-style `contents` into OpenAI chat messages
+def to_openai_messages(contents, config=None):
+    messages = []
+    system_instruction = (config or {}).get("system_instruction")
+    if system_instruction:
+        messages.append({"role": "system", "content": system_instruction})
+    if isinstance(contents, str):
+        contents = [contents]
+    for item in contents or []:
+        if isinstance(item, str):
+            messages.append({"role": "user", "content": item})
+            continue
+        role = "assistant" if item.get("role") == "model" else "user"
+        text = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in item.get("parts", []))
+        messages.append({"role": role, "content": text})
+    return messages
+
+
+# Function to tell whether an error is worth retrying (rate limits, timeouts, server errors)
+def is_transient_error(error):
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in TRANSIENT_STATUS_CODES:
+        return True
+    return isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError))
+
+
+# A streamed generation: iterate it for text pieces; `generation` is set once the stream is exhausted.
+# Backends yield str pieces and, optionally, a final usage dict.
+class GenerationStream:
+    def __init__(self, provider, chunks, contents, config=None):
+        self.provider = provider
+        self.contents = contents
+        self.config = config
+        self.generation = None
+        self._chunks = chunks
+        self._start = time.perf_counter()
+        self._first_token_s = None
+        self._pieces = []
+        self._usage = None
+
+    def _take(self, item):
+        if isinstance(item, dict):
+            self._usage = item
+            return None
+        if not item:
+            return None
+        if self._first_token_s is None:
+            self._first_token_s = time.perf_counter() - self._start
+        self._pieces.append(item)
+        return item
+
+    def _finish(self):
+        self.generation = self.provider.make_generation(
+            "".join(self._pieces), self._usage, time.perf_counter() - self._start,
+            self.contents, self.config, first_token_s=self._first_token_s,
+        )
+
+    def __iter__(self):
+        for item in self._chunks:
+            piece = self._take(item)
+            if piece:
+                yield piece
+        self._finish()
+
+    # Function to end the stream early (e.g. a hedged request that lost): the backend's stream is closed,
+    # which ends the request, and `generation` covers the pieces received so far
+    def stop(self):
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+        self._finish()
+        return self.generation
+
+    async def astop(self):
+        aclose = getattr(self._chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        self._finish()
+        return self.generation
+
+    async def __aiter__(self):
+        async for item in self._chunks:
+            piece = self._take(item)
+            if piece:
+                yield piece
+        self._finish()
+
+
+# Common interface of every backend. Requests use the Gemini `contents`/`config` shape used across
+# the app; backends translate it. Subclasses implement `_generate` and, where the SDK allows,
+# `_agenerate`, `_stream_chunks` and `_astream_chunks`.
+class Provider:
+    name = "provider"
+    # Rough latency used for routing until real calls have been measured
+    expected_latency_s = 1.0
+
+    def __init__(self, model, context_window):
+        self.model = model
+        self.context_window = context_window
+
+    def __repr__(self):
+        return f"{self.name}:{self.model}"
+
+    # Function to tell whether this provider can serve a request config (e.g. a Gemini context cache)
+    def supports(self, config=None):
+        return not (config or {}).get("cached_content")
+
+    def fits(self, prompt_tokens):
+        return prompt_tokens + OUTPUT_TOKEN_RESERVE <= self.context_window
+
+    def make_generation(self, text, usage, latency_s, contents, config=None, first_token_s=None, model=None):
+        estimated = not usage or not (usage.get("prompt_tokens") or usage.get("output_tokens"))
+        if estimated:
+            usage = {
+                "prompt_tokens": estimate_tokens(contents_to_text(contents, config)),
+                "output_tokens": estimate_tokens(text or ""),
+                "cached_tokens": 0,
+            }
+        return Generation(
+            text=text, provider=self.name, model=model or self.model, latency_s=latency_s,
+            first_token_s=latency_s if first_token_s is None else first_token_s, estimated=estimated,
+            prompt_tokens=usage.get("prompt_tokens", 0), output_tokens=usage.get("output_tokens", 0),
+            cached_tokens=usage.get("cached_tokens", 0),
+        )
+
+    def generate(self, contents, config=None):
+        start = time.perf_counter()
+        text, usage = self._generate(contents, config)
+        return self.make_generation(text, usage, time.perf_counter() - start, contents, config)
+
+    async def agenerate(self, contents, config=None):
+        start = time.perf_counter()
+        text, usage = await self._agenerate(contents, config)
+        return self.make_generation(text, usage, time.perf_counter() - start, contents, config)
+
+    # Function to generate, stopping early once the `cancelled` event is set (a hedged request that lost).
+    # Backends streaming natively stop at their next piece; others cannot be interrupted and run to the end.
+    def generate_cancellable(self, contents, config, cancelled):
+        if not self.streams_natively:
+            return self.generate(contents, config)
+        stream = self.stream(contents, config)
+        for _ in stream:
+            if cancelled.is_set():
+                return stream.stop()
+        return stream.generation
+
+    @property
+    def streams_natively(self):
+        return type(self)._stream_chunks is not Provider._stream_chunks
+
+    def stream(self, contents, config=None):
+        return GenerationStream(self, self._stream_chunks(contents, config), contents, config)
+
+    def astream(self, contents, config=None):
+        return GenerationStream(self, self._astream_chunks(contents, config), contents, config)
+
+    def _generate(self, contents, config):
+        raise NotImplementedError
+
+    async def _agenerate(self, contents, config):
+        return await asyncio.to_thread(self._generate, contents, config)
+
+    # Backends without native streaming deliver the whole answer as one piece
+    def _stream_chunks(self, contents, config):
+        text, usage = self._generate(contents, config)
+        yield text or ""
+        if usage:
+            yield usage
+
+    async def _astream_chunks(self, contents, config):
+        text, usage = await self._agenerate(contents, config)
+        yield text or ""
+        if usage:
+            yield usage
+
+
+# Google Gemini through a `genai.Client` (or the mock client). Requests referencing a context cache
+# are sent to `cache_model`, the versioned model the cache was created for.
+class GeminiProvider(Provider):
+    name = "gemini"
+    expected_latency_s = 1.0
+
+    def __init__(self, client, model=DEFAULT_MODEL, context_window=1_048_576, cache_model=CACHE_MODEL):
+        super().__init__(model, context_window)
+        self.client = client
+        self.cache_model = cache_model
+
+    def supports(self, config=None):
+        return True
+
+    def _model_for(self, config):
+        return self.cache_model if (config or {}).get("cached_content") else self.model
+
+    def generate(self, contents, config=None):
+        start = time.perf_counter()
+        model = self._model_for(config)
+        response = self.client.models.generate_content(model=model, contents=contents, config=config)
+        return self.make_generation(response_text(response), read_usage_metadata(response),
+                                    time.perf_counter() - start, contents, config, model=model)
+
+    async def agenerate(self, contents, config=None):
+        start = time.perf_counter()
+        model = self._model_for(config)
+        response = await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+        return self.make_generation(response_text(response), read_usage_metadata(response),
+                                    time.perf_counter() - start, contents, config, model=model)
+
+    def _stream_chunks(self, contents, config):
+        last = None
+        for chunk in self.client.models.generate_content_stream(
+            model=self._model_for(config), contents=contents, config=config
+        ):
+            last = chunk
+            yield chunk.text or ""
+        usage = read_usage_metadata(last)
+        if usage:
+            yield usage
+
+    async def _astream_chunks(self, contents, config):
+        last = None
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self._model_for(config), contents=contents, config=config
+        )
+        async for chunk in stream:
+            last = chunk
+            yield chunk.text or ""
+        usage = read_usage_metadata(last)
+        if usage:
+            yield usage
+
+
+# OpenAI chat completions (the path used by streamlitApp.py)
+class OpenAIProvider(Provider):
+    name = "openai"
+    expected_latency_s = 1.5
+
+    def __init__(self, client, model=OPENAI_MODEL, context_window=16_385, async_client=None):
+        super().__init__(model, context_window)
+        self.client = client
+        self._async_client = async_client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(api_key=self.client.api_key)
+        return self._async_client
+
+    @staticmethod
+    def _usage(usage):
+        if usage is None:
+            return None
+        return {"prompt_tokens": usage.prompt_tokens or 0, "output_tokens": usage.completion_tokens or 0, "cached_tokens": 0}
+
+    def _generate(self, contents, config):
+        completion = self.client.chat.completions.create(model=self.model, messages=to_openai_messages(contents, config))
+        return completion.choices[0].message.content, self._usage(completion.usage)
+
+    async def _agenerate(self, contents, config):
+        completion = await self.async_client.chat.completions.create(
+            model=self.model, messages=to_openai_messages(contents, config)
+        )
+        return completion.choices[0].message.content, self._usage(completion.usage)
+
+    def _stream_chunks(self, contents, config):
+        stream = self.client.chat.completions.create(
+            model=self.model, messages=to_openai_messages(contents, config),
+            stream=True, stream_options={"include_usage": True},
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                yield self._usage(chunk.usage)
+
+    async def _astream_chunks(self, contents, config):
+        stream = await self.async_client.chat.completions.create(
+            model=self.model, messages=to_openai_messages(contents, config),
+            stream=True, stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                yield self._usage(chunk.usage)
+
+
+# Local Hugging Face model through local_generation (quantization and micro-batching apply)
+class LocalProvider(Provider):
+    name = "local"
+    expected_latency_s = 30.0
+
+    def __init__(self, model=None, context_window=2048, max_length=512, precision=None):
+        from local_generation import LOCAL_PRECISION, REPORT_MODEL
+        super().__init__(model or REPORT_MODEL, context_window)
+        self.max_length = max_length
+        self.precision = precision or LOCAL_PRECISION
+
+    def _generate(self, contents, config):
+        from local_generation import generate_with_stats
+        prompt = contents_to_text(contents, config)
+        # Prompts near the window still get 64 new tokens; the batcher buckets the per-request limit
+        text, stats = generate_with_stats(
+            self.model, prompt, self.precision, max_new_tokens=max(64, self.max_length - estimate_tokens(prompt))
+        )
+        # The pipeline returns the prompt followed by the continuation
+        answer = text[len(prompt):].lstrip() if text.startswith(prompt) else text
+        return answer, {"prompt_tokens": estimate_tokens(prompt), "output_tokens": stats["new_tokens"], "cached_tokens": 0}
+
+
+# Offline backend that answers with the last user message (tests, demos, load tests without a key)
+class EchoProvider(Provider):
+    name = "echo"
+    expected_latency_s = 0.0
+
+    def __init__(self, model="echo", context_window=10 ** 9, latency_s=0.0):
+        super().__init__(model, context_window)
+        self.latency_s = latency_s
+
+    def _answer(self, contents, config):
+        items = [contents] if isinstance(contents, str) else contents or []
+        last = items[-1] if items else ""
+        return f"Echo: {contents_to_text([last])}"
+
+    def _generate(self, contents, config):
+        time.sleep(self.latency_s)
+        return self._answer(contents, config), None
+
+    async def _agenerate(self, contents, config):
+        await asyncio.sleep(self.latency_s)
+        return self._answer(contents, config), None
+
+    def _stream_chunks(self, contents, config):
+        time.sleep(self.latency_s)
+        for word in self._answer(contents, config).split(" "):
+            yield word + " "
+
+    async def _astream_chunks(self, contents, config):
+        await asyncio.sleep(self.latency_s)
+        for word in self._answer(contents, config).split(" "):
+            yield word + " "
+
+
+# Per-provider request counts, errors, tokens, moving averages and recent samples of latency, shared by routers
+class ProviderMetrics:
+    def __init__(self, alpha=0.2, window=500):
+        self.alpha = alpha
+        self.window = window
+        self.providers = {}
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, key):
+        return self.providers.setdefault(key, {
+            "requests": 0, "errors": 0, "cache_hits": 0, "prompt_tokens": 0, "output_tokens": 0,
+            "latency_s": None, "first_token_s": None, "hedges": 0, "hedge_wins": 0,
+            "hedge_loser_tokens": 0,
+        })
+
+    def _average(self, previous, value):
+        return value if previous is None else previous + self.alpha * (value - previous)
+
+    def _sample(self, key, kind, value):
+        self.samples.setdefault((key, kind), deque(maxlen=self.window)).append(value)
+
+    def observe(self, provider, generation):
+        key = repr(provider)
+        with self._lock:
+            entry = self._entry(key)
+            entry["requests"] += 1
+            entry["prompt_tokens"] += generation.prompt_tokens
+            entry["output_tokens"] += generation.output_tokens
+            entry["latency_s"] = self._average(entry["latency_s"], generation.latency_s)
+            entry["first_token_s"] = self._average(entry["first_token_s"], generation.first_token_s)
+            self._sample(key, "latency_s", generation.latency_s)
+            self._sample(key, "first_token_s", generation.first_token_s)
+
+    def observe_error(self, provider):
+        with self._lock:
+            self._entry(repr(provider))["errors"] += 1
+
+    def observe_cache_hit(self, router):
+        with self._lock:
+            self._entry(repr(router))["cache_hits"] += 1
+
+    def observe_hedge(self, provider, won):
+        with self._lock:
+            entry = self._entry(repr(provider))
+            entry["hedges"] += 1
+            entry["hedge_wins"] += int(won)
+
+    # Function to count the tokens spent by a hedged request that lost (not a latency sample)
+    def observe_hedge_loser(self, provider, generation):
+        with self._lock:
+            entry = self._entry(repr(provider))
+            entry["prompt_tokens"] += generation.prompt_tokens
+            entry["output_tokens"] += generation.output_tokens
+            entry["hedge_loser_tokens"] += generation.prompt_tokens + generation.output_tokens
+
+    def expected_latency(self, provider):
+        with self._lock:
+            entry = self.providers.get(repr(provider))
+            if entry and entry["latency_s"] is not None:
+                return entry["latency_s"]
+        return provider.expected_latency_s
+
+    # Function to get a latency percentile ("latency_s" or "first_token_s") over the recent samples
+    # (None until there are `min_samples` of them)
+    def percentile(self, provider, kind, percentile, min_samples=1):
+        with self._lock:
+            samples = sorted(self.samples.get((repr(provider), kind), ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(entry) for key, entry in self.providers.items()}
+
+
+# When to hedge: a request that has not answered (or, for streams, produced its first piece) by the
+# provider's `percentile` latency gets a duplicate, sent to `backup` (e.g. a faster model) if given,
+# otherwise to the next candidate provider or the same one. The first to answer wins and the other is
+# cancelled (a synchronous call can only be stopped if its backend streams); what the loser spent is still
+# counted. Hedges are capped at `max_extra_fraction` of the requests seen.
+class HedgePolicy:
+    def __init__(self, percentile=HEDGE_PERCENTILE, max_extra_fraction=HEDGE_MAX_EXTRA_FRACTION,
+                 min_samples=HEDGE_MIN_SAMPLES, backup=None):
+        self.percentile = percentile
+        self.max_extra_fraction = max_extra_fraction
+        self.min_samples = min_samples
+        self.backup = backup
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def deadline(self, metrics, provider, kind="latency_s"):
+        with self._lock:
+            self.requests += 1
+        return metrics.percentile(provider, kind, self.percentile, self.min_samples)
+
+    # Quota guard: take one hedge if that keeps hedges within the allowed fraction of requests
+    def try_acquire(self):
+        with self._lock:
+            if self.hedges + 1 > self.max_extra_fraction * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def backup_for(self, provider, candidates, config=None):
+        if self.backup is not None and self.backup.supports(config):
+            return self.backup
+        others = [candidate for candidate in candidates if candidate is not provider]
+        return others[0] if others else provider
+
+
+_HEDGE_THREADS = None
+_HEDGE_THREADS_LOCK = threading.Lock()
+
+
+# Threads for hedged synchronous calls. A losing call is told to stop (see Provider.generate_cancellable).
+def _hedge_threads():
+    global _HEDGE_THREADS
+    with _HEDGE_THREADS_LOCK:
+        if _HEDGE_THREADS is None:
+            _HEDGE_THREADS = ThreadPoolExecutor(max_workers=16, thread_name_prefix="docqa-hedge")
+        return _HEDGE_THREADS
+
+
+# Routes each request to one of several providers and implements the shared concerns once: routing
+# (short prompts to the fastest provider, long ones to the largest context window, or the model picked by
+# a model_selection.ModelSelector), answer caching, retries on transient errors (falling back to the next
+# provider), hedging and metrics.
+class ProviderRouter(Provider):
+    name = "router"
+
+    def __init__(self, providers, metrics=None, cache=None, short_prompt_tokens=SHORT_PROMPT_TOKENS, max_attempts=2,
+                 hedge=None, selector=None, prompts=None):
+        if not providers:
+            raise ValueError("No LLM provider is configured")
+        super().__init__(",".join(repr(provider) for provider in providers),
+                         max(provider.context_window for provider in providers))
+        self.providers = providers
+        self.metrics = metrics or ProviderMetrics()
+        self.cache = cache
+        self.short_prompt_tokens = short_prompt_tokens
+        self.max_attempts = max_attempts
+        self.hedge = hedge
+        self.selector = selector
+        # prompts.PromptRegistry measuring the prefix-hit rate of the requests sent
+        self.prompts = prompts
+
+    # Function to order the providers able to serve a request, best first (the model chosen in
+    # `decision`, if any, goes first)
+    def candidates(self, contents, config=None, decision=None):
+        prompt_tokens = estimate_contents_tokens(contents)
+        able = [provider for provider in self.providers if provider.supports(config)]
+        fitting = [provider for provider in able if provider.fits(prompt_tokens)]
+        if not fitting:
+            # Nothing fits: the largest window has the best chance (the API reports the overflow)
+            return sorted(able, key=lambda provider: -provider.context_window)
+        if prompt_tokens <= self.short_prompt_tokens:
+            ordered = sorted(fitting, key=self.metrics.expected_latency)
+        else:
+            ordered = sorted(fitting, key=lambda provider: (-provider.context_window, self.metrics.expected_latency(provider)))
+        if decision and decision["model"]:
+            ordered.sort(key=lambda provider: provider.model != decision["model"])
+        return ordered
+
+    # Function to list the providers to try in turn (with one provider, a transient failure is retried on
+    # it); returns them with all the candidates and the model selection decision
+    def _attempts(self, contents, config):
+        decision = self.selector.choose(contents, config) if self.selector else None
+        candidates = self.candidates(contents, config, decision)
+        if not candidates:
+            raise ValueError("No configured LLM provider supports this request")
+        return [candidates[i % len(candidates)] for i in range(self.max_attempts)], candidates, decision
+
+    def _observe(self, provider, generation, decision, contents=None, config=None):
+        self.metrics.observe(provider, generation)
+        if self.prompts:
+            self.prompts.observe(generation.model, contents, config, generation)
+        if self.selector:
+            self.selector.record(decision, generation)
+
+    def _observe_failure(self, decision, error):
+        if self.selector:
+            self.selector.record(decision, error=error)
+
+    def _cache_key(self, contents, config, document_id):
+        if self.cache is None or not ANSWER_CACHE_TTL_SECONDS:
+            return None
+        return answer_cache_key(self.model, contents, config, document_id)
+
+    def _cached(self, key, contents, config):
+        if key is None:
+            return None
+        text = self.cache.get_text("answers", key)
+        if text is None:
+            return None
+        self.metrics.observe_cache_hit(self)
+        generation = self.make_generation(text, None, 0.0, contents, config)
+        generation.from_cache = True
+        generation.prompt_tokens = generation.output_tokens = 0
+        return generation
+
+    def _store(self, key, generation):
+        if key is not None and generation.text is not None:
+            self.cache.put_text("answers", key, generation.text, ttl_seconds=ANSWER_CACHE_TTL_SECONDS)
+
+    def _hedge_deadline(self, provider, kind="latency_s"):
+        return self.hedge.deadline(self.metrics, provider, kind) if self.hedge else None
+
+    # Function to estimate what a losing hedged request cost: the prompt was sent, and `output_tokens` of
+    # the answer were (or will be) generated
+    def _hedge_loser(self, provider, contents, output_tokens=0):
+        generation = Generation(
+            text=None, provider=provider.name, model=provider.model, estimated=True,
+            prompt_tokens=estimate_contents_tokens(contents), output_tokens=output_tokens,
+        )
+        self.metrics.observe_hedge_loser(provider, generation)
+        return generation
+
+    # Function to generate with one provider, hedging if it is slower than its usual latency. Returns
+    # (provider, generation); the usage of a losing duplicate is in `generation.hedge_losers`.
+    def _call(self, provider, candidates, contents, config):
+        deadline = self._hedge_deadline(provider)
+        if deadline is None:
+            return provider, provider.generate(contents, config)
+        cancelled = threading.Event()
+        call = lambda p: p.generate_cancellable(contents, config, cancelled)
+        primary = _hedge_threads().submit(call, provider)
+        try:
+            return provider, primary.result(timeout=deadline)
+        except FuturesTimeoutError:
+            pass
+        if not self.hedge.try_acquire():
+            return provider, primary.result()
+        backup_provider = self.hedge.backup_for(provider, candidates)
+        backup = _hedge_threads().submit(call, backup_provider)
+        futures = {primary: provider, backup: backup_provider}
+        error = None
+        for future in as_completed(futures):
+            if future.exception() is None:
+                cancelled.set()
+                generation = future.result()
+                for other, other_provider in futures.items():
+                    if other is future or other.cancel():
+                        continue
+                    if not other.done():
+                        # Still running: a streaming backend stops at its next piece, others finish the answer
+                        output_tokens = 0 if other_provider.streams_natively else generation.output_tokens
+                        spent = self._hedge_loser(other_provider, contents, output_tokens)
+                    elif other.exception() is None:
+                        spent = other.result()
+                        self.metrics.observe_hedge_loser(other_provider, spent)
+                    else:
+                        continue
+                    generation.hedge_losers.append(spent)
+                self.metrics.observe_hedge(provider, won=future is backup)
+                return futures[future], generation
+            error = error or future.exception()
+        raise error
+
+    # Async variant of `_call` for any call returning a Generation (or, with `discard`, a result such as an
+    # opened stream, which `discard` closes and turns into the Generation spent so far). Losing requests are
+    # cancelled, and their usage (estimated when cancelled in flight) is appended to `losers`.
+    # `kind` picks the latency the deadline is based on.
+    async def _acall(self, provider, candidates, call, contents, config, kind="latency_s", discard=None, losers=None):
+        deadline = self._hedge_deadline(provider, kind)
+        if deadline is None:
+            return provider, await call(provider)
+        primary = asyncio.ensure_future(call(provider))
+        tasks = {primary: provider}
+        winner = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=deadline)
+            if done or not self.hedge.try_acquire():
+                winner = primary
+                return provider, await primary
+            backup_provider = self.hedge.backup_for(provider, candidates)
+            backup = asyncio.ensure_future(call(backup_provider))
+            tasks[backup] = backup_provider
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        self.metrics.observe_hedge(provider, won=task is backup)
+                        return tasks[task], task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task, task_provider in tasks.items():
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                    spent = self._hedge_loser(task_provider, contents)
+                elif not task.cancelled() and task.exception() is None:
+                    spent = await discard(task.result()) if discard else task.result()
+                    self.metrics.observe_hedge_loser(task_provider, spent)
+                else:
+                    continue
+                if losers is not None:
+                    losers.append(spent)
+
+    # `document_id` only matters for requests referencing a context cache (it names the cached document)
+    def generate(self, contents, config=None, document_id=None):
+        key = self._cache_key(contents, config, document_id)
+        cached = self._cached(key, contents, config)
+        if cached:
+            return cached
+        attempts, candidates, decision = self._attempts(contents, config)
+        error = None
+        for attempt, provider in enumerate(attempts):
+            try:
+                provider, generation = self._call(provider, candidates, contents, config)
+            except Exception as e:
+                self.metrics.observe_error(provider)
+                if not is_transient_error(e):
+                    self._observe_failure(decision, e)
+                    raise
+                error = e
+                time.sleep(min(2 ** attempt, 8) * 0.5)
+                continue
+            self._observe(provider, generation, decision, contents, config)
+            self._store(key, generation)
+            return generation
+        self._observe_failure(decision, error)
+        raise error
+
+    async def agenerate(self, contents, config=None, document_id=None):
+        key = self._cache_key(contents, config, document_id)
+        cached = self._cached(key, contents, config)
+        if cached:
+            return cached
+        attempts, candidates, decision = self._attempts(contents, config)
+        error = None
+        for attempt, provider in enumerate(attempts):
+            losers = []
+            try:
+                provider, generation = await self._acall(
+                    provider, candidates, lambda p: p.agenerate(contents, config), contents, config, losers=losers
+                )
+            except Exception as e:
+                self.metrics.observe_error(provider)
+                if not is_transient_error(e):
+                    self._observe_failure(decision, e)
+                    raise
+                error = e
+                await asyncio.sleep(min(2 ** attempt, 8) * 0.5)
+                continue
+            generation.hedge_losers.extend(losers)
+            self._observe(provider, generation, decision, contents, config)
+            self._store(key, generation)
+            return generation
+        self._observe_failure(decision, error)
+        raise error
+
+    # Streams fall back to the next provider only if nothing has been streamed yet. Async streams are
+    # hedged on the time to their first piece; synchronous streams are not hedged.
+    def stream(self, contents, config=None, document_id=None):
+        return _RoutedStream(self, contents, config, document_id)
+
+    def astream(self, contents, config=None, document_id=None):
+        return _RoutedStream(self, contents, config, document_id)
+
+
+# Function to open an async stream and wait for its first piece: returns (stream, iterator, first piece)
+async def _open_astream(provider, contents, config):
+    stream = provider.astream(contents, config)
+    iterator = stream.__aiter__()
+    try:
+        first = await iterator.__anext__()
+    except StopAsyncIteration:
+        first = None
+    return stream, iterator, first
+
+
+# Function to close an opened stream that lost a hedge; returns the Generation it spent
+async def _close_astream(opened):
+    await opened[1].aclose()
+    return await opened[0].astop()
+
+
+# Stream through a router: cached answers are replayed as one piece; provider streams are measured,
+# stored in the answer cache and retried on another provider if they fail before the first piece
+class _RoutedStream:
+    def __init__(self, router, contents, config, document_id):
+        self.router = router
+        self.contents = contents
+        self.config = config
+        self.key = router._cache_key(contents, config, document_id)
+        self.generation = None
+        self.decision = None
+
+    def _done(self, provider, stream, losers=()):
+        self.generation = stream.generation
+        self.generation.hedge_losers.extend(losers)
+        self.router._observe(provider, stream.generation, self.decision, self.contents, self.config)
+        self.router._store(self.key, stream.generation)
+
+    def __iter__(self):
+        cached = self.router._cached(self.key, self.contents, self.config)
+        if cached:
+            self.generation = cached
+            yield cached.text
+            return
+        error = None
+        attempts, _, self.decision = self.router._attempts(self.contents, self.config)
+        for attempt, provider in enumerate(attempts):
+            stream = provider.stream(self.contents, self.config)
+            started = False
+            try:
+                for piece in stream:
+                    started = True
+                    yield piece
+            except Exception as e:
+                self.router.metrics.observe_error(provider)
+                if started or not is_transient_error(e):
+                    self.router._observe_failure(self.decision, e)
+                    raise
+                error = e
+                time.sleep(min(2 ** attempt, 8) * 0.5)
+                continue
+            self._done(provider, stream)
+            return
+        self.router._observe_failure(self.decision, error)
+        raise error
+
+    async def __aiter__(self):
+        cached = self.router._cached(self.key, self.contents, self.config)
+        if cached:
+            self.generation = cached
+            yield cached.text
+            return
+        error = None
+        attempts, candidates, self.decision = self.router._attempts(self.contents, self.config)
+        for attempt, provider in enumerate(attempts):
+            started = False
+            losers = []
+            try:
+                provider, (stream, iterator, first) = await self.router._acall(
+                    provider, candidates, lambda p: _open_astream(p, self.contents, self.config), self.contents,
+                    self.config, kind="first_token_s", discard=_close_astream, losers=losers,
+                )
+                if first is not None:
+                    started = True
+                    yield first
+                async for piece in iterator:
+                    started = True
+                    yield piece
+            except Exception as e:
+                self.router.metrics.observe_error(provider)
+                if started or not is_transient_error(e):
+                    self.router._observe_failure(self.decision, e)
+                    raise
+                error = e
+                await asyncio.sleep(min(2 ** attempt, 8) * 0.5)
+                continue
+            self._done(provider, stream, losers)
+            return
+        self.router._observe_failure(self.decision, error)
+        raise error
+
+
+# Function to create the providers named in DOCQA_PROVIDERS. Gemini needs a client (the user's key);
+# OpenAI is only added when OPENAI_API_KEY is set. `gemini_models` adds one Gemini provider per model
+# (for a model_selection.ModelSelector to choose from) instead of the default model only.
+def create_providers(gemini_client=None, names=None, gemini_models=None):
+    providers = []
+    for name in names or PROVIDERS:
+        if name == "gemini":
+            if gemini_client is not None:
+                providers.extend(
+                    GeminiProvider(gemini_client, model, GEMINI_CONTEXT_WINDOWS.get(model, 1_048_576))
+                    for model in gemini_models or [DEFAULT_MODEL]
+                )
+        elif name == "openai":
+            if os.environ.get("OPENAI_API_KEY"):
+                from openai import OpenAI
+                providers.append(OpenAIProvider(OpenAI()))
+        elif name == "local":
+            providers.append(LocalProvider())
+        elif name == "echo":
+            providers.append(EchoProvider())
+        else:
+            raise ValueError(f"Unknown provider in DOCQA_PROVIDERS: {name}")
+    return providers
+
+
+# Function to create the hedging policy configured by DOCQA_HEDGE* (None when hedging is off)
+def create_hedge_policy(gemini_client=None):
+    if not HEDGE_ENABLED:
+        return None
+    backup = GeminiProvider(gemini_client, HEDGE_MODEL) if HEDGE_MODEL and gemini_client is not None else None
+    return HedgePolicy(backup=backup)
@@ -0,0 +1,196 @@
+import re
+import threading
+from collections import OrderedDict
+
+from shared_cache import EXPORT_CACHE_TTL_SECONDS, cache_key
+
+
+# Parsed answers kept per process, so exporting one answer in several formats parses its markdown once
+RENDER_TREE_CACHE_SIZE = 64
+# Bump when the node layout changes so stale trees in the shared cache are not reused
+RENDER_TREE_VERSION = 1
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*$")
+_LIST_ITEM = re.compile(r"^\s*(?:([-*+])|\d+[.)])\s+(.*)$")
+# Inline markup: **bold**, __bold__, `code`, *italic*, _italic_
+_INLINE = re.compile(r"(\*\*[^*]+\*\*|__[^_]+__|`[^`]+`|\*[^*\s][^*]*\*|\b_[^_\s][^_]*_\b)")
+
+
+# The render tree of an answer is a list of nodes (plain dicts, so it can be stored as JSON):
+#   {"kind": "heading", "level": 1-6, "runs": [...]}
+#   {"kind": "paragraph", "runs": [...]}
+#   {"kind": "list_item", "ordered": bool, "runs": [...]}
+#   {"kind": "code", "text": "..."}
+# Runs are [text, style] pairs with style None, "bold", "italic" or "code". Export backends
+# (docx_export.render_docx, exports.render_pdf, exports.render_html) only read nodes.
+
+
+# Function to split a line of markdown into runs
+def parse_runs(text):
+    runs = []
+    for piece in _INLINE.split(text):
+        if not piece:
+            continue
+        if piece[:2] in ("**", "__") and len(piece) > 4:
+            runs.append([piece[2:-2], "bold"])
+        elif piece[0] == "`" and len(piece) > 2:
+            runs.append([piece[1:-1], "code"])
+        elif piece[0] in "*_" and len(piece) > 2:
+            runs.append([piece[1:-1], "italic"])
+        else:
+            runs.append([piece, None])
+    return runs
+
+
+# Function to turn one complete markdown block (see MarkdownBlockParser) into render nodes
+def parse_block(block):
+    if block.startswith("```"):
+        lines = block.split("\n")[1:]
+        if lines and lines[-1].strip().startswith("```"):
+            lines = lines[:-1]
+        return [{"kind": "code", "text": "\n".join(lines)}]
+    heading = _HEADING.match(block)
+    if heading:
+        return [{"kind": "heading", "level": len(heading.group(1)), "runs": parse_runs(heading.group(2))}]
+    nodes = []
+    paragraph = []
+    for line in block.split("\n"):
+        item = _LIST_ITEM.match(line)
+        if item:
+            if paragraph:
+                nodes.append({"kind": "paragraph", "runs": parse_runs(" ".join(paragraph))})
+                paragraph = []
+            nodes.append({"kind": "list_item", "ordered": not item.group(1), "runs": parse_runs(item.group(2))})
+        else:
+            paragraph.append(line.strip())
+    if paragraph:
+        nodes.append({"kind": "paragraph", "runs": parse_runs(" ".join(paragraph))})
+    return nodes
+
+
+# Splits markdown text arriving in pieces (a streamed answer) into complete blocks: a paragraph or list is
+# complete once a blank line follows it, a heading at the end of its line, and a fenced code block at its
+# closing fence. Only the unfinished line and block are kept.
+class MarkdownBlockParser:
+    def __init__(self):
+        self.partial_line = ""
+        self.lines = []
+        self.in_code = False
+
+    def _flush(self):
+        block = "\n".join(self.lines).strip("\n")
+        self.lines = []
+        return [block] if block.strip() else []
+
+    def feed(self, text):
+        lines = (self.partial_line + text).split("\n")
+        self.partial_line = lines.pop()
+        blocks = []
+        for line in lines:
+            fence = line.lstrip().startswith("```")
+            if self.in_code:
+                self.lines.append(line)
+                if fence:
+                    self.in_code = False
+                    blocks.extend(self._flush())
+            elif fence:
+                blocks.extend(self._flush())
+                self.lines.append(line)
+                self.in_code = True
+            elif not line.strip():
+                blocks.extend(self._flush())
+            elif _HEADING.match(line):
+                blocks.extend(self._flush())
+                self.lines.append(line)
+                blocks.extend(self._flush())
+            else:
+                self.lines.append(line)
+        return blocks
+
+    # Function to return the last blocks once the text has ended (an unclosed code fence is closed)
+    def close(self):
+        blocks = self.feed("\n") if self.partial_line else []
+        self.in_code = False
+        return blocks + self._flush()
+
+
+# Builds the render tree of a streamed answer: `feed` returns the nodes completed by a piece of text
+class RenderTreeBuilder:
+    def __init__(self):
+        self.parser = MarkdownBlockParser()
+        self.nodes = []
+
+    def _add(self, blocks):
+        new = [node for block in blocks for node in parse_block(block)]
+        self.nodes.extend(new)
+        return new
+
+    def feed(self, text):
+        return self._add(self.parser.feed(text))
+
+    def finish(self):
+        return self._add(self.parser.close())
+
+
+# Function to parse a whole markdown answer into its render tree
+def parse_markdown(text):
+    builder = RenderTreeBuilder()
+    builder.feed(text)
+    builder.finish()
+    return builder.nodes
+
+
+def render_tree_key(text):
+    return cache_key(text, RENDER_TREE_VERSION)
+
+
+# Render trees by answer: a per-process LRU, backed by the shared on-disk cache when one is given
+# (another worker may have parsed the answer already)
+class RenderTreeCache:
+    def __init__(self, max_entries=RENDER_TREE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._trees = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "parses": 0}
+
+    def put(self, text, nodes, store=None):
+        key = render_tree_key(text)
+        with self._lock:
+            self._trees[key] = nodes
+            self._trees.move_to_end(key)
+            while len(self._trees) > self.max_entries:
+                self._trees.popitem(last=False)
+        if store is not None and EXPORT_CACHE_TTL_SECONDS:
+            store.put_json("render_tree", key, nodes, EXPORT_CACHE_TTL_SECONDS)
+
+    # Function to get the render tree of an answer, parsing it only if no cache has it
+    def get(self, text, store=None):
+        key = render_tree_key(text)
+        with self._lock:
+            nodes = self._trees.get(key)
+            if nodes is not None:
+                self._trees.move_to_end(key)
+                self.stats["hits"] += 1
+                return nodes
+        nodes = store.get_json("render_tree", key) if store is not None and EXPORT_CACHE_TTL_SECONDS else None
+        if nodes is None:
+            nodes = parse_markdown(text)
+            with self._lock:
+                self.stats["parses"] += 1
+            self.put(text, nodes, store)
+        else:
+            self.put(text, nodes)
+        return nodes
+
+
+RENDER_TREES = RenderTreeCache()
+
+
+# Function to get the (cached) render tree of an answer
+def get_render_tree(text, store=None):
+    return RENDER_TREES.get(text, store)
+
+
+# Function to cache the render tree already built for an answer (e.g. by a streaming renderer)
+def remember_render_tree(text, nodes, store=None):
+    RENDER_TREES.put(text, nodes, store)
@@ -0,0 +1,101 @@
+import math
+import re
+from collections import Counter
+
+from chunking import iter_chunks, iter_section_chunks
+from usage_tracking import estimate_tokens
+
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be by can could did do does for from give had has have how i in is it its me "
+    "my of on or please so tell than that the their them then there these they this to was we were "
+    "what when where which who why will with would you your".split()
+)
+
+
+# Function to split text into lowercase search terms without stopwords
+def tokenize(text):
+    return [term for term in _TOKEN.findall(text.lower()) if term not in STOPWORDS]
+
+
+# In-memory BM25 index over document chunks; chunks can be added while the document is still being parsed
+class DocumentIndex:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks = []
+        self.postings = {}
+        self.lengths = []
+        self.total_length = 0
+        self.total_tokens = 0
+
+    def add(self, chunk):
+        chunk_id = len(self.chunks)
+        terms = Counter(tokenize(chunk["text"]))
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = count
+        length = sum(terms.values())
+        self.lengths.append(length)
+        self.total_length += length
+        chunk = dict(chunk, id=chunk_id, tokens=estimate_tokens(chunk["text"]))
+        self.total_tokens += chunk["tokens"]
+        self.chunks.append(chunk)
+        return chunk
+
+    def __len__(self):
+        return len(self.chunks)
+
+    # Function to score chunks against a query, returning (score, chunk) pairs, best first
+    def search(self, query, k=5):
+        if not self.chunks:
+            return []
+        average_length = self.total_length / len(self.chunks) or 1
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.chunks[chunk_id]) for chunk_id, score in ranked]
+
+    # Function to pick the context for a question: the whole document if it fits the token budget,
+    # otherwise the best-scoring chunks that fit, returned in document order
+    def select_context(self, query, token_budget, k=8):
+        if self.total_tokens <= token_budget:
+            return list(self.chunks)
+        selected = []
+        used = 0
+        for _, chunk in self.search(query, k=k):
+            if used + chunk["tokens"] > token_budget:
+                continue
+            selected.append(chunk)
+            used += chunk["tokens"]
+        if not selected:
+            # Nothing matched: fall back to the start of the document
+            for chunk in self.chunks:
+                if used + chunk["tokens"] > token_budget:
+                    break
+                selected.append(chunk)
+                used += chunk["tokens"]
+        return sorted(selected, key=lambda chunk: chunk["id"])
+
+
+# Function to build an index from a stream of text pieces (pages, paragraphs, decoded text)
+def build_index(pieces, **chunk_options):
+    index = DocumentIndex()
+    for chunk in iter_chunks(pieces, **chunk_options):
+        index.add(chunk)
+    return index
+
+
+# Function to build an index from layout blocks, chunked along headings, paragraphs and tables
+def build_section_index(blocks, **chunk_options):
+    index = DocumentIndex()
+    for chunk in iter_section_chunks(blocks, **chunk_options):
+        index.add(chunk)
+    return index
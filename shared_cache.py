@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from filelock import FileLock
+
+from blob_store import BlobStore, ImmediateTransaction
+from job_queue import DATA_DIR
+
+
+# Shared on-disk cache used by every Streamlit/API worker process on this machine
+CACHE_DIR = os.environ.get("DOCQA_CACHE_DIR", os.path.join(DATA_DIR, "cache"))
+# Cached answers are reused for this long (0 disables answer caching)
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("DOCQA_ANSWER_CACHE_TTL_SECONDS", "86400"))
+# Values up to this size live in the SQLite row; larger ones in the content-addressed blob store
+INLINE_MAX_BYTES = 16 * 1024
+# Rendered exports and their parsed render trees are kept this long (0 disables storing them)
+EXPORT_CACHE_TTL_SECONDS = int(os.environ.get("DOCQA_EXPORT_CACHE_TTL_SECONDS", "3600"))
+# Size budget of the entries (extracted text, indexes, OCR results, answers, ...): past it, `purge_expired`
+# evicts the least recently used ones, releasing their blobs for the blob store's garbage collection
+CACHE_MAX_BYTES = int(os.environ.get("DOCQA_CACHE_MAX_BYTES", str(1024 ** 3)))
+# Writes run `purge_expired` at most this often per process, so expired entries release their blobs and
+# the blob store is garbage-collected without a separate job (0 disables it)
+PURGE_INTERVAL_SECONDS = int(os.environ.get("DOCQA_CACHE_PURGE_INTERVAL_SECONDS", "600"))
+# How long a worker waits for another worker's build of the same entry before giving up
+LOCK_TIMEOUT_SECONDS = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB,
+    digest TEXT,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+
+# Function to hash a cache key made of arbitrary JSON-serializable parts
+def cache_key(*parts):
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Key/value cache shared between processes: an index in SQLite (WAL mode, so readers never block the
+# writer) with small values inline and large values in a BlobStore under objects/ (stored once per content
+# hash, each entry holding a reference). Builds of the same entry are serialized across processes with a
+# file lock. The blob store is also used directly for raw uploads (`cache.blobs`).
+class SharedCache:
+    def __init__(self, directory=CACHE_DIR, inline_max_bytes=INLINE_MAX_BYTES, lock_timeout=LOCK_TIMEOUT_SECONDS,
+                 purge_interval=PURGE_INTERVAL_SECONDS, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.inline_max_bytes = inline_max_bytes
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        self.purge_interval = purge_interval
+        self._next_purge = time.time()
+        self._purge_lock = threading.Lock()
+        self.objects_dir = os.path.join(directory, "objects")
+        self.locks_dir = os.path.join(directory, "locks")
+        os.makedirs(self.locks_dir, exist_ok=True)
+        self.db_path = os.path.join(directory, "cache.sqlite3")
+        self.stats = {"hits": 0, "misses": 0, "builds": 0, "built_elsewhere": 0, "evicted": 0}
+        self._local = threading.local()
+        with self._transaction() as db:
+            db.execute(_SCHEMA)
+        # Same database file, so an entry and the reference it holds on its blob change in one transaction
+        self.blobs = BlobStore(self.objects_dir, db_path=self.db_path)
+
+    # One connection per thread; WAL lets readers and a writer from other processes work concurrently
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _transaction(self):
+        return ImmediateTransaction(self._connection())
+
+    def get_bytes(self, namespace, key):
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT value, digest, expires_at, accessed_at FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, key),
+        ).fetchone()
+        if row is None or (row[2] is not None and row[2] <= now):
+            self.stats["misses"] += 1
+            return None
+        value, digest, _, accessed_at = row
+        # Access times only need minute precision; skipping most updates keeps reads write-free
+        if now - accessed_at > 60:
+            with self._transaction() as db:
+                db.execute("UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+        if digest is not None:
+            try:
+                value = self.blobs.read(digest)
+            except FileNotFoundError:
+                self.delete(namespace, key)
+                self.stats["misses"] += 1
+                return None
+        self.stats["hits"] += 1
+        return bytes(value)
+
+    def put_bytes(self, namespace, key, data, ttl_seconds=None):
+        now = time.time()
+        staged = None if len(data) <= self.inline_max_bytes else self.blobs.stage(data)
+        value, digest = (data, None) if staged is None else (None, staged.digest)
+        with self._transaction() as db:
+            self._drop_reference(db, namespace, key)
+            if staged is not None:
+                self.blobs.reference(db, staged)
+            db.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, digest, size, created_at, accessed_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, value, digest, len(data), now, now, now + ttl_seconds if ttl_seconds else None),
+            )
+        if staged is not None:
+            self.blobs.place(staged)
+        self._maybe_purge()
+
+    def _maybe_purge(self):
+        if not self.purge_interval or time.time() < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_purge = time.time() + self.purge_interval
+            self.purge_expired()
+        except (OSError, sqlite3.Error):
+            # Housekeeping only: a failed purge (e.g. the database busy in another worker) is retried later
+            pass
+        finally:
+            self._purge_lock.release()
+
+    # Function to release the blob an entry refers to (in the transaction replacing or deleting the entry)
+    def _drop_reference(self, db, namespace, key):
+        row = db.execute("SELECT digest FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        if row is not None and row[0] is not None:
+            self.blobs.dereference(db, row[0])
+
+    def delete(self, namespace, key):
+        with self._transaction() as db:
+            self._drop_reference(db, namespace, key)
+            db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def get_text(self, namespace, key):
+        data = self.get_bytes(namespace, key)
+        return None if data is None else data.decode("utf-8")
+
+    def put_text(self, namespace, key, text, ttl_seconds=None):
+        self.put_bytes(namespace, key, text.encode("utf-8"), ttl_seconds)
+
+    def get_json(self, namespace, key):
+        data = self.get_bytes(namespace, key)
+        return None if data is None else json.loads(data)
+
+    def put_json(self, namespace, key, value, ttl_seconds=None):
+        self.put_bytes(namespace, key, json.dumps(value).encode("utf-8"), ttl_seconds)
+
+    # Pickled objects are only ever read back by this app, from its own cache directory
+    def get_object(self, namespace, key):
+        data = self.get_bytes(namespace, key)
+        return None if data is None else pickle.loads(data)
+
+    def put_object(self, namespace, key, value, ttl_seconds=None):
+        self.put_bytes(namespace, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ttl_seconds)
+
+    # Cross-process lock for one entry (e.g. held while a document index is being built)
+    @contextmanager
+    def lock(self, namespace, key):
+        name = hashlib.sha256(f"{namespace}\0{key}".encode("utf-8")).hexdigest()[:32]
+        with FileLock(os.path.join(self.locks_dir, f"{name}.lock"), timeout=self.lock_timeout):
+            yield
+
+    # Function to return a cached object, or build and store it. Only one process builds a given
+    # entry at a time; the others wait for the lock and then read the stored result.
+    def get_or_build(self, namespace, key, build, ttl_seconds=None):
+        value = self.get_object(namespace, key)
+        if value is not None:
+            return value
+        with self.lock(namespace, key):
+            value = self.get_object(namespace, key)
+            if value is not None:
+                self.stats["built_elsewhere"] += 1
+                return value
+            value = build()
+            self.stats["builds"] += 1
+            self.put_object(namespace, key, value, ttl_seconds)
+        return value
+
+    # Function to drop expired entries, then the least recently used ones while the entries are over
+    # `max_bytes` (releasing their blobs), and garbage-collect the blob store: unreferenced blobs go least
+    # recently used first while it is over its size budget, and object files without a row (a crashed
+    # writer, or written before blobs were tracked) once they are past the grace period
+    def purge_expired(self):
+        now = time.time()
+        with self._transaction() as db:
+            expired = db.execute(
+                "SELECT digest FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ? AND digest IS NOT NULL",
+                (now,),
+            ).fetchall()
+            for (digest,) in expired:
+                self.blobs.dereference(db, digest)
+            db.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            if self.max_bytes:
+                self._evict_lru(db)
+            # Entries written before blobs were tracked: register their files so the sweep keeps them
+            db.execute(
+                "INSERT OR IGNORE INTO blobs (digest, size, refcount, created_at, accessed_at) "
+                "SELECT digest, MAX(size), COUNT(*), MIN(created_at), MAX(accessed_at) FROM entries "
+                "WHERE digest IS NOT NULL GROUP BY digest"
+            )
+        return self.blobs.collect(sweep_orphans=True)
+
+    def _evict_lru(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = db.execute("SELECT namespace, key, digest, size FROM entries ORDER BY accessed_at").fetchall()
+        for namespace, key, digest, size in rows:
+            if total <= self.max_bytes:
+                break
+            if digest is not None:
+                self.blobs.dereference(db, digest)
+            db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            total -= size
+            self.stats["evicted"] += 1
@@ -1,33 +1,140 @@
 import streamlit as st
 from google import genai
 from io import BytesIO
-from docx import Document
 import requests
 from PIL import Image
-import io
 import base64
 import time
-from transformers import pipeline
-
+import uuid
+from usage_tracking import UsageTracker, api_key_fingerprint, estimate_contents_tokens
+from extraction import document_fingerprint
+from memory_profiling import PROFILE_MEMORY, MemoryProfiler, checkpoint, format_bytes
+from prompts import PROMPTS, DOCUMENT_QA_SYSTEM_INSTRUCTION, build_code_documentation_prompt, prompt_contents
+from conversation import get_conversation
+from context_cache import ContextCacheManager
+from engine import DEFAULT_MODEL, get_document_index, get_document_text, prepare_question
+from model_selection import MODEL_TIERS, create_model_selector
+from providers import ProviderMetrics, ProviderRouter, create_hedge_policy, create_providers
+from shared_cache import SharedCache
+from job_queue import JobQueue, QUEUED, RUNNING, DONE
+from summarization import DIGEST_ENABLED, get_digest, ingest_document_digest, is_overview_question, summarize_document
+from docx_export import StreamingDocxRenderer
+from exports import EXPORT_FORMATS, export_answer, remember_export
+from render_tree import remember_render_tree
+from extractive_qa import EXTRACTIVE_QA_ENABLED, FastPathStats, answer_extractively, format_extractive_answer
+
+
+# Shared usage tracker for every session served by this process
+@st.cache_resource
+def get_usage_tracker():
+    return UsageTracker()
+
+# On-disk cache of document text, indexes and answers shared by every worker process on this machine
+@st.cache_resource
+def get_shared_cache():
+    return SharedCache()
+
+# Shared bookkeeping of server-side context caches for large documents
+@st.cache_resource
+def get_context_cache():
+    return ContextCacheManager(store=get_shared_cache())
+
+# Shared per-provider latency and error metrics, used to route requests
+@st.cache_resource
+def get_provider_metrics():
+    return ProviderMetrics()
+
+# Shared hit rate and latency of the local extractive QA fast path
+@st.cache_resource
+def get_fast_path_stats():
+    return FastPathStats()
+
+# Shared background job queue (results are persisted on disk)
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
+# Function to get a stable id for the current browser session. It is kept in the URL, like job ids, so
+# reloading the page continues the session (and its token budget) instead of starting a new one.
+def get_session_id():
+    if "session_id" not in st.session_state:
+        session_id = st.query_params.get("session")
+        if not session_id:
+            session_id = uuid.uuid4().hex
+            st.query_params["session"] = session_id
+        st.session_state["session_id"] = session_id
+    return st.session_state["session_id"]
+
+# Function to call the Gemini API through the usage tracker (token counts, latency, budgets)
+def tracked_generate_content(client, api_key, contents, model=DEFAULT_MODEL, **kwargs):
+    return get_usage_tracker().generate_content(
+        client, get_session_id(), api_key, model=model, contents=contents, **kwargs
+    )
 
-# Function to generate code documentation using Gemini API
-def generate_code_documentation(code_input, api_key):
-    try:
-        code_content = f"Here's a code snippet: {code_input} \n\n---\n\n Can you generate documentation for this code?"
+# Function to get this session's provider router (Gemini plus the other DOCQA_PROVIDERS)
+def get_router(client, api_key):
+    routers = st.session_state.setdefault("routers", {})
+    key_id = api_key_fingerprint(api_key)
+    if key_id not in routers:
+        routers[key_id] = ProviderRouter(
+            create_providers(client, gemini_models=MODEL_TIERS), metrics=get_provider_metrics(),
+            cache=get_shared_cache(), hedge=create_hedge_policy(client), selector=create_model_selector(),
+            prompts=PROMPTS,
+        )
+    return routers[key_id]
 
-        # Generate documentation using the Gemini API
-        response_code = genai.Client(api_key=api_key).models.generate_content(
-            model="gemini-2.0-flash", 
-            contents=[{"parts": [{"text": code_content}]}]
+# Function to generate answer text through the provider router, which reuses identical earlier answers
+# from the shared cache, retries transient errors and picks the provider
+def cached_generate_text(client, api_key, contents, config=None, document_id=None):
+    generation = get_usage_tracker().generate_routed(
+        get_router(client, api_key), get_session_id(), api_key, contents, config, document_id=document_id
+    )
+    return generation.text
+
+# Function to answer a question in a document conversation. Large documents are put in a server-side
+# context cache on the first question and referenced afterwards; otherwise new excerpts are sent inline.
+# Returns the answer text (None if the model gave no answer) and the pending turn.
+def generate_conversation_answer(client, api_key, conversation, question, uploaded_file):
+    context_cache = get_context_cache()
+    if context_cache.is_eligible(conversation.index.total_tokens):
+
+        def generate(cache_name):
+            contents, turn, request = prepare_question(
+                conversation, question, cache_name=cache_name, cache_model=context_cache.model
+            )
+            answer = cached_generate_text(
+                client, api_key, contents, request["config"], document_id=conversation.document_id
+            )
+            return answer, turn
+
+        result = context_cache.generate_with_cache(
+            client, f"{api_key_fingerprint(api_key)}:{conversation.document_id}",
+            lambda: get_document_text(uploaded_file, conversation.document_id, get_shared_cache()),
+            DOCUMENT_QA_SYSTEM_INSTRUCTION, generate
         )
+        if result is not None:
+            return result
 
-        if response_code.candidates:
-            doc_answer = response_code.candidates[0].content.parts[0].text
-            return doc_answer
-        return None
-    except Exception as e:
-        st.error(f"Error generating code documentation: {str(e)}")
-        return None
+    contents, turn, request = prepare_question(conversation, question)
+    return cached_generate_text(client, api_key, contents, request["config"], document_id=conversation.document_id), turn
+
+# Function to summarize earlier conversation turns (used to compact long conversations)
+def summarize_conversation(client, api_key, prompt):
+    return cached_generate_text(client, api_key, prompt_contents(prompt))
+
+
+# Function to stream code documentation from the Gemini API as it is generated (the same snippet is
+# answered from the shared cache in one piece)
+def stream_code_documentation(code_input, api_key):
+    contents = prompt_contents(build_code_documentation_prompt(code_input))
+    tracker = get_usage_tracker()
+    reservation = tracker.check_budget(get_session_id(), api_key, estimate_contents_tokens(contents))
+    try:
+        stream = get_router(genai.Client(api_key=api_key), api_key).stream(contents)
+        yield from stream
+        tracker.record_generation(get_session_id(), api_key, stream.generation, reservation)
+    finally:
+        tracker.release(reservation)
 
 # # Commented above function and incorporated a new function which uses a hugging face model for chat completion.
 # def generate_code_documentation(code_input):
@@ -45,44 +152,6 @@ def generate_code_documentation(code_input, api_key):
 #         st.error(f"Error generating code documentation: {str(e)}")
 #         return None
 
-# Function to add styled text in the Word document
-def add_styled_text(doc, text, style=None, is_bold=False, is_italic=False, is_code=False):
-    para = doc.add_paragraph()
-    
-    if is_code:
-        run = para.add_run(text)
-        run.font.name = 'Courier New'  # Use monospace font for code
-        para.style = 'Normal'
-    else:
-        if style:
-            para.style = style
-        run = para.add_run(text)
-        
-        # Apply bold or italic formatting if needed
-        if is_bold:
-            run.bold = True
-        if is_italic:
-            run.italic = True
-
-# Function to generate document answer with few-shot prompting
-def generate_document_answer_with_few_shot(document_text, question):
-    examples = """
-    Example 1:
-    Document: "Python is a high-level programming language that is easy to learn and use."
-    Question: "What is Python?"
-    Answer: "Python is a high-level programming language known for its simplicity and readability."
-
-    Example 2:
-    Document: "Machine learning is a subset of artificial intelligence where computers learn from data."
-    Question: "What is machine learning?"
-    Answer: "Machine learning is a branch of artificial intelligence where algorithms use data to improve their performance over time."
-    """
-
-    persona = "You are a helpful assistant trained to provide detailed, well-structured answers based on the content of the document."
-    content = f"{persona} Below are a few examples of how I answer questions based on document content:\n{examples}\n\nDocument: {document_text}\nQuestion: {question}\nAnswer:"
-
-    return content
-
 # # Function to generate project/report file (e.g., Class 12th Chemistry lab experiments)
 # def generate_project_report(subject, api_key):
 #     try:
@@ -129,29 +198,90 @@ def generate_document_answer_with_few_shot(document_text, question):
 #     except Exception as e:
 #         st.error(f"An error occurred while generating the project report: {str(e)}")
 
-# Using third model from huggingface here
-def generate_project_report(subject):
-    try:
-        # Initialize a text generation pipeline
-        generator = pipeline("text-generation", model="EleutherAI/gpt-neo-2.7B", tokenizer="EleutherAI/gpt-neo-2.7B")
-        
-        # Prepare the prompt for generating a report
-        prompt = f"Generate a detailed report on the subject: {subject}. Include relevant experiments, steps, and explanations."
-        
-        # Generate the report
-        project_content = generator(prompt, max_length=512)[0]['generated_text']
-        
-        return project_content
-    except Exception as e:
-        st.error(f"Error generating project report: {str(e)}")
-        return None
+# Function to generate the project report in the background; gpt-neo runs in a worker process so the
+# script thread stays responsive, and the same subject maps to the same job across refreshes
+def submit_project_report(subject):
+    return get_job_queue().submit(
+        "report", "local_generation:generate_project_report", args=(subject,),
+        key=subject, use_process=True, label=f"Project report: {subject}"
+    )
+
+# Function to generate code documentation with the local code model in a background worker process
+def submit_local_code_documentation(code_input):
+    return get_job_queue().submit(
+        "code-doc", "local_generation:generate_code_documentation", args=(code_input,),
+        key=code_input, use_process=True, label="Code documentation (local model)"
+    )
+
+# Function to summarize the whole document in a background thread (one Gemini call per part, then one to combine)
+def submit_document_summary(client, api_key, conversation):
+    session_id = get_session_id()
+    tracker = get_usage_tracker()
+    router = get_router(client, api_key)
+
+    def generate(prompt):
+        return tracker.generate_routed(router, session_id, api_key, prompt_contents(prompt)).text or ""
+
+    return get_job_queue().submit(
+        "summary", summarize_document, args=(generate, conversation.index.chunks),
+        key=f"{api_key_fingerprint(api_key)}:{conversation.document_id}", label="Document summary"
+    )
+
+# Function to build the ingest-time digest of a document in a background thread (once per document; the
+# digest is stored in the shared cache next to the document's index)
+def submit_document_digest(client, api_key, conversation):
+    session_id = get_session_id()
+    tracker = get_usage_tracker()
+    router = get_router(client, api_key)
+
+    def generate(prompt):
+        return tracker.generate_routed(router, session_id, api_key, prompt_contents(prompt)).text or ""
+
+    return get_job_queue().submit(
+        "digest", ingest_document_digest,
+        args=(generate, conversation.index.chunks, get_shared_cache(), conversation.document_id),
+        key=conversation.document_id, label="Document digest",
+        result_available=lambda job: get_digest(get_shared_cache(), conversation.document_id) is not None,
+    )
+
+# Function to remember a job id in the page URL, so a browser refresh finds the job again
+def track_job(job_id):
+    job_ids = st.query_params.get_all("job")
+    if job_id not in job_ids:
+        st.query_params["job"] = job_ids + [job_id]
+
+# Function to show the tracked jobs of one kind: progress while running, the result once done
+def show_jobs(kind):
+    job_queue = get_job_queue()
+    for job_id in st.query_params.get_all("job"):
+        record = job_queue.get(job_id)
+        if record is None or record["kind"] != kind:
+            continue
+        if record["status"] in (QUEUED, RUNNING):
+            show_running_job(job_id)
+        elif record["status"] == DONE:
+            with st.expander(record["label"], expanded=True):
+                st.write(record["result"])
+                if record.get("message"):
+                    st.caption(record["message"])
+        else:
+            st.error(f"{record['label']} failed: {record.get('error')}")
+
+# Poll a running job every two seconds without rerunning the whole script
+@st.fragment(run_every=2)
+def show_running_job(job_id):
+    record = get_job_queue().get(job_id)
+    if record["status"] in (QUEUED, RUNNING):
+        st.progress(record["progress"], text=record.get("message") or f"{record['label']}: {record['status']}")
+    else:
+        st.rerun()
 
 
 # Function to generate an image based on the description (Gemini or other APIs)
 def generate_image_from_prompt(prompt, api_key, retries=3):
     try:
-        response = genai.Client(api_key=api_key).models.generate_content(
-            model="gemini-2.0-flash", 
+        response = tracked_generate_content(
+            genai.Client(api_key=api_key), api_key,
             contents=[{"parts": [{"text": f"Generate an image based on the following description: {prompt}"}]}]
         )
         if response.candidates:
@@ -200,9 +330,16 @@ else:
     # Create a Gemini client
     client = genai.Client(api_key=gemini_api_key)
 
+    # Show the token usage of this session
+    session_usage = get_usage_tracker().session_totals(get_session_id())
+    st.sidebar.caption(
+        f"Session usage: {session_usage['requests']} requests, "
+        f"{session_usage['prompt_tokens']} prompt / {session_usage['output_tokens']} output tokens"
+    )
+
     user_choice = st.radio(
         "Select the functionality you want to use:",
-        ("Upload Document for Q&A", "Provide Code for Documentation")
+        ("Upload Document for Q&A", "Provide Code for Documentation", "Generate Project Report")
     )
 
     if user_choice == "Upload Document for Q&A":
@@ -211,51 +348,90 @@ else:
             "Upload a document (.txt, .md, .pdf, .docx)", type=("txt", "md", "pdf", "docx")
         )
         
-        question = st.text_area(
-            "Now ask a question about the document!",
-            placeholder="Can you give me a short summary?",
+        # Optional tracemalloc profiling of each stage of the Q&A flow
+        profile_memory = st.sidebar.checkbox("Profile memory usage", value=PROFILE_MEMORY)
+
+        question = st.chat_input(
+            "Now ask a question about the document! (e.g. Can you give me a short summary?)",
             disabled=not uploaded_file,
         )
 
-        if uploaded_file and question:
+        if uploaded_file:
+            profiler = MemoryProfiler().start() if profile_memory else None
             try:
-                document = uploaded_file.read()
-
-                # Handle different file types (PDF, DOCX)
-                if uploaded_file.type == "application/pdf":
-                    from PyPDF2 import PdfReader
-                    reader = PdfReader(BytesIO(document))
-                    text = ""
-                    for page in reader.pages:
-                        text += page.extract_text()
-                    document = text
-
-                elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                    from docx import Document
-                    doc = Document(BytesIO(document))
-                    text = ""
-                    for para in doc.paragraphs:
-                        text += para.text
-                    document = text
-
-                # Generate content with few-shot prompt for document Q&A
-                content = generate_document_answer_with_few_shot(document, question)
-
-                # Generate an answer using the Gemini API for the document Q&A
-                response = client.models.generate_content(
-                    model="gemini-2.0-flash", 
-                    contents=[{"parts": [{"text": content}]}]
+                # Index the document once per session (and once per machine through the shared cache);
+                # the conversation keeps it with the earlier turns
+                document_id = document_fingerprint(uploaded_file)
+                conversation = get_conversation(
+                    st.session_state, document_id,
+                    lambda: get_document_index(uploaded_file, document_id, get_shared_cache())
                 )
-
-                # Access the first candidate and its text
-                if response.candidates:
-                    answer = response.candidates[0].content.parts[0].text
-                    st.write(answer)
-                else:
-                    st.error("No response from the model.")
+                checkpoint(profiler, "index document")
+
+                # Summarize the document in the background as soon as it is uploaded (DOCQA_DIGEST)
+                if DIGEST_ENABLED and conversation.digest is None:
+                    conversation.digest = get_digest(get_shared_cache(), document_id)
+                    if conversation.digest is None:
+                        submit_document_digest(client, gemini_api_key, conversation)
+                        st.caption("Preparing a digest of the document in the background…")
+
+                # Long summaries run as a background job so the page stays usable
+                if st.button("Summarize the whole document in the background"):
+                    track_job(submit_document_summary(client, gemini_api_key, conversation))
+                show_jobs("summary")
+
+                # Show the earlier turns of this conversation
+                for past_question, past_answer in conversation.transcript:
+                    st.chat_message("user").write(past_question)
+                    st.chat_message("assistant").write(past_answer)
+
+                if question:
+                    st.chat_message("user").write(question)
+
+                    # Overview questions are answered from the digest; lookup questions are first tried with
+                    # the local extractive model (DOCQA_EXTRACTIVE_QA)
+                    digest_answer = fast_answer = None
+                    if conversation.digest and conversation.digest["summary"] and is_overview_question(question):
+                        digest_answer = conversation.digest["summary"]
+                    elif EXTRACTIVE_QA_ENABLED:
+                        fast_answer = answer_extractively(conversation.index, question, stats=get_fast_path_stats())
+                        checkpoint(profiler, "extractive answer")
+
+                    if digest_answer is not None:
+                        st.chat_message("assistant").write(digest_answer)
+                        st.caption("Answered from the digest prepared at upload.")
+                        conversation.record_local_turn(question, digest_answer)
+                    elif fast_answer is not None:
+                        display_answer = format_extractive_answer(fast_answer)
+                        st.chat_message("assistant").write(display_answer)
+                        st.caption(f"Answered locally in {fast_answer['seconds']:.2f}s (confidence {fast_answer['score']:.2f})")
+                        conversation.record_local_turn(question, fast_answer["answer"], display_answer)
+                    else:
+                        # Generate an answer using the Gemini API; only context not already sent (or cached) goes with it
+                        started = time.perf_counter()
+                        answer, turn = generate_conversation_answer(
+                            client, gemini_api_key, conversation, question, uploaded_file
+                        )
+                        get_fast_path_stats().record_llm(time.perf_counter() - started)
+                        checkpoint(profiler, "generate answer")
+
+                        if answer is not None:
+                            st.chat_message("assistant").write(answer)
+                            conversation.record_turn(turn, answer)
+
+                            # Fold older turns into the rolling summary once the history grows past its budget
+                            if conversation.needs_compaction():
+                                conversation.compact(lambda prompt: summarize_conversation(client, gemini_api_key, prompt))
+                        else:
+                            st.error("No response from the model.")
                 
             except Exception as e:
                 st.error(f"An error occurred while processing the document: {str(e)}")
+            finally:
+                if profiler:
+                    profiler.stop()
+                    with st.expander(f"Memory profile (peak {format_bytes(profiler.overall_peak)})"):
+                        st.table(profiler.report())
 
     elif user_choice == "Provide Code for Documentation":
         # Handle the code input for generating documentation
@@ -266,47 +442,57 @@ else:
         )
         
         generate_code_doc = st.button("Generate Documentation for Code")
+        # Optionally run facebook/incoder-1B locally instead of calling the Gemini API
+        use_local_model = st.checkbox("Use the local model (facebook/incoder-1B)")
 
-        if code_input and generate_code_doc:
+        if code_input and generate_code_doc and use_local_model:
+            track_job(submit_local_code_documentation(code_input))
+        elif code_input and generate_code_doc:
             try:
-                # Generate code documentation
-                doc_answer = generate_code_documentation(code_input, gemini_api_key)
-                # doc_answer = generate_code_documentation(code_input)
-                
-                if doc_answer:
-                    st.write(doc_answer)
-                    
-                    # Create a Word document with the generated documentation
-                    doc = Document()
-                    doc.add_heading('Code Documentation', 0)
-
-                    # Add introductory sections
-                    add_styled_text(doc, "Overview", style="Heading 1", is_bold=True)
-                    add_styled_text(doc, "This document provides a detailed explanation of the code snippet provided by the user.", is_italic=True)
-                    doc.add_paragraph("\n")
-
-                    # Parse the generated documentation and add formatted text
-                    add_styled_text(doc, doc_answer)
-
-                    # Save the document in memory
-                    doc_io = BytesIO()
-                    doc.save(doc_io)
-                    doc_io.seek(0)
-
-                    # Provide download link for the Word document
-                    st.download_button(
-                        label="Download Documentation as Word File",
-                        data=doc_io,
-                        file_name="code_documentation.docx",
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                    )
+                # Generate code documentation; the Word document is built block by block while it streams
+                renderer = StreamingDocxRenderer()
+                doc_answer = st.write_stream(renderer.tee(stream_code_documentation(code_input, gemini_api_key)))
 
+                if doc_answer:
+                    # Only the last block is left to add to the Word document. The render tree and the file go
+                    # to the shared cache (files are stored once by content), so the exports below neither
+                    # parse the answer again nor keep a copy per session.
+                    st.session_state["code_doc"] = {"answer": doc_answer}
+                    remember_render_tree(doc_answer, renderer.tree, get_shared_cache())
+                    remember_export(doc_answer, "docx", renderer.finish().getvalue(), get_shared_cache())
                 else:
+                    st.session_state.pop("code_doc", None)
                     st.error("No response from the model.")
                 
             except Exception as e:
                 st.error(f"An error occurred while generating code documentation: {str(e)}")
 
+        code_doc = st.session_state.get("code_doc")
+        if code_doc:
+            if not generate_code_doc:
+                st.markdown(code_doc["answer"])
+            # Switching formats reruns the script but never calls the model again
+            export_format = st.radio("Export format", list(EXPORT_FORMATS), horizontal=True,
+                                     format_func=str.upper)
+            data, mime, extension = export_answer(code_doc["answer"], export_format, get_shared_cache())
+            st.download_button(
+                label=f"Download Documentation as {export_format.upper()}",
+                data=data,
+                file_name=f"code_documentation.{extension}",
+                mime=mime
+            )
+
+        show_jobs("code-doc")
+
+    elif user_choice == "Generate Project Report":
+        # The report is generated locally with a Hugging Face model, in a background worker process
+        subject = st.text_input("Subject of the project report", placeholder="Class 12th Chemistry")
+
+        if subject and st.button("Generate Project Report"):
+            track_job(submit_project_report(subject))
+
+        show_jobs("report")
+
     # elif user_choice == "Generate Cover Image":
     #     # Get the cover image description from the user
     #     cover_image_description = st.text_area(
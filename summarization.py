@@ -0,0 +1,142 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from model_selection import question_complexity
+from prompts import (
+    build_digest_overview_prompt, build_digest_section_prompt, build_document_summary_prompt,
+    build_section_summary_prompt,
+)
+from shared_cache import cache_key
+
+
+# Size (tokens) of the document parts summarized in one call
+SUMMARY_GROUP_TOKENS = 8000
+
+# Ingest-time digests: when enabled, every uploaded document is summarized in the background (one summary
+# per section, then an overview), so overview questions are answered at once without a model call
+DIGEST_ENABLED = os.environ.get("DOCQA_DIGEST", "").lower() in ("1", "true", "yes")
+# Section summaries requested at the same time while a digest is built
+DIGEST_CONCURRENCY = int(os.environ.get("DOCQA_DIGEST_CONCURRENCY", "4"))
+# Summary-type questions scoring below this (see model_selection.question_complexity) are plain
+# overview requests, answered from the digest; more involved ones get the section summaries as context
+DIGEST_OVERVIEW_MAX_SCORE = 0.4
+# Bump when the digest layout or prompts change so stale digests are rebuilt
+DIGEST_VERSION = 2
+
+
+# Function to group consecutive chunks into parts of at most `group_tokens` tokens
+def group_chunks(chunks, group_tokens=SUMMARY_GROUP_TOKENS):
+    groups = []
+    current = []
+    current_tokens = 0
+    for chunk in chunks:
+        if current and current_tokens + chunk["tokens"] > group_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(chunk)
+        current_tokens += chunk["tokens"]
+    if current:
+        groups.append(current)
+    return groups
+
+
+# Function to summarize a long document map-reduce style: one call per part, then one call to combine.
+# `generate` takes a prompt (a list of parts, see prompts.prompt_contents) and returns the model's text;
+# `progress(fraction, message)` is optional.
+def summarize_document(generate, chunks, progress=None, group_tokens=SUMMARY_GROUP_TOKENS):
+    groups = group_chunks(chunks, group_tokens)
+    if not groups:
+        return ""
+    steps = len(groups) + (1 if len(groups) > 1 else 0)
+    partials = []
+    for number, group in enumerate(groups, start=1):
+        partials.append(generate(build_section_summary_prompt([chunk["text"] for chunk in group])))
+        if progress:
+            progress(number / steps, f"Summarized part {number} of {len(groups)}")
+    if len(partials) == 1:
+        return partials[0]
+    return generate(build_document_summary_prompt(partials))
+
+
+# Function to group a document's chunks by top-level section (the first heading of their section
+# path), splitting sections larger than `group_tokens`. Documents without headings are grouped by size.
+def group_sections(chunks, group_tokens=SUMMARY_GROUP_TOKENS):
+    sections = []
+    for chunk in chunks:
+        name = (chunk.get("section") or "").split(" > ")[0]
+        if not sections or sections[-1][0] != name:
+            sections.append((name, []))
+        sections[-1][1].append(chunk)
+    groups = []
+    for name, section_chunks in sections:
+        parts = group_chunks(section_chunks, group_tokens)
+        for number, part in enumerate(parts, start=1):
+            label = name or f"Part {len(groups) + 1}"
+            if name and len(parts) > 1:
+                label = f"{name} ({number}/{len(parts)})"
+            groups.append((label, part))
+    return groups
+
+
+# Function to build the hierarchical digest of a document: a short summary of every section (several
+# summarized at once), then an overview made from them. `generate` takes a prompt and returns the
+# model's text. The digest is a plain dict: {"sections": [{"section", "chunk_ids", "summary"}], "summary"}.
+def build_digest(generate, chunks, progress=None, group_tokens=SUMMARY_GROUP_TOKENS, concurrency=DIGEST_CONCURRENCY):
+    groups = group_sections(chunks, group_tokens)
+    if not groups:
+        return {"version": DIGEST_VERSION, "sections": [], "summary": ""}
+    steps = len(groups) + 1
+    done = []
+
+    def summarize(group):
+        label, part = group
+        summary = generate(build_digest_section_prompt(label, [chunk["text"] for chunk in part]))
+        done.append(label)
+        if progress:
+            progress(len(done) / steps, f"Summarized section {len(done)} of {len(groups)}")
+        return summary or ""
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="docqa-digest") as pool:
+        summaries = list(pool.map(summarize, groups))
+    sections = [
+        {"section": label, "chunk_ids": [chunk["id"] for chunk in part], "summary": summary}
+        for (label, part), summary in zip(groups, summaries)
+    ]
+    if len(sections) == 1:
+        overview = sections[0]["summary"]
+    else:
+        overview = generate(build_digest_overview_prompt(format_section_summaries(sections))) or ""
+    return {"version": DIGEST_VERSION, "sections": sections, "summary": overview}
+
+
+# Function to lay out the section summaries of a digest as prompt context
+def format_section_summaries(sections):
+    return "\n\n".join(f"[{section['section']}]\n{section['summary']}" for section in sections)
+
+
+# Function to key a document's digest in the shared cache, next to its text and index
+def digest_key(document_id):
+    return cache_key(document_id, SUMMARY_GROUP_TOKENS, DIGEST_VERSION)
+
+
+# Function to get the digest of a document if it has been built (None otherwise)
+def get_digest(cache, document_id):
+    return cache.get_object("digest", digest_key(document_id))
+
+
+# Function to build and store a document's digest; meant to run as a background job right after upload.
+# Only one worker process builds a given digest, the others read it from the shared cache.
+def ingest_document_digest(generate, chunks, cache, document_id, progress=None):
+    digest = cache.get_or_build("digest", digest_key(document_id), lambda: build_digest(generate, chunks, progress))
+    return digest["summary"]
+
+
+# Function to tell whether a question asks for the kind of overview the digest answers directly
+def is_overview_question(question):
+    kind, score = question_complexity(question)
+    return kind == "summary" and score < DIGEST_OVERVIEW_MAX_SCORE
+
+
+# Function to tell whether a question is about the document as a whole (answered from section summaries)
+def is_summary_question(question):
+    return question_complexity(question)[0] == "summary"
@@ -0,0 +1,29 @@
+import io
+
+import pytest
+
+from extraction import detect_encoding, iter_text_file
+
+
+FRENCH = "Nous habitons près de la rivière, à côté de l'école où les élèves étudient. Déjà l'été arrive."
+ENGLISH = "The café had a naïve charm; the señor ordered crème brûlée and a “special” coffee — déjà vu."
+
+
+@pytest.mark.parametrize("text", [FRENCH, ENGLISH])
+@pytest.mark.parametrize("encoding", ["cp1252", "latin-1"])
+def test_western_european_uploads_decode_as_cp1252(text, encoding):
+    if encoding == "latin-1":
+        text = text.replace("“", '"').replace("”", '"').replace("—", "-")
+    data = text.encode(encoding)
+    assert detect_encoding(data) == "cp1252"
+    assert "".join(iter_text_file(io.BytesIO(data))) == text
+
+
+def test_central_european_upload_keeps_its_code_page():
+    text = "Příliš žluťoučký kůň úpěl ďábelské ódy. Čeština je krásný jazyk plný háčků."
+    data = text.encode("cp1250")
+    assert "".join(iter_text_file(io.BytesIO(data))) == text
+
+
+def test_utf8_upload():
+    assert detect_encoding(FRENCH.encode("utf-8")) == "utf-8"
@@ -0,0 +1,327 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+
+# Default per-session token budget, overridable through the environment (0 disables the check)
+DEFAULT_SESSION_TOKEN_BUDGET = int(os.environ.get("DOCQA_SESSION_TOKEN_BUDGET", "2000000"))
+# Default per-API-key token budget shared by every session using that key (0 disables the check). Unlike
+# a session, a key cannot be renewed by starting over, so this is what bounds a user's spend.
+DEFAULT_API_KEY_TOKEN_BUDGET = int(os.environ.get("DOCQA_API_KEY_TOKEN_BUDGET", "20000000"))
+# Sessions whose totals are kept; past this, the least recently used are forgotten (API callers without an
+# X-Session-Id start a new session on every request)
+MAX_TRACKED_SESSIONS = int(os.environ.get("DOCQA_MAX_TRACKED_SESSIONS", "10000"))
+
+
+class TokenBudgetExceeded(Exception):
+    pass
+
+
+# One generate_content call as seen by the tracker
+@dataclass
+class UsageRecord:
+    session_id: str
+    api_key_id: str
+    model: str
+    prompt_tokens: int
+    output_tokens: int
+    latency_s: float
+    cached_tokens: int = 0
+    estimated: bool = False
+    timestamp: float = field(default_factory=time.time)
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.output_tokens
+
+
+# Tokens set aside by `UsageTracker.check_budget` for a request in flight, until `record` settles them
+# with the actual usage (or `release` gives them back if the request failed)
+@dataclass
+class BudgetReservation:
+    session_id: str
+    api_key_id: str
+    tokens: int
+    settled: bool = False
+
+
+# Running totals for a session or an API key
+@dataclass
+class UsageTotals:
+    requests: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    latency_s: float = 0.0
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.output_tokens
+
+    def add(self, record):
+        self.requests += 1
+        self.prompt_tokens += record.prompt_tokens
+        self.output_tokens += record.output_tokens
+        self.cached_tokens += record.cached_tokens
+        self.latency_s += record.latency_s
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "total_tokens": self.total_tokens,
+            "latency_s": round(self.latency_s, 4),
+        }
+
+
+# Function to identify an API key without keeping the secret itself around
+def api_key_fingerprint(api_key):
+    if not api_key:
+        return "anonymous"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+# Function to roughly estimate the token count of a text (~4 characters per token)
+def estimate_tokens(text):
+    return max(1, len(text) // 4) if text else 0
+
+
+# Function to estimate the prompt tokens of a Gemini `contents` payload
+def estimate_contents_tokens(contents):
+    if isinstance(contents, str):
+        return estimate_tokens(contents)
+    total = 0
+    for item in contents or []:
+        if isinstance(item, str):
+            total += estimate_tokens(item)
+        elif isinstance(item, dict):
+            for part in item.get("parts", []):
+                if isinstance(part, dict):
+                    total += estimate_tokens(part.get("text", ""))
+                elif isinstance(part, str):
+                    total += estimate_tokens(part)
+    return total
+
+
+# Function to read the token counts reported in a Gemini response's usage metadata
+def read_usage_metadata(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", None) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+        "cached_tokens": getattr(usage, "cached_content_token_count", None) or 0,
+    }
+
+
+# Records per-request usage, aggregates it per session and per API key, and enforces token budgets
+class UsageTracker:
+    def __init__(self, session_budget=DEFAULT_SESSION_TOKEN_BUDGET, api_key_budget=DEFAULT_API_KEY_TOKEN_BUDGET, max_records=10000,
+                 max_sessions=MAX_TRACKED_SESSIONS):
+        self.session_budget = session_budget
+        self.api_key_budget = api_key_budget
+        self.max_records = max_records
+        self.max_sessions = max_sessions
+        self.records = []
+        # Session totals, least recently used first
+        self.sessions = OrderedDict()
+        self.api_keys = {}
+        # Tokens reserved by requests in flight, per session and per API key
+        self.reserved_sessions = {}
+        self.reserved_api_keys = {}
+        self._lock = threading.Lock()
+
+    def session_totals(self, session_id):
+        with self._lock:
+            return self.sessions.get(session_id, UsageTotals()).as_dict()
+
+    def api_key_totals(self, api_key):
+        with self._lock:
+            return self.api_keys.get(api_key_fingerprint(api_key), UsageTotals()).as_dict()
+
+    def remaining_session_tokens(self, session_id):
+        if not self.session_budget:
+            return None
+        with self._lock:
+            used = self._session_used(session_id)
+        return max(0, self.session_budget - used)
+
+    # Tokens spent plus tokens reserved by requests in flight (call with the lock held)
+    def _session_used(self, session_id):
+        return self.sessions.get(session_id, UsageTotals()).total_tokens + self.reserved_sessions.get(session_id, 0)
+
+    def _api_key_used(self, key_id):
+        return self.api_keys.get(key_id, UsageTotals()).total_tokens + self.reserved_api_keys.get(key_id, 0)
+
+    # Raise before the call if the estimated prompt would push the session or key over budget; otherwise
+    # reserve the estimate, so concurrent requests cannot all pass the check on the same remaining budget.
+    # Returns the BudgetReservation to pass to `record`/`record_generation`, or to `release` on failure.
+    def check_budget(self, session_id, api_key, estimated_tokens):
+        key_id = api_key_fingerprint(api_key)
+        with self._lock:
+            session_used = self._session_used(session_id)
+            if self.session_budget and session_used + estimated_tokens > self.session_budget:
+                raise TokenBudgetExceeded(
+                    f"This request needs about {estimated_tokens} tokens but the session has only "
+                    f"{max(0, self.session_budget - session_used)} of its {self.session_budget} token budget left."
+                )
+            if self.api_key_budget and self._api_key_used(key_id) + estimated_tokens > self.api_key_budget:
+                raise TokenBudgetExceeded(
+                    f"The token budget of {self.api_key_budget} for this API key has been exhausted."
+                )
+            self.reserved_sessions[session_id] = self.reserved_sessions.get(session_id, 0) + estimated_tokens
+            self.reserved_api_keys[key_id] = self.reserved_api_keys.get(key_id, 0) + estimated_tokens
+        return BudgetReservation(session_id, key_id, estimated_tokens)
+
+    # Function to give back a reservation (no-op once settled), e.g. when the request failed
+    def release(self, reservation):
+        if reservation is None:
+            return
+        with self._lock:
+            self._release(reservation)
+
+    def _release(self, reservation):
+        if reservation.settled:
+            return
+        reservation.settled = True
+        for reserved, key in ((self.reserved_sessions, reservation.session_id),
+                              (self.reserved_api_keys, reservation.api_key_id)):
+            left = reserved.get(key, 0) - reservation.tokens
+            if left > 0:
+                reserved[key] = left
+            else:
+                reserved.pop(key, None)
+
+    # Function to add a request's usage to the totals, settling its reservation in the same step
+    def record(self, record, reservation=None):
+        with self._lock:
+            self.records.append(record)
+            if len(self.records) > self.max_records:
+                del self.records[: len(self.records) - self.max_records]
+            self.sessions.setdefault(record.session_id, UsageTotals()).add(record)
+            self.sessions.move_to_end(record.session_id)
+            self.api_keys.setdefault(record.api_key_id, UsageTotals()).add(record)
+            if reservation is not None:
+                self._release(reservation)
+            self._forget_idle_sessions()
+        return record
+
+    # Drops the totals of the least recently used sessions beyond `max_sessions`, except those with a
+    # request in flight (call with the lock held). API key totals are kept: they hold the key budgets.
+    def _forget_idle_sessions(self):
+        excess = len(self.sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        for session_id in list(self.sessions):
+            if excess <= 0:
+                break
+            if session_id not in self.reserved_sessions:
+                del self.sessions[session_id]
+                excess -= 1
+
+    # Function to record a response that was produced outside of `generate_content` (e.g. a stream)
+    def record_response(self, session_id, api_key, model, response, latency_s, contents=None, output_text=None,
+                        reservation=None):
+        usage = read_usage_metadata(response)
+        if usage is None or not (usage["prompt_tokens"] or usage["output_tokens"]):
+            usage = {
+                "prompt_tokens": estimate_contents_tokens(contents),
+                "output_tokens": estimate_tokens(output_text or ""),
+                "cached_tokens": 0,
+            }
+            estimated = True
+        else:
+            estimated = False
+        return self.record(UsageRecord(
+            session_id=session_id,
+            api_key_id=api_key_fingerprint(api_key),
+            model=model,
+            latency_s=latency_s,
+            estimated=estimated,
+            **usage,
+        ), reservation)
+
+    # Wrapper around `client.models.generate_content` that checks budgets and records usage
+    def generate_content(self, client, session_id, api_key, model, contents, **kwargs):
+        reservation = self.check_budget(session_id, api_key, estimate_contents_tokens(contents))
+        try:
+            start = time.perf_counter()
+            response = client.models.generate_content(model=model, contents=contents, **kwargs)
+            self._record_generation(
+                session_id, api_key, model, contents, response, time.perf_counter() - start, reservation
+            )
+        finally:
+            self.release(reservation)
+        return response
+
+    # Async counterpart using `client.aio.models.generate_content`
+    async def agenerate_content(self, client, session_id, api_key, model, contents, **kwargs):
+        reservation = self.check_budget(session_id, api_key, estimate_contents_tokens(contents))
+        try:
+            start = time.perf_counter()
+            response = await client.aio.models.generate_content(model=model, contents=contents, **kwargs)
+            self._record_generation(
+                session_id, api_key, model, contents, response, time.perf_counter() - start, reservation
+            )
+        finally:
+            self.release(reservation)
+        return response
+
+    # Function to record a providers.Generation (answers served from the answer cache cost nothing), and
+    # the hedged duplicates that lost to it: they were billed too. Settles `reservation` either way.
+    def record_generation(self, session_id, api_key, generation, reservation=None):
+        if generation.from_cache:
+            self.release(reservation)
+            return None
+        for loser in getattr(generation, "hedge_losers", ()):
+            self.record(self._generation_record(session_id, api_key, loser))
+        return self.record(self._generation_record(session_id, api_key, generation), reservation)
+
+    def _generation_record(self, session_id, api_key, generation):
+        return UsageRecord(
+            session_id=session_id,
+            api_key_id=api_key_fingerprint(api_key),
+            model=f"{generation.provider}:{generation.model}",
+            prompt_tokens=generation.prompt_tokens,
+            output_tokens=generation.output_tokens,
+            cached_tokens=generation.cached_tokens,
+            latency_s=generation.latency_s,
+            estimated=generation.estimated,
+        )
+
+    # Wrapper around a provider or router (see providers.py) that checks budgets and records usage
+    def generate_routed(self, router, session_id, api_key, contents, config=None, **kwargs):
+        reservation = self.check_budget(session_id, api_key, estimate_contents_tokens(contents))
+        try:
+            generation = router.generate(contents, config, **kwargs)
+            self.record_generation(session_id, api_key, generation, reservation)
+        finally:
+            self.release(reservation)
+        return generation
+
+    async def agenerate_routed(self, router, session_id, api_key, contents, config=None, **kwargs):
+        reservation = self.check_budget(session_id, api_key, estimate_contents_tokens(contents))
+        try:
+            generation = await router.agenerate(contents, config, **kwargs)
+            self.record_generation(session_id, api_key, generation, reservation)
+        finally:
+            self.release(reservation)
+        return generation
+
+    def _record_generation(self, session_id, api_key, model, contents, response, latency, reservation=None):
+        output_text = None
+        if getattr(response, "candidates", None):
+            try:
+                output_text = response.candidates[0].content.parts[0].text
+            except (AttributeError, IndexError):
+                output_text = None
+        self.record_response(
+            session_id, api_key, model, response, latency, contents=contents, output_text=output_text,
+            reservation=reservation,
+        )